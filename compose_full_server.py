@@ -2,27 +2,42 @@
 from __future__ import annotations
 
 import base64
+import contextlib
+import functools
 import io
+import json
 import logging
+import math
+import os
+import threading
 import time
-from typing import Dict, List, Optional
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import soundfile as sf
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-
-from lyrics.lyric_planner import plan_lyrics
-from midi_backend.skytnt_runner import run_section
-from mixer.master import normalize_and_limit
-from render.sf2_renderer import render
-from vocals.melody_from_lyrics import melody_from_lyrics
+from starlette.background import BackgroundTask
+
+from lyrics.lyric_planner import lyric_planner_status, plan_lyrics
+from mixer.master import MasteringChain, normalize_and_limit
+from mixer.stems import mix_stems
+from mixer.timeline import Timeline
+from render.render_cache import get_render_cache
+from render.section_cache import SectionCache, section_key
+from render.stream_encoder import MEDIA_TYPES, StreamEncoder, negotiate
+from section_pipeline import INSTRUMENTS, VOCAL, SectionExecutor, SectionJob, default_workers
+from stage_graph import StageGraph
 
 LOGGER = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 APP_SAMPLE_RATE = 32000
+OPUS_SAMPLE_RATE = 48000
 
 
 class SectionSpec(BaseModel):
@@ -30,6 +45,13 @@ class SectionSpec(BaseModel):
     duration: float = Field(..., gt=0, description="Section duration in seconds")
 
 
+class StemLevel(BaseModel):
+    gain_db: float = 0.0
+    pan: Optional[float] = Field(
+        None, ge=-1.0, le=1.0, description="-1 left, 1 right; any pan makes the mix stereo"
+    )
+
+
 class ComposeRequest(BaseModel):
     base_style: str
     bpm: int = Field(..., gt=0)
@@ -38,11 +60,102 @@ class ComposeRequest(BaseModel):
     negative_prompt: Optional[str] = None
     seed: Optional[int] = None
     with_vocal: bool = True
+    mix: Dict[str, StemLevel] = Field(
+        default_factory=dict, description="Per-stem levels keyed by track name, e.g. 'lead_vocal'"
+    )
+    return_stems: bool = False
+    crossfade_ms: float = Field(0.0, ge=0, description="Equal-power crossfade between sections")
+    tail_ms: float = Field(
+        0.0, ge=0, description="Let each section ring out under the next (ignored with a crossfade)"
+    )
 
 
 app = FastAPI(title="MIDI NPU Full Song Composer", version="1.0.0")
 
 
+class ServerBusy(Exception):
+    """Raised when the admission queue is full."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Bound the number of compositions running and waiting at the same time.
+
+    Without a bound every concurrent request runs its own pipeline and they all
+    contend for the same cores. Requests beyond ``max_running + max_waiting`` are
+    rejected immediately so clients can back off instead of timing out.
+    """
+
+    def __init__(self, max_running: int, max_waiting: int) -> None:
+        self.max_running = max(1, max_running)
+        self.max_waiting = max(0, max_waiting)
+        self._slots = threading.BoundedSemaphore(self.max_running)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._avg_seconds = 5.0
+
+    def retry_after(self) -> int:
+        waiting = max(0, self._admitted - self.max_running)
+        return max(1, math.ceil(self._avg_seconds * (waiting + 1) / self.max_running))
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self._lock:
+            if self._admitted >= self.max_running + self.max_waiting:
+                raise ServerBusy(self.retry_after())
+            self._admitted += 1
+        start = time.perf_counter()
+        try:
+            with self._slots:
+                start = time.perf_counter()
+                yield
+        finally:
+            with self._lock:
+                self._admitted -= 1
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.perf_counter() - start)
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "admitted": self._admitted,
+            "max_running": self.max_running,
+            "max_waiting": self.max_waiting,
+        }
+
+
+SECTION_CACHE = SectionCache(
+    max_bytes=int(float(os.getenv("SECTION_CACHE_MB", "256")) * 1024 * 1024),
+    disk_dir=os.getenv("SECTION_CACHE_DIR") or None,
+    disk_max_bytes=int(float(os.getenv("SECTION_CACHE_DISK_MB", "2048")) * 1024 * 1024),
+)
+
+SECTIONS = SectionExecutor(default_workers())
+
+# Stage threads mostly wait on the lyric service or on ``SECTIONS`` workers.
+STAGES = ThreadPoolExecutor(
+    max_workers=int(os.getenv("COMPOSE_STAGE_THREADS", "16")), thread_name_prefix="stage"
+)
+
+_COMPOSE_META: "OrderedDict[str, Dict[str, object]]" = OrderedDict()
+_COMPOSE_META_LOCK = threading.Lock()
+_COMPOSE_META_KEEP = 256
+
+
+def _remember_meta(compose_id: str, meta: Dict[str, object]) -> None:
+    with _COMPOSE_META_LOCK:
+        _COMPOSE_META[compose_id] = meta
+        while len(_COMPOSE_META) > _COMPOSE_META_KEEP:
+            _COMPOSE_META.popitem(last=False)
+
+
+GATE = AdmissionGate(
+    max_running=int(os.getenv("COMPOSE_MAX_RUNNING", "2")),
+    max_waiting=int(os.getenv("COMPOSE_MAX_WAITING", "8")),
+)
+
+
 def _ensure_length(audio: np.ndarray, duration: float, sample_rate: int) -> np.ndarray:
     target_samples = int(round(duration * sample_rate))
     if audio.ndim == 1:
@@ -68,12 +181,32 @@ def root() -> Dict[str, str]:
     return {
         "message": "MIDI NPU composition service. Use /docs for OpenAPI schema.",
         "compose_endpoint": "/v1/audio/compose_full",
+        "stream_endpoint": "/v1/audio/compose_full/stream",
     }
 
 
 @app.get("/health")
-def health() -> Dict[str, str]:
-    return {"status": "ok"}
+def health() -> Dict[str, object]:
+    render_cache = get_render_cache()
+    return {
+        "status": "ok",
+        "admission": GATE.status(),
+        "section_cache": SECTION_CACHE.stats(),
+        "section_workers": SECTIONS.status(),
+        "render_cache": render_cache.stats() if render_cache is not None else None,
+        "lyric_planner": lyric_planner_status(),
+    }
+
+
+@app.on_event("startup")
+def _start_section_workers() -> None:
+    SECTIONS.start()
+
+
+@app.on_event("shutdown")
+def _shutdown_section_workers() -> None:
+    STAGES.shutdown(wait=False, cancel_futures=True)
+    SECTIONS.shutdown()
 
 
 @app.post("/v1/audio/compose_full")
@@ -82,82 +215,234 @@ def compose_full(request: ComposeRequest):
         return JSONResponse(status_code=400, content={"error": "sections cannot be empty"})
 
     try:
-        lyrics_map = plan_lyrics(
-            base_style=request.base_style,
-            key=request.key,
-            bpm=request.bpm,
-            sections=[section.dict() for section in request.sections],
-            negative=request.negative_prompt,
-            seed=request.seed,
+        with GATE.slot():
+            return _compose_full(request)
+    except ServerBusy as exc:
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
         )
-    except Exception as exc:  # pragma: no cover - safety net
-        LOGGER.exception("Lyric planning failed")
-        return JSONResponse(status_code=500, content={"error": str(exc)})
 
-    offsets = []
-    audio_sections: List[np.ndarray] = []
-    current_start = 0.0
 
+def _instrument_job(
+    request: ComposeRequest, index: int, sample_rate: int
+) -> Tuple[SectionJob, Optional[str]]:
+    """The instrumental part of section ``index`` and its cache key.
+
+    The instrumental and vocal parts are cached under separate keys, so toggling
+    ``with_vocal`` reuses the instrumental stems. Unseeded instrumentals bypass
+    the cache.
+    """
+
+    section = request.sections[index]
+    section_seed = request.seed + index if request.seed is not None else None
+    job = SectionJob(
+        part=INSTRUMENTS,
+        style=request.base_style,
+        key=request.key,
+        bpm=request.bpm,
+        tag=section.name,
+        seed=section_seed,
+        duration=section.duration,
+        lines=(),
+        sample_rate=sample_rate,
+    )
+    cache_key = None
+    if section_seed is not None:
+        cache_key = section_key(
+            part=INSTRUMENTS,
+            style=request.base_style,
+            key=request.key,
+            bpm=request.bpm,
+            tag=section.name,
+            seed=section_seed,
+            duration=section.duration,
+            sample_rate=sample_rate,
+        )
+    return job, cache_key
+
+
+def _vocal_job(
+    request: ComposeRequest, index: int, lines: List[str], sample_rate: int
+) -> Tuple[SectionJob, str]:
+    """The vocal part of section ``index``; vocal melodies do not depend on the seed."""
+
+    section = request.sections[index]
+    job = SectionJob(
+        part=VOCAL,
+        style=request.base_style,
+        key=request.key,
+        bpm=request.bpm,
+        tag=section.name,
+        seed=None,
+        duration=section.duration,
+        lines=tuple(lines),
+        sample_rate=sample_rate,
+    )
+    cache_key = section_key(
+        part=VOCAL,
+        key=request.key,
+        bpm=request.bpm,
+        duration=section.duration,
+        vocal=lines,
+        sample_rate=sample_rate,
+    )
+    return job, cache_key
+
+
+def _build_part(
+    graph: StageGraph, stage: str, job: SectionJob, cache_key: Optional[str]
+) -> Dict[str, np.ndarray]:
+    """Stems for one section part, from the section cache or built by ``SECTIONS``."""
+
+    cached = SECTION_CACHE.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        LOGGER.info("Section '%s' %s served from cache", job.tag, job.part)
+        return cached.stems
+
+    result = graph.track(SECTIONS.submit(job)).result()
+    graph.detail(stage, **result.timings)
+    LOGGER.info(
+        "Section '%s' %s built: %s",
+        job.tag,
+        job.part,
+        ", ".join(f"{name} {ms:.2f}" for name, ms in result.timings.items()),
+    )
+    if cache_key is None:
+        return result.stems
+    return SECTION_CACHE.put(cache_key, result.notes, result.stems).stems
+
+
+def _section_graph(
+    request: ComposeRequest,
+    sample_rate: int,
+    gains_db: Dict[str, float],
+    pans: Dict[str, float],
+    timeline: Timeline,
+) -> StageGraph:
+    """Per-section stages: ``lyrics -> vocal[i]``, ``instruments[i]``, both ``-> mix[i]``.
+
+    Only the vocal parts wait for the lyric service; every instrumental part
+    starts immediately, so LLM latency hides behind MIDI generation and
+    rendering. ``mix[i]`` places section ``i`` into ``timeline`` as soon as it
+    is mixed, so only one section's mix buffer is alive at a time, and returns
+    its raw stems.
+    """
+
+    graph = StageGraph()
+    # Neighbouring sections add into each other's slots (crossfades and tails).
+    placing = threading.Lock()
+    graph.add("lyrics", lambda: _plan_lyrics(request))
     for index, section in enumerate(request.sections):
-        LOGGER.info("Processing section '%s'", section.name)
-        section_start_time = time.perf_counter()
-        section_seed = request.seed + index if request.seed is not None else None
-        try:
-            section_midi = run_section(
-                style=request.base_style,
-                key=request.key,
-                bpm=request.bpm,
-                tag=section.name,
-                seed=section_seed,
-                duration=section.duration,
-            )
-        except Exception as exc:  # pragma: no cover - failure path
-            LOGGER.exception("MIDI generation failed for section '%s'", section.name)
-            return JSONResponse(status_code=500, content={"error": str(exc)})
+        parts = [f"instruments[{index}]"]
+        job, cache_key = _instrument_job(request, index, sample_rate)
+        graph.add(parts[0], functools.partial(_build_part, graph, parts[0], job, cache_key))
 
         if request.with_vocal:
-            lines = lyrics_map.get(section.name, [])
-            if lines:
-                try:
-                    vocal_midi = melody_from_lyrics(
-                        lines=lines,
-                        key=request.key,
-                        bpm=request.bpm,
-                        duration_seconds=section.duration,
-                    )
-                    section_midi.instruments.extend(vocal_midi.instruments)
-                except Exception as exc:  # pragma: no cover - melody failure
-                    LOGGER.exception("Vocal melody generation failed")
-                    return JSONResponse(status_code=500, content={"error": str(exc)})
+            parts.append(f"vocal[{index}]")
 
-        try:
-            section_audio = render(section_midi, sr=APP_SAMPLE_RATE)
-        except Exception as exc:
-            LOGGER.exception("Rendering failed for section '%s'", section.name)
-            return JSONResponse(status_code=500, content={"error": str(exc)})
+            def vocal(lyrics_map, index=index, stage=parts[-1]):
+                lines = lyrics_map.get(request.sections[index].name, [])
+                if not lines:
+                    return {}
+                job, cache_key = _vocal_job(request, index, lines, sample_rate)
+                return _build_part(graph, stage, job, cache_key)
 
-        section_audio = _ensure_length(section_audio, section.duration, APP_SAMPLE_RATE)
-        audio_sections.append(section_audio)
+            graph.add(parts[-1], vocal, deps=("lyrics",))
 
+        def mix(*part_stems, index=index):
+            stems: Dict[str, np.ndarray] = {}
+            for found in part_stems:
+                stems.update(found)
+            length = timeline.section_length(index)
+            mixed = mix_stems(stems, gains_db, pans, length=length, stereo=bool(pans))
+            with placing:
+                timeline.place(index, mixed)
+            return stems
+
+        graph.add(f"mix[{index}]", mix, deps=parts)
+    return graph
+
+
+def _iter_sections(graph: StageGraph, count: int) -> Iterator[int]:
+    """Yield each section index in request order once it is placed in the timeline.
+
+    Closing the iterator early cancels stages and jobs that have not started.
+    """
+
+    try:
+        for index in range(count):
+            graph.result(f"mix[{index}]")
+            yield index
+    finally:
+        graph.cancel()
+
+
+def _plan_lyrics(request: ComposeRequest) -> Dict[str, List[str]]:
+    return plan_lyrics(
+        base_style=request.base_style,
+        key=request.key,
+        bpm=request.bpm,
+        sections=[section.dict() for section in request.sections],
+        negative=request.negative_prompt,
+        seed=request.seed,
+    )
+
+
+def _offsets(request: ComposeRequest) -> List[Dict[str, object]]:
+    offsets = []
+    current_start = 0.0
+    for section in request.sections:
         section_end = current_start + section.duration
         offsets.append({"name": section.name, "start": current_start, "end": section_end})
         current_start = section_end
-        LOGGER.info(
-            "Section '%s' processed in %.2f ms",
-            section.name,
-            (time.perf_counter() - section_start_time) * 1000.0,
-        )
+    return offsets
+
+
+def _timeline(request: ComposeRequest, sample_rate: int, stereo: bool) -> Timeline:
+    return Timeline(
+        [int(round(section.duration * sample_rate)) for section in request.sections],
+        channels=2 if stereo else 1,
+        crossfade=int(round(request.crossfade_ms * sample_rate / 1000.0)),
+        tail=int(round(request.tail_ms * sample_rate / 1000.0)),
+    )
+
 
-    if not audio_sections:
-        return JSONResponse(status_code=500, content={"error": "no audio rendered"})
+def _mix_levels(request: ComposeRequest) -> Tuple[Dict[str, float], Dict[str, float]]:
+    gains_db = {name: level.gain_db for name, level in request.mix.items()}
+    pans = {name: level.pan for name, level in request.mix.items() if level.pan is not None}
+    return gains_db, pans
 
-    master_audio = np.concatenate(audio_sections, axis=0)
-    master_audio = normalize_and_limit(master_audio)
 
+def _wav_b64(audio: np.ndarray) -> str:
     with io.BytesIO() as buffer:
-        sf.write(buffer, master_audio, APP_SAMPLE_RATE, format="WAV")
-        wav_bytes = buffer.getvalue()
-    payload = base64.b64encode(wav_bytes).decode("ascii")
+        sf.write(buffer, audio, APP_SAMPLE_RATE, format="WAV")
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _compose_full(request: ComposeRequest):
+    gains_db, pans = _mix_levels(request)
+    timeline = _timeline(request, APP_SAMPLE_RATE, stereo=bool(pans))
+    graph = _section_graph(request, APP_SAMPLE_RATE, gains_db, pans, timeline)
+    mixes = [f"mix[{index}]" for index in range(len(request.sections))]
+
+    def master(*_stems):
+        return normalize_and_limit(timeline.buffer, inplace=True)
+
+    graph.add("master", master, deps=mixes)
+    graph.run(STAGES)
+    try:
+        master_audio = graph.result("master")
+        lyrics_map = graph.result("lyrics")
+    except Exception as exc:  # pragma: no cover - failure path, logged per stage
+        graph.cancel()
+        LOGGER.exception("Composition failed")
+        return JSONResponse(status_code=500, content={"error": str(exc)})
+    critical_path = graph.log_critical_path("master")
+
+    payload = _wav_b64(master_audio)
+    offsets = _offsets(request)
 
     response = {
         "format": "wav",
@@ -165,10 +450,127 @@ def compose_full(request: ComposeRequest):
         "b64": payload,
         "offsets": offsets,
         "lyrics": lyrics_map,
+        "critical_path": critical_path,
     }
+    if request.return_stems:
+        # Raw, unmixed stems at the synth's level so clients can remix them.
+        sections = [graph.result(name) for name in mixes]
+        names = sorted({name for stems in sections for name in stems})
+        response["stems"] = {
+            name: _wav_b64(
+                np.concatenate(
+                    [
+                        _ensure_length(
+                            stems.get(name, np.zeros(0, dtype=np.float32)),
+                            section.duration,
+                            APP_SAMPLE_RATE,
+                        )
+                        for section, stems in zip(request.sections, sections)
+                    ]
+                )
+            )
+            for name in names
+        }
     return response
 
 
+@app.get("/v1/audio/compose_full/{compose_id}/meta")
+def compose_meta(compose_id: str):
+    with _COMPOSE_META_LOCK:
+        meta = _COMPOSE_META.get(compose_id)
+    if meta is None:
+        return JSONResponse(status_code=404, content={"error": "unknown or expired compose id"})
+    return meta
+
+
+@app.post("/v1/audio/compose_full/stream")
+def compose_full_stream(request: ComposeRequest, accept: Optional[str] = Header(None)):
+    """Stream the mastered song as binary audio while later sections are still rendering.
+
+    The format is negotiated from ``Accept`` (``audio/wav``, ``audio/flac`` or
+    ``audio/ogg`` for Opus at 48 kHz). Offsets travel in the ``X-Offsets`` header;
+    lyrics and offsets are also available from the ``Link``-ed metadata endpoint.
+    """
+
+    if not request.sections:
+        return JSONResponse(status_code=400, content={"error": "sections cannot be empty"})
+    fmt = negotiate(accept)
+    if fmt is None:
+        return JSONResponse(
+            status_code=406, content={"error": f"supported types: {', '.join(MEDIA_TYPES.values())}"}
+        )
+
+    slot = contextlib.ExitStack()
+    try:
+        slot.enter_context(GATE.slot())
+    except ServerBusy as exc:
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    sample_rate = OPUS_SAMPLE_RATE if fmt == "opus" else APP_SAMPLE_RATE
+    gains_db, pans = _mix_levels(request)
+    offsets = _offsets(request)
+    compose_id = uuid.uuid4().hex
+    meta: Dict[str, object] = {
+        "format": fmt,
+        "sample_rate": sample_rate,
+        "offsets": offsets,
+        "lyrics": None,
+    }
+    _remember_meta(compose_id, meta)
+
+    def body() -> Iterator[bytes]:
+        with slot:
+            start = time.perf_counter()
+            timeline = _timeline(request, sample_rate, stereo=bool(pans))
+            encoder = StreamEncoder(fmt, sample_rate, timeline.channels, frames=timeline.total)
+            chain = MasteringChain(sample_rate)
+            graph = _section_graph(request, sample_rate, gains_db, pans, timeline)
+
+            def remember_lyrics(done) -> None:
+                if done.exception() is None:
+                    meta["lyrics"] = done.result()
+
+            graph.future("lyrics").add_done_callback(remember_lyrics)
+            graph.run(STAGES)
+            try:
+                sections = _iter_sections(graph, len(request.sections))
+                for index, section in zip(sections, request.sections):
+                    # The slot is final: this section and the previous one's overhang are in it.
+                    yield encoder.write(chain.process(timeline.slot(index)))
+                    LOGGER.info(
+                        "Section '%s' streamed after %.2f ms",
+                        section.name,
+                        (time.perf_counter() - start) * 1000.0,
+                    )
+                yield encoder.write(chain.process(timeline.tail_region()))
+                yield encoder.write(chain.flush())
+                yield encoder.close()
+                LOGGER.info("Streamed master stats: %s", chain.stats())
+                meta["critical_path"] = graph.log_critical_path()
+            except Exception:  # pragma: no cover - headers are already sent
+                LOGGER.exception("Streaming composition failed; truncating response")
+            finally:
+                graph.cancel()
+
+    headers = {
+        "X-Compose-Id": compose_id,
+        "X-Sample-Rate": str(sample_rate),
+        "X-Offsets": json.dumps(offsets, separators=(",", ":")),
+        "Link": f'</v1/audio/compose_full/{compose_id}/meta>; rel="describedby"',
+    }
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers=headers,
+        # Releases the admission slot even if the client leaves before the body starts.
+        background=BackgroundTask(slot.close),
+    )
+
+
 if __name__ == "__main__":  # pragma: no cover
     import uvicorn
 
@@ -1,16 +1,28 @@
 """Lyric planning utilities for the section-based pipeline."""
 from __future__ import annotations
 
+import asyncio
+import atexit
+import hashlib
 import json
 import logging
 import os
 import random
-from typing import Dict, List, Optional
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
-import requests
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
 
 LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 PROMPT_TEMPLATE = (
     "You are an experienced songwriter. Compose concise lyrics for a section of a "
     "song. Style cues: {style}. Musical key: {key}. Tempo: {bpm} BPM. The section "
@@ -18,31 +30,28 @@ PROMPT_TEMPLATE = (
     "lines with natural phrasing."
 )
 
+BATCH_PROMPT_TEMPLATE = (
+    "You are an experienced songwriter. Compose concise lyrics for every section of "
+    "one song. Style cues: {style}. Musical key: {key}. Tempo: {bpm} BPM. Avoid the "
+    "following topics: {negative}. The section tags, in order, are: {tags}. Generate "
+    "at most {lines} lines with natural phrasing per section. Reply with only a JSON "
+    "object mapping each section tag to a list of lines."
+)
 
-def _post_lyrics(prompt: str) -> Optional[List[str]]:
-    endpoint = os.getenv("LYRIC_LLM_ENDPOINT") or os.getenv("NPU_LLM_ENDPOINT")
-    if not endpoint:
-        return None
 
-    try:
-        response = requests.post(endpoint, json={"prompt": prompt}, timeout=30)
-        response.raise_for_status()
-    except Exception as exc:  # pragma: no cover - network failure path
-        LOGGER.error("Lyric LLM request failed: %s", exc)
+def _endpoint() -> Optional[str]:
+    endpoint = os.getenv("LYRIC_LLM_ENDPOINT") or os.getenv("NPU_LLM_ENDPOINT")
+    if endpoint and httpx is None:
+        LOGGER.error("httpx is not installed; ignoring lyric endpoint %s", endpoint)
         return None
+    return endpoint
 
-    try:
-        data = response.json()
-    except json.JSONDecodeError:  # pragma: no cover - unexpected response
-        LOGGER.error("Lyric LLM returned non-JSON payload")
-        return None
 
+def _parse_lyrics(data: object) -> Optional[List[str]]:
     if isinstance(data, dict):
-        content = data.get("text") or data.get("lyrics") or data.get("content")
-        if isinstance(content, list):
-            return [str(line).strip() for line in content if str(line).strip()]
-        if isinstance(content, str):
-            return [line.strip() for line in content.splitlines() if line.strip()]
+        lines = _split_lines(data.get("text") or data.get("lyrics") or data.get("content"))
+        if lines is not None:
+            return lines
     elif isinstance(data, list):  # pragma: no cover - alternative response
         return [str(item).strip() for item in data if str(item).strip()]
 
@@ -50,6 +59,408 @@ def _post_lyrics(prompt: str) -> Optional[List[str]]:
     return None
 
 
+def _split_lines(content: object) -> Optional[List[str]]:
+    if isinstance(content, list):
+        return [str(line).strip() for line in content if str(line).strip()]
+    if isinstance(content, str):
+        return [line.strip() for line in content.splitlines() if line.strip()]
+    return None
+
+
+def _parse_batch(data: object, tags: Sequence[str]) -> Optional[Dict[str, List[str]]]:
+    """Per-tag lines from a batched reply; tags the reply does not cover are left out.
+
+    The mapping may be the payload itself, nested under ``text``/``lyrics``/
+    ``content``/``sections``, or a JSON object embedded in a text reply.
+    """
+
+    if isinstance(data, dict) and not any(tag in data for tag in tags):
+        for field in ("text", "lyrics", "content", "sections"):
+            if data.get(field):
+                data = data[field]
+                break
+    if isinstance(data, str):
+        start, end = data.find("{"), data.rfind("}")
+        try:
+            data = json.loads(data[start : end + 1]) if 0 <= start < end else None
+        except json.JSONDecodeError:
+            data = None
+    if not isinstance(data, dict):
+        LOGGER.error("Batched lyric reply is not a section mapping")
+        return None
+
+    by_name = {str(name).strip().lower(): value for name, value in data.items()}
+    parsed: Dict[str, List[str]] = {}
+    for tag in tags:
+        lines = _split_lines(by_name.get(tag.lower()))
+        if lines:
+            parsed[tag] = lines
+    return parsed
+
+
+class LyricCache:
+    """Prompt-hash keyed lyric results with a TTL, optionally persisted as JSON.
+
+    Keys hash the endpoint together with the prompt, so switching services
+    never serves another model's lyrics. At most ``max_entries`` results are
+    kept, least recently used first out; with ``path`` the cache is loaded at
+    start and rewritten atomically at most every ``save_delay`` seconds, on a
+    timer thread so callers (the planner's event loop) never wait on the disk.
+    :meth:`flush` writes pending entries at once and runs at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 1024,
+        path: Optional[str] = None,
+        save_delay: float = 5.0,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self.path = path
+        self.save_delay = save_delay
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def key(endpoint: str, prompt: str) -> str:
+        return hashlib.sha256(f"{endpoint}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, endpoint: str, prompt: str) -> Optional[List[str]]:
+        key = self.key(endpoint, prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, endpoint: str, prompt: str, lines: List[str]) -> None:
+        with self._lock:
+            self._entries[self.key(endpoint, prompt)] = (time.time() + self.ttl, list(lines))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if not self.path:
+                return
+            self._dirty = True
+            if self._timer is not None:
+                return
+            timer = self._timer = threading.Timer(self.save_delay, self.flush)
+            timer.daemon = True
+        timer.start()
+
+    def flush(self) -> None:
+        """Write the entries to ``path`` now if any changed since the last save."""
+
+        with self._save_lock:
+            with self._lock:
+                timer, self._timer = self._timer, None
+                if not self._dirty:
+                    snapshot = None
+                else:
+                    snapshot = dict(self._entries)
+                    self._dirty = False
+            if timer is not None:
+                timer.cancel()
+            if snapshot is not None:
+                self._save(snapshot)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable lyric cache %s: %s", self.path, exc)
+            return
+        now = time.time()
+        live = sorted(
+            (float(expires), key, lines)
+            for key, (expires, lines) in entries.items()
+            if float(expires) > now
+        )
+        for expires, key, lines in live[-self.max_entries :]:
+            self._entries[key] = (expires, lines)
+
+    def _save(self, entries: Dict[str, Tuple[float, List[str]]]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(entries, handle, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:  # pragma: no cover - disk full / permissions
+            LOGGER.warning("Failed to persist lyric cache: %s", exc)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _post_lyrics(prompt: str) -> Optional[List[str]]:
+    """Send one prompt synchronously over the planner's pooled connection."""
+
+    endpoint = _endpoint()
+    if not endpoint:
+        return None
+    return get_lyric_planner().lyrics(endpoint, [""], [prompt])[0]
+
+
+class LyricPlanner:
+    """Pooled keep-alive client issuing lyric prompts concurrently.
+
+    An ``httpx.AsyncClient`` lives on a private event loop thread, so its
+    connections are reused across requests whether callers are synchronous
+    (server worker threads) or asynchronous. At most ``concurrency`` prompts are
+    in flight; each is retried up to ``retries`` times with exponential backoff
+    on transport errors, 429 and 5xx responses. Successful results are kept in
+    ``cache`` when one is given.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        retries: int = 2,
+        backoff: float = 0.25,
+        timeout: float = 30.0,
+        deadline: float = 45.0,
+        cache: Optional[LyricCache] = None,
+    ) -> None:
+        if httpx is None:
+            raise RuntimeError("httpx is required for the lyric planner")
+        self.concurrency = max(1, int(concurrency))
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.timeout = timeout
+        self.deadline = deadline
+        self.cache = cache
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="lyric-planner", daemon=True)
+        self._thread.start()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client = self._call(self._make_client())
+
+    async def _make_client(self) -> "httpx.AsyncClient":
+        # Created on the planner loop so both are bound to it.
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+            ),
+        )
+
+    def _call(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def _post(
+        self,
+        endpoint: str,
+        prompt: str,
+        parse: Callable[[object], Optional[T]] = _parse_lyrics,
+    ) -> Optional[T]:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1.0 + random.random()))
+            async with self._semaphore:
+                try:
+                    response = await self._client.post(endpoint, json={"prompt": prompt})
+                except httpx.HTTPError as exc:
+                    LOGGER.warning("Lyric LLM request failed (attempt %d): %s", attempt + 1, exc)
+                    continue
+            if response.status_code == 429 or response.status_code >= 500:
+                LOGGER.warning(
+                    "Lyric LLM returned %d (attempt %d)", response.status_code, attempt + 1
+                )
+                continue
+            if response.is_error:
+                LOGGER.error("Lyric LLM rejected the prompt with %d", response.status_code)
+                return None
+            try:
+                return parse(response.json())
+            except json.JSONDecodeError:  # pragma: no cover - unexpected response
+                LOGGER.error("Lyric LLM returned non-JSON payload")
+                return None
+        return None
+
+    async def _lyrics(
+        self,
+        endpoint: str,
+        tags: Sequence[str],
+        prompts: Sequence[str],
+        batch_prompt: Optional[Callable[[List[str]], str]],
+    ) -> List[Optional[List[str]]]:
+        results: List[Optional[List[str]]] = [
+            self.cache.get(endpoint, prompt) if self.cache is not None else None
+            for prompt in prompts
+        ]
+        if all(results):
+            return results
+        task = asyncio.ensure_future(self._fill(endpoint, tags, prompts, batch_prompt, results))
+        done, _ = await asyncio.wait([task], timeout=self.deadline)
+        if not done:
+            task.cancel()
+            LOGGER.warning(
+                "Lyric deadline of %.1f s hit with %d sections pending",
+                self.deadline,
+                sum(1 for lines in results if not lines),
+            )
+        elif task.exception() is not None:  # pragma: no cover - safety net
+            LOGGER.error("Lyric requests failed: %s", task.exception())
+        return results
+
+    async def _fill(
+        self,
+        endpoint: str,
+        tags: Sequence[str],
+        prompts: Sequence[str],
+        batch_prompt: Optional[Callable[[List[str]], str]],
+        results: List[Optional[List[str]]],
+    ) -> None:
+        """Request every section missing from ``results`` and write the answers into it."""
+
+        def store(prompt: str, lines: List[str]) -> None:
+            for index, other in enumerate(prompts):
+                if other == prompt:
+                    results[index] = lines
+            if self.cache is not None:
+                self.cache.put(endpoint, prompt, lines)
+
+        missing = list(dict.fromkeys(prompts[i] for i, lines in enumerate(results) if not lines))
+        if batch_prompt is not None and len(missing) > 1:
+            wanted = list(dict.fromkeys(tags[i] for i, lines in enumerate(results) if not lines))
+            answer = await self._post(
+                endpoint, batch_prompt(wanted), parse=lambda data: _parse_batch(data, wanted)
+            )
+            for index, tag in enumerate(tags):
+                if not results[index] and answer and answer.get(tag):
+                    store(prompts[index], answer[tag])
+            missing = [prompt for prompt in missing if not results[prompts.index(prompt)]]
+            if missing:
+                LOGGER.warning("Batched lyric reply missed %d sections", len(missing))
+
+        async def one(prompt: str) -> None:
+            lines = await self._post(endpoint, prompt)
+            if lines:
+                store(prompt, lines)
+
+        await asyncio.gather(*(one(prompt) for prompt in missing))
+
+    def lyrics(
+        self,
+        endpoint: str,
+        tags: Sequence[str],
+        prompts: Sequence[str],
+        batch_prompt: Optional[Callable[[List[str]], str]] = None,
+    ) -> List[Optional[List[str]]]:
+        """Lyrics for each ``(tag, prompt)``; failed or timed-out sections yield ``None``.
+
+        Cached prompts are answered locally. With ``batch_prompt`` the remaining
+        sections are first requested in one round trip (``batch_prompt`` builds
+        the prompt from their tags); any the reply misses are then requested
+        one by one, concurrently.
+        """
+
+        return self._call(self._lyrics(endpoint, tags, prompts, batch_prompt))
+
+    async def lyrics_async(
+        self,
+        endpoint: str,
+        tags: Sequence[str],
+        prompts: Sequence[str],
+        batch_prompt: Optional[Callable[[List[str]], str]] = None,
+    ) -> List[Optional[List[str]]]:
+        """:meth:`lyrics` for callers running on their own event loop."""
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._lyrics(endpoint, tags, prompts, batch_prompt), self._loop
+        )
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.flush()
+        self._call(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _cache_from_env() -> Optional[LyricCache]:
+    ttl = float(os.getenv("LYRIC_CACHE_TTL", "86400"))
+    if ttl <= 0:
+        return None
+    return LyricCache(
+        ttl,
+        max_entries=int(os.getenv("LYRIC_CACHE_SIZE", "1024")),
+        path=os.getenv("LYRIC_CACHE_PATH") or None,
+    )
+
+
+_PLANNER: Optional[LyricPlanner] = None
+_PLANNER_LOCK = threading.Lock()
+
+
+def get_lyric_planner() -> LyricPlanner:
+    """The process-wide planner.
+
+    ``LYRIC_LLM_CONCURRENCY`` (default 4), ``LYRIC_LLM_RETRIES`` (default 2),
+    ``LYRIC_LLM_TIMEOUT`` seconds per attempt (default 30) and
+    ``LYRIC_LLM_DEADLINE`` seconds for a whole song (default 45) configure it.
+    Results are cached for ``LYRIC_CACHE_TTL`` seconds (default 86400, 0
+    disables), at most ``LYRIC_CACHE_SIZE`` prompts (default 1024), and saved
+    to ``LYRIC_CACHE_PATH`` when set.
+    """
+
+    global _PLANNER
+    with _PLANNER_LOCK:
+        if _PLANNER is None:
+            _PLANNER = LyricPlanner(
+                concurrency=int(os.getenv("LYRIC_LLM_CONCURRENCY", "4")),
+                retries=int(os.getenv("LYRIC_LLM_RETRIES", "2")),
+                timeout=float(os.getenv("LYRIC_LLM_TIMEOUT", "30")),
+                deadline=float(os.getenv("LYRIC_LLM_DEADLINE", "45")),
+                cache=_cache_from_env(),
+            )
+        return _PLANNER
+
+
+def lyric_planner_status() -> Optional[Dict[str, object]]:
+    """Planner settings and cache statistics, ``None`` until the first request."""
+
+    planner = _PLANNER
+    if planner is None:
+        return None
+    return {
+        "concurrency": planner.concurrency,
+        "retries": planner.retries,
+        "deadline": planner.deadline,
+        "cache": planner.cache.stats() if planner.cache is not None else None,
+    }
+
+
 def _fallback_lyrics(
     base_style: str,
     key: str,
@@ -83,6 +494,72 @@ def _fallback_lyrics(
     return results
 
 
+def _section_prompts(
+    base_style: str, key: str, bpm: int, sections: List[Dict[str, object]], negative: Optional[str]
+) -> List[Tuple[str, str]]:
+    negative_text = negative or "(none)"
+    prompts = []
+    for section in sections:
+        tag = str(section.get("name", "section"))
+        prompt = PROMPT_TEMPLATE.format(
+            style=base_style,
+            key=key,
+            bpm=bpm,
+            tag=tag,
+            negative=negative_text,
+            lines=4,
+        )
+        prompts.append((tag, prompt))
+    return prompts
+
+
+def _merge_lyrics(
+    base_style: str,
+    key: str,
+    bpm: int,
+    sections: List[Dict[str, object]],
+    seed: Optional[int],
+    tags: List[str],
+    responses: Sequence[Optional[List[str]]],
+) -> Dict[str, List[str]]:
+    """Keep the generated sections; only failed ones use the rule-based lyrics."""
+
+    results: Dict[str, List[str]] = {}
+    fallback: Optional[Dict[str, List[str]]] = None
+    for tag, lines in zip(tags, responses):
+        if lines:
+            results[tag] = lines[:4]
+            continue
+        LOGGER.warning("Falling back to rule-based lyrics for section '%s'", tag)
+        if fallback is None:
+            # Built for every section at once so each section's lines stay deterministic.
+            fallback = _fallback_lyrics(base_style, key, bpm, sections, seed)
+        results[tag] = fallback[tag]
+    return results
+
+
+def _batch_prompt(
+    base_style: str, key: str, bpm: int, negative: Optional[str]
+) -> Callable[[List[str]], str]:
+    def build(tags: List[str]) -> str:
+        return BATCH_PROMPT_TEMPLATE.format(
+            style=base_style,
+            key=key,
+            bpm=bpm,
+            negative=negative or "(none)",
+            tags=", ".join(f"'{tag}'" for tag in tags),
+            lines=4,
+        )
+
+    return build
+
+
+def _batched(batch: Optional[bool]) -> bool:
+    if batch is None:
+        return os.getenv("LYRIC_LLM_BATCH", "0").lower() in ("1", "true", "yes")
+    return batch
+
+
 def plan_lyrics(
     base_style: str,
     key: str,
@@ -90,38 +567,54 @@ def plan_lyrics(
     sections: List[Dict[str, object]],
     negative: Optional[str] = None,
     seed: Optional[int] = None,
+    batch: Optional[bool] = None,
 ) -> Dict[str, List[str]]:
     """Generate lyrics per section.
 
     The function first attempts to reach an external LLM endpoint defined by
-    ``LYRIC_LLM_ENDPOINT`` or ``NPU_LLM_ENDPOINT``. When the service is unavailable a
-    deterministic, seedable fallback keeps the pipeline operational.
+    ``LYRIC_LLM_ENDPOINT`` or ``NPU_LLM_ENDPOINT``; all sections are requested
+    concurrently through :func:`get_lyric_planner`, or in one batched prompt
+    when ``batch`` (default: ``LYRIC_LLM_BATCH``) is set. Sections whose request
+    fails or misses the deadline get a deterministic, seedable fallback, which
+    also covers every section when the service is not configured.
     """
 
-    negative_text = negative or "(none)"
-    results: Dict[str, List[str]] = {}
+    prompts = _section_prompts(base_style, key, bpm, sections, negative)
+    tags = [tag for tag, _ in prompts]
+    endpoint = _endpoint()
+    if not endpoint:
+        return _fallback_lyrics(base_style, key, bpm, sections, seed)
+    LOGGER.info("Requesting lyrics for %d sections", len(prompts))
+    responses = get_lyric_planner().lyrics(
+        endpoint,
+        tags,
+        [prompt for _, prompt in prompts],
+        _batch_prompt(base_style, key, bpm, negative) if _batched(batch) else None,
+    )
+    return _merge_lyrics(base_style, key, bpm, sections, seed, tags, responses)
 
-    for section in sections:
-        tag = str(section.get("name", "section"))
-        prompt = PROMPT_TEMPLATE.format(
-            style=base_style,
-            key=key,
-            bpm=bpm,
-            tag=tag,
-            negative=negative_text,
-            lines=4,
-        )
-        LOGGER.info("Requesting lyrics for section '%s'", tag)
-        lines = _post_lyrics(prompt)
-        if not lines:
-            LOGGER.warning("Falling back to rule-based lyrics for section '%s'", tag)
-            # We postpone fallback generation until later to keep deterministic output.
-            results = _fallback_lyrics(base_style, key, bpm, sections, seed)
-            break
-        results[tag] = lines[:4]
-
-    if not results:
-        results = _fallback_lyrics(base_style, key, bpm, sections, seed)
 
-    return results
+async def plan_lyrics_async(
+    base_style: str,
+    key: str,
+    bpm: int,
+    sections: List[Dict[str, object]],
+    negative: Optional[str] = None,
+    seed: Optional[int] = None,
+    batch: Optional[bool] = None,
+) -> Dict[str, List[str]]:
+    """:func:`plan_lyrics` for async callers; does not block their event loop."""
 
+    prompts = _section_prompts(base_style, key, bpm, sections, negative)
+    tags = [tag for tag, _ in prompts]
+    endpoint = _endpoint()
+    if not endpoint:
+        return _fallback_lyrics(base_style, key, bpm, sections, seed)
+    LOGGER.info("Requesting lyrics for %d sections", len(prompts))
+    responses = await get_lyric_planner().lyrics_async(
+        endpoint,
+        tags,
+        [prompt for _, prompt in prompts],
+        _batch_prompt(base_style, key, bpm, negative) if _batched(batch) else None,
+    )
+    return _merge_lyrics(base_style, key, bpm, sections, seed, tags, responses)
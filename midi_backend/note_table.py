@@ -0,0 +1,122 @@
+"""Compact array-backed note storage used while generating sections."""
+from __future__ import annotations
+
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pretty_midi
+
+NOTE_DTYPE = np.dtype(
+    [
+        ("pitch", np.uint8),
+        ("velocity", np.uint8),
+        ("start", np.float64),
+        ("end", np.float64),
+        ("track", np.uint8),
+    ]
+)
+
+
+def make_notes(pitch, velocity, start, end, track: int) -> np.ndarray:
+    """Build a structured note array from broadcastable field values."""
+
+    start = np.asarray(start, dtype=np.float64)
+    pitch, velocity, start, end = np.broadcast_arrays(pitch, velocity, start, end)
+    notes = np.empty(start.size, dtype=NOTE_DTYPE)
+    notes["pitch"] = pitch.ravel()
+    notes["velocity"] = velocity.ravel()
+    notes["start"] = start.ravel()
+    notes["end"] = end.ravel()
+    notes["track"] = track
+    return notes
+
+
+def tile_bars(pattern: np.ndarray, bars: int, bar_seconds: float) -> np.ndarray:
+    """Repeat a one-bar pattern ``bars`` times, shifting each copy by one bar.
+
+    Notes keep their in-bar order, so the result matches appending the pattern
+    bar after bar.
+    """
+
+    if bars <= 0 or pattern.size == 0:
+        return pattern[:0].copy()
+    tiled = np.tile(pattern, bars)
+    shift = np.repeat(np.arange(bars, dtype=np.float64) * bar_seconds, pattern.size)
+    tiled["start"] += shift
+    tiled["end"] += shift
+    return tiled
+
+
+class NoteTable:
+    """Notes for several tracks stored in a single structured NumPy array.
+
+    Generating thousands of ``pretty_midi.Note`` objects dominates section
+    generation time, so notes are kept as rows of ``NOTE_DTYPE`` and only turned
+    into a ``PrettyMIDI`` object by :meth:`to_pretty_midi` at the rendering
+    boundary.
+    """
+
+    def __init__(self, tempo: float, key_number: Optional[int] = None) -> None:
+        self.tempo = float(tempo)
+        self.key_number = key_number
+        self.tracks: List[Tuple[str, int, bool]] = []
+        self._chunks: List[np.ndarray] = []
+        self._notes: Optional[np.ndarray] = None
+
+    def add_track(self, name: str, program: int, is_drum: bool = False) -> int:
+        self.tracks.append((name, program, is_drum))
+        return len(self.tracks) - 1
+
+    def add(self, notes: np.ndarray) -> None:
+        if notes.size:
+            self._chunks.append(notes)
+            self._notes = None
+
+    def add_instruments(self, instruments: Iterable[pretty_midi.Instrument]) -> None:
+        """Append notes from existing ``pretty_midi`` instruments (e.g. vocals)."""
+
+        for instrument in instruments:
+            index = self.add_track(instrument.name, instrument.program, instrument.is_drum)
+            self.add(
+                make_notes(
+                    [n.pitch for n in instrument.notes],
+                    [n.velocity for n in instrument.notes],
+                    [n.start for n in instrument.notes],
+                    [n.end for n in instrument.notes],
+                    index,
+                )
+            )
+
+    @property
+    def notes(self) -> np.ndarray:
+        if self._notes is None:
+            self._notes = (
+                np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=NOTE_DTYPE)
+            )
+            self._chunks = [self._notes] if self._notes.size else []
+        return self._notes
+
+    def end_time(self) -> float:
+        notes = self.notes
+        return float(notes["end"].max()) if notes.size else 0.0
+
+    def to_pretty_midi(self) -> pretty_midi.PrettyMIDI:
+        midi = pretty_midi.PrettyMIDI(initial_tempo=self.tempo)
+        notes = self.notes
+        for index, (name, program, is_drum) in enumerate(self.tracks):
+            instrument = pretty_midi.Instrument(program=program, is_drum=is_drum, name=name)
+            rows = notes[notes["track"] == index]
+            instrument.notes = [
+                pretty_midi.Note(velocity=v, pitch=p, start=s, end=e)
+                for p, v, s, e in zip(
+                    rows["pitch"].tolist(),
+                    rows["velocity"].tolist(),
+                    rows["start"].tolist(),
+                    rows["end"].tolist(),
+                )
+            ]
+            midi.instruments.append(instrument)
+        midi.time_signature_changes.append(pretty_midi.TimeSignature(4, 4, 0.0))
+        if self.key_number is not None:
+            midi.key_signature_changes.append(pretty_midi.KeySignature(self.key_number, 0.0))
+        return midi
@@ -14,7 +14,14 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     torch = None
 
-from music_theory import build_scale, clamp_midi_range, cycle_scale, parse_key
+from midi_backend.note_table import NoteTable, make_notes, tile_bars
+from music_theory import (
+    build_scale,
+    clamp_midi_array,
+    clamp_midi_range,
+    cycle_scale,
+    parse_key,
+)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -57,7 +64,7 @@ class SkytntRunner:
             return None
 
     # pylint: disable=too-many-locals
-    def run_section(
+    def run_section_notes(
         self,
         style: str,
         key: str,
@@ -65,17 +72,20 @@ class SkytntRunner:
         tag: str,
         seed: Optional[int] = None,
         duration: Optional[float] = None,
-    ) -> pretty_midi.PrettyMIDI:
-        """Generate a multi-track MIDI section.
+        rng: Optional[random.Random] = None,
+    ) -> NoteTable:
+        """Generate a multi-track section as an array-backed :class:`NoteTable`.
 
-        Parameters match the external API. ``duration`` is optional – if omitted the
-        resulting MIDI defaults to four bars. When supplied we quantise the duration to
-        full bars in 4/4.
+        Each track is built as a one-bar pattern and tiled across all bars in a
+        single vectorised step; only the lead needs per-bar randomness.
+
+        Randomness comes from ``rng`` (or a fresh ``random.Random(seed)``) rather than
+        the global generators, so concurrent calls in threads or worker processes
+        cannot disturb each other's sequences.
         """
 
-        if seed is not None:
-            random.seed(seed)
-            np.random.seed(seed)
+        if rng is None:
+            rng = random.Random(seed)
 
         start_time = time.perf_counter()
 
@@ -87,13 +97,15 @@ class SkytntRunner:
         else:
             bars = max(1, int(round(duration / bar_seconds)))
 
-        midi = pretty_midi.PrettyMIDI(initial_tempo=bpm)
         section_tag = tag.lower() if tag else "section"
-
-        drums = pretty_midi.Instrument(program=0, is_drum=True, name="drums")
-        bass = pretty_midi.Instrument(program=33, name="bass")
-        chords = pretty_midi.Instrument(program=0, name="chords")
-        lead = pretty_midi.Instrument(program=81, name="lead")
+        key_number = (tonic % 12)
+        if mode == "minor":
+            key_number += 12
+        table = NoteTable(tempo=bpm, key_number=key_number)
+        drums = table.add_track("drums", 0, is_drum=True)
+        bass = table.add_track("bass", 33)
+        chords = table.add_track("chords", 0)
+        lead = table.add_track("lead", 81)
 
         LOGGER.debug(
             "Generating section '%s' with %d bars (style=%s, key=%s, bpm=%s)",
@@ -109,93 +121,79 @@ class SkytntRunner:
         kick_velocity = 100
         snare_velocity = 90
 
-        for bar in range(bars):
-            bar_start = bar * bar_seconds
-            # Drums: kick on 1 and 3, snare on 2 and 4, hihat eighths
-            for beat in range(4):
-                beat_time = bar_start + beat * seconds_per_beat
-                if beat % 2 == 0:
-                    drums.notes.append(
-                        pretty_midi.Note(
-                            velocity=kick_velocity, pitch=36, start=beat_time, end=beat_time + 0.2
-                        )
-                    )
-                else:
-                    drums.notes.append(
-                        pretty_midi.Note(
-                            velocity=snare_velocity,
-                            pitch=38,
-                            start=beat_time,
-                            end=beat_time + 0.2,
-                        )
-                    )
-                for eighth in (0.0, 0.5):
-                    hat_time = beat_time + eighth * seconds_per_beat
-                    drums.notes.append(
-                        pretty_midi.Note(
-                            velocity=hat_velocity,
-                            pitch=42,
-                            start=hat_time,
-                            end=hat_time + 0.1,
-                        )
-                    )
-
-            # Bass: root + fifth pattern
-            root_pitch = clamp_midi_range(scale[0] - 24, 36, 60)
-            fifth_pitch = clamp_midi_range(scale[4 % len(scale)] - 24, 36, 60)
-            bass_pattern = [root_pitch, root_pitch, fifth_pitch, root_pitch]
-            for beat, pitch in enumerate(bass_pattern):
-                start = bar_start + beat * seconds_per_beat
-                bass.notes.append(
-                    pretty_midi.Note(
-                        velocity=70,
-                        pitch=pitch,
-                        start=start,
-                        end=start + seconds_per_beat * 0.95,
-                    )
-                )
-
-            # Chords: simple triads sustained per bar
-            triad = [scale[0], scale[2 % len(scale)], scale[4 % len(scale)]]
-            triad = [clamp_midi_range(p, 60, 84) for p in triad]
-            chords.notes.extend(
-                pretty_midi.Note(
-                    velocity=75,
-                    pitch=p,
-                    start=bar_start,
-                    end=bar_start + bar_seconds,
-                )
-                for p in triad
-            )
+        # Drums: kick on 1 and 3, snare on 2 and 4, hihat eighths (per beat: hit, hat, hat)
+        beat_times = np.arange(4) * seconds_per_beat
+        drum_start = np.stack(
+            [beat_times, beat_times, beat_times + 0.5 * seconds_per_beat], axis=1
+        ).ravel()
+        drum_pitch = np.tile([36, 42, 42, 38, 42, 42], 2)
+        drum_velocity = np.tile(
+            [kick_velocity, hat_velocity, hat_velocity, snare_velocity, hat_velocity, hat_velocity],
+            2,
+        )
+        drum_length = np.tile([0.2, 0.1, 0.1], 4)
+        drum_bar = make_notes(
+            drum_pitch, drum_velocity, drum_start, drum_start + drum_length, drums
+        )
+
+        # Bass: root + fifth pattern
+        root_pitch = clamp_midi_range(scale[0] - 24, 36, 60)
+        fifth_pitch = clamp_midi_range(scale[4 % len(scale)] - 24, 36, 60)
+        bass_bar = make_notes(
+            [root_pitch, root_pitch, fifth_pitch, root_pitch],
+            70,
+            beat_times,
+            beat_times + seconds_per_beat * 0.95,
+            bass,
+        )
+
+        # Chords: simple triads sustained per bar
+        triad = [scale[0], scale[2 % len(scale)], scale[4 % len(scale)]]
+        triad = [clamp_midi_range(p, 60, 84) for p in triad]
+        chord_bar = make_notes(triad, 75, 0.0, bar_seconds, chords)
+
+        for pattern in (drum_bar, bass_bar, chord_bar):
+            table.add(tile_bars(pattern, bars, bar_seconds))
+
+        # Lead: cycle through scale with slight rhythmic variation. The octave
+        # jumps are drawn in the same bar/step order as before so seeds stay stable.
+        lead_degrees = np.asarray(cycle_scale(scale, 8))
+        octave_jumps = np.array(
+            [rng.choice([-12, 0, 12]) for _ in range(bars * 8)]
+        ).reshape(bars, 8)
+        bar_starts = np.arange(bars)[:, None] * bar_seconds
+        lead_start = bar_starts + np.arange(8) * (seconds_per_beat / 2.0)
+        lead_end = np.minimum(lead_start + seconds_per_beat * 0.45, bar_starts + bar_seconds)
+        lead_pitch = clamp_midi_array(lead_degrees + octave_jumps, 60, 96)
+        table.add(make_notes(lead_pitch, 80, lead_start, lead_end, lead))
 
-            # Lead: cycle through scale with slight rhythmic variation
-            lead_degrees = cycle_scale(scale, 8)
-            for step in range(8):
-                start = bar_start + step * (seconds_per_beat / 2.0)
-                end = start + seconds_per_beat * 0.45
-                pitch = clamp_midi_range(lead_degrees[step] + random.choice([-12, 0, 12]), 60, 96)
-                lead.notes.append(
-                    pretty_midi.Note(
-                        velocity=80,
-                        pitch=pitch,
-                        start=start,
-                        end=min(end, bar_start + bar_seconds),
-                    )
-                )
-
-        midi.instruments.extend([drums, bass, chords, lead])
-        midi.time_signature_changes.append(pretty_midi.TimeSignature(4, 4, 0.0))
-        key_number = (tonic % 12)
-        if mode == "minor":
-            key_number += 12
-        midi.key_signature_changes.append(pretty_midi.KeySignature(key_number, 0.0))
-        midi.estimate_tempo()
         LOGGER.info(
             "Section '%s' generation finished in %.2f ms",
             section_tag,
             (time.perf_counter() - start_time) * 1000.0,
         )
-        return midi
+        return table
+
+    def run_section(
+        self,
+        style: str,
+        key: str,
+        bpm: int,
+        tag: str,
+        seed: Optional[int] = None,
+        duration: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+    ) -> pretty_midi.PrettyMIDI:
+        """Generate a multi-track MIDI section.
+
+        Parameters match the external API. ``duration`` is optional – if omitted the
+        resulting MIDI defaults to four bars. When supplied we quantise the duration to
+        full bars in 4/4.
+        """
+
+        return self.run_section_notes(
+            style, key, bpm, tag, seed=seed, duration=duration, rng=rng
+        ).to_pretty_midi()
 
 
 RUNNER = SkytntRunner()
@@ -208,8 +206,22 @@ def run_section(
     tag: str,
     seed: Optional[int] = None,
     duration: Optional[float] = None,
+    rng: Optional[random.Random] = None,
 ) -> pretty_midi.PrettyMIDI:
     """Convenience wrapper calling the singleton runner."""
 
-    return RUNNER.run_section(style, key, bpm, tag, seed=seed, duration=duration)
+    return RUNNER.run_section(style, key, bpm, tag, seed=seed, duration=duration, rng=rng)
+
+
+def run_section_notes(
+    style: str,
+    key: str,
+    bpm: int,
+    tag: str,
+    seed: Optional[int] = None,
+    duration: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+) -> NoteTable:
+    """Like :func:`run_section` but returns the array-backed note table."""
 
+    return RUNNER.run_section_notes(style, key, bpm, tag, seed=seed, duration=duration, rng=rng)
@@ -0,0 +1,91 @@
+"""Throughput of :func:`normalize_and_limit` versus :class:`MasteringChain`.
+
+Usage: ``python -m mixer.bench_master --seconds 180 --sample-rate 32000``
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from mixer.master import MasteringChain, normalize_and_limit
+
+
+def _test_signal(seconds: float, sample_rate: int, channels: int, seed: int = 0) -> np.ndarray:
+    """Noise under a few tones with occasional transients, roughly music-like in level."""
+
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * sample_rate)
+    t = np.arange(frames, dtype=np.float32) / sample_rate
+    audio = 0.05 * rng.standard_normal(frames).astype(np.float32)
+    for freq in (110.0, 220.0, 440.0):
+        audio += 0.1 * np.sin(2.0 * np.pi * freq * t, dtype=np.float32)
+    hits = rng.integers(0, frames, size=max(1, int(seconds * 2)))
+    audio[hits] += 0.8
+    if channels > 1:
+        audio = np.stack([audio] * channels, axis=1)
+    return audio
+
+
+def bench_master(
+    seconds: float = 180.0,
+    sample_rate: int = 32000,
+    channels: int = 1,
+    section_seconds: float = 8.0,
+    block_size: int = 4096,
+    repeats: int = 3,
+) -> List[Dict[str, object]]:
+    audio = _test_signal(seconds, sample_rate, channels)
+    frames = audio.shape[0]
+    section = max(1, int(section_seconds * sample_rate))
+
+    def run_function() -> None:
+        normalize_and_limit(audio)
+
+    def run_chain() -> None:
+        chain = MasteringChain(sample_rate, block_size=block_size)
+        for _ in chain.stream(audio[i : i + section] for i in range(0, frames, section)):
+            pass
+
+    rows = []
+    for name, run in (("normalize_and_limit", run_function), ("MasteringChain", run_chain)):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        rows.append(
+            {
+                "name": name,
+                "frames": frames,
+                "seconds": round(best, 4),
+                "samples_per_s": frames / best,
+                "realtime": seconds / best,
+            }
+        )
+    for row in rows:
+        print(
+            f"{row['name']:>20}  {row['frames']} frames  {row['seconds']:.4f} s  "
+            f"{row['samples_per_s'] / 1e6:8.2f} Msamples/s  x{row['realtime']:.0f} realtime"
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=180.0)
+    parser.add_argument("--sample-rate", type=int, default=32000)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--section-seconds", type=float, default=8.0)
+    parser.add_argument("--block-size", type=int, default=4096)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    bench_master(
+        args.seconds, args.sample_rate, args.channels, args.section_seconds, args.block_size, args.repeats
+    )
+
+
+if __name__ == "__main__":
+    main()
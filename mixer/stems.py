@@ -0,0 +1,57 @@
+"""Sum rendered stems with per-stem gain and pan."""
+from __future__ import annotations
+
+import math
+from typing import Mapping, Optional, Tuple
+
+import numpy as np
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20.0)
+
+
+def pan_gains(pan: float) -> Tuple[float, float]:
+    """Equal-power (-3 dB centre) left/right gains for ``pan`` in ``[-1, 1]``."""
+
+    angle = (min(1.0, max(-1.0, pan)) + 1.0) * math.pi / 4.0
+    return math.cos(angle), math.sin(angle)
+
+
+def mix_stems(
+    stems: Mapping[str, np.ndarray],
+    gains_db: Optional[Mapping[str, float]] = None,
+    pans: Optional[Mapping[str, float]] = None,
+    length: Optional[int] = None,
+    stereo: Optional[bool] = None,
+) -> np.ndarray:
+    """Mix mono stems into one buffer.
+
+    Stems missing from ``gains_db`` play at unity. Unless ``stereo`` is given,
+    the result is mono when no mixed stem has a pan and ``(n, 2)`` stereo
+    otherwise; unpanned stems sit in the centre. Stems shorter than the mix are
+    zero-padded; ``length`` trims or extends the output.
+    """
+
+    gains_db = gains_db or {}
+    pans = pans or {}
+    if length is None:
+        length = max((stem.shape[0] for stem in stems.values()), default=0)
+    if stereo is None:
+        stereo = any(name in pans for name in stems)
+    out = np.zeros((length, 2) if stereo else length, dtype=np.float32)
+    scratch = np.empty(length, dtype=np.float32)
+
+    for name, stem in stems.items():
+        count = min(length, stem.shape[0])
+        gain = db_to_gain(gains_db.get(name, 0.0))
+        if stereo:
+            left, right = pan_gains(pans.get(name, 0.0))
+            np.multiply(stem[:count], gain * left, out=scratch[:count])
+            out[:count, 0] += scratch[:count]
+            np.multiply(stem[:count], gain * right, out=scratch[:count])
+            out[:count, 1] += scratch[:count]
+        else:
+            np.multiply(stem[:count], gain, out=scratch[:count])
+            out[:count] += scratch[:count]
+    return out
@@ -0,0 +1,88 @@
+"""Assemble sections into one preallocated master buffer."""
+from __future__ import annotations
+
+import itertools
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Cut made at the end of an un-crossfaded tail, to avoid a click.
+_TAIL_FADE_SAMPLES = 256
+
+
+def equal_power_fades(count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """``(fade_in, fade_out)`` sine/cosine ramps whose squares sum to one."""
+
+    phase = (np.arange(count, dtype=np.float32) + 0.5) * (np.pi / 2.0 / max(1, count))
+    return np.sin(phase), np.cos(phase)
+
+
+class Timeline:
+    """Song-length buffer with one slot per section, allocated once.
+
+    Section ``i`` occupies ``[starts[i], starts[i] + lengths[i])``. Audio placed
+    there may run ``overhang`` samples past its slot:
+
+    * with ``crossfade > 0`` the overhang fades out (equal power) while the next
+      section fades in over the same samples;
+    * otherwise up to ``tail`` samples ring out at full level under the next
+      section (e.g. reverb and release tails) and are cut with a short fade.
+
+    The last section's overhang extends the song. Sections are summed into the
+    buffer, so they may be placed in any order; a slot is final once its own
+    section and the one before it have been placed.
+    """
+
+    def __init__(
+        self, lengths: Sequence[int], channels: int = 1, crossfade: int = 0, tail: int = 0
+    ) -> None:
+        self.lengths = [int(n) for n in lengths]
+        self.starts: List[int] = [0, *itertools.accumulate(self.lengths)][: len(self.lengths)]
+        shortest = min(self.lengths, default=0)
+        self.crossfade = min(max(0, int(crossfade)), shortest)
+        self.overhang = self.crossfade or min(max(0, int(tail)), shortest)
+        self.total = sum(self.lengths) + self.overhang
+        self.channels = channels
+        shape = (self.total, channels) if channels > 1 else (self.total,)
+        self.buffer = np.zeros(shape, dtype=np.float32)
+        fade_in, fade_out = equal_power_fades(self.crossfade)
+        if not self.crossfade:
+            fade_out = np.ones(self.overhang, dtype=np.float32)
+            ramp = min(_TAIL_FADE_SAMPLES, self.overhang)
+            fade_out[self.overhang - ramp :] = np.linspace(1.0, 0.0, ramp, dtype=np.float32)
+        if channels > 1:
+            fade_in, fade_out = fade_in[:, None], fade_out[:, None]
+        self._fade_in = fade_in
+        self._fade_out = fade_out
+
+    def section_length(self, index: int) -> int:
+        """Samples worth rendering for section ``index``: its slot plus the overhang."""
+
+        return self.lengths[index] + self.overhang
+
+    def slot(self, index: int) -> np.ndarray:
+        start = self.starts[index]
+        return self.buffer[start : start + self.lengths[index]]
+
+    def place(self, index: int, audio: np.ndarray) -> None:
+        """Add ``audio`` (up to :meth:`section_length` samples) at section ``index``."""
+
+        start = self.starts[index]
+        length = self.lengths[index]
+        body = audio[:length]
+        slot = self.buffer[start : start + body.shape[0]]
+        head = self.crossfade if index > 0 else 0
+        head = min(head, body.shape[0])
+        if head:
+            slot[:head] += body[:head] * self._fade_in[:head]
+        slot[head:] += body[head:]
+
+        over = audio[length : length + self.overhang]
+        if over.shape[0]:
+            end = start + length
+            self.buffer[end : end + over.shape[0]] += over * self._fade_out[: over.shape[0]]
+
+    def tail_region(self) -> np.ndarray:
+        """The last section's overhang past the final slot."""
+
+        return self.buffer[self.total - self.overhang :]
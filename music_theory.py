@@ -4,6 +4,8 @@ from __future__ import annotations
 import logging
 from typing import List, Tuple
 
+import numpy as np
+
 # Map of note names to semitone offsets relative to C.
 _NOTE_TO_SEMITONE = {
     "c": 0,
@@ -93,3 +95,9 @@ def clamp_midi_range(note: int, low: int, high: int) -> int:
         note -= 12
     return note
 
+
+def clamp_midi_array(notes: np.ndarray, low: int, high: int) -> np.ndarray:
+    """Vectorised :func:`clamp_midi_range` for an array of MIDI notes."""
+    notes = np.asarray(notes, dtype=np.int64)
+    raised = notes + 12 * np.maximum(0, -((notes - low) // 12))
+    return raised - 12 * np.maximum(0, -((high - raised) // 12))
@@ -0,0 +1,192 @@
+"""Content-addressed on-disk cache of rendered audio shared between processes."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from render.synth_pool import EventSchedule
+
+LOGGER = logging.getLogger(__name__)
+
+# Bump when the renderer changes in a way that alters its output.
+RENDER_VERSION = 1
+
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+_DIGESTS_LOCK = threading.Lock()
+
+
+def sf2_digest(sf2_path: str) -> str:
+    """SHA-256 of the SoundFont file, computed once per process per file version."""
+
+    path = os.path.abspath(sf2_path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _DIGESTS_LOCK:
+        digest = _DIGESTS.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _DIGESTS_LOCK:
+            _DIGESTS[key] = digest
+    return digest
+
+
+def render_key(
+    schedule: EventSchedule, sf2_path: str, sample_rate: int, normalized: bool = True
+) -> str:
+    """Hash the event schedule, SoundFont digest, sample rate and output scaling.
+
+    The schedule is already canonical (events sorted, patches resolved to
+    channel programs), so equal note data always yields the same key.
+    """
+
+    sha = hashlib.sha256()
+    header = {
+        "version": RENDER_VERSION,
+        "sf2": sf2_digest(sf2_path),
+        "sample_rate": int(sample_rate),
+        "normalized": bool(normalized),
+        "programs": schedule.programs,
+    }
+    sha.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+    for column, dtype in (
+        (schedule.time, "<f8"),
+        (schedule.kind, "<i1"),
+        (schedule.channel, "<i2"),
+        (schedule.data1, "<i2"),
+        (schedule.data2, "<i2"),
+    ):
+        sha.update(np.ascontiguousarray(column, dtype=dtype).tobytes())
+    return sha.hexdigest()
+
+
+class RenderCache:
+    """Directory of ``<key>.npy`` files bounded to ``max_bytes`` by LRU eviction.
+
+    Hits are memory-mapped read-only and their modification time is bumped, so
+    recency is shared by every process using the directory. Entries are written
+    to a temporary file and renamed into place; an existing entry is never
+    rewritten because its content is determined by its key.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except FileNotFoundError:
+            audio = None
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable render cache entry %s: %s", key, exc)
+            audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return audio
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        path = self._path(key)
+        if os.path.exists(path) or audio.nbytes > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.save(handle, np.ascontiguousarray(audio, dtype=np.float32))
+            os.replace(tmp_path, path)
+        except OSError as exc:  # pragma: no cover - disk full / permissions / file in use
+            LOGGER.warning("Failed to persist render cache entry: %s", exc)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += os.path.getsize(path)
+            over = self._bytes is None or self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the directory fits."""
+
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # already evicted by another process, or mapped on Windows
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._bytes = total
+            self.evictions += evicted
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "dir": self.cache_dir,
+                "max_bytes": self.max_bytes,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_CACHE: Optional[RenderCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_render_cache() -> Optional[RenderCache]:
+    """The process-wide cache in ``RENDER_CACHE_DIR`` (``None`` when unset).
+
+    ``RENDER_CACHE_MB`` bounds the directory size (default 2048).
+    """
+
+    global _CACHE
+    cache_dir = os.getenv("RENDER_CACHE_DIR")
+    if not cache_dir:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.cache_dir != cache_dir:
+            _CACHE = RenderCache(
+                cache_dir, int(float(os.getenv("RENDER_CACHE_MB", "2048")) * 1024 * 1024)
+            )
+        return _CACHE
@@ -0,0 +1,227 @@
+"""Bounded LRU cache for generated section notes and their rendered stems."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+from midi_backend.note_table import NOTE_DTYPE, NoteTable
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CachedSection(NamedTuple):
+    notes: NoteTable
+    stems: Dict[str, np.ndarray]
+
+
+def soundfont_identity(sf2_path: Optional[str] = None) -> Dict[str, object]:
+    """Identify the SoundFont by path, size and modification time.
+
+    Hashing a 140 MB ``.sf2`` on every request would defeat the purpose of the
+    cache, so the file metadata stands in for its content.
+    """
+
+    path = sf2_path or os.getenv("SF2_PATH") or ""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {"path": path}
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def section_key(**params: object) -> str:
+    """Return a canonical SHA-256 key for the given generation parameters."""
+
+    params = dict(params)
+    params.setdefault("soundfont", soundfont_identity())
+    blob = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class SectionCache:
+    """Thread-safe LRU of :class:`CachedSection` entries capped by total bytes.
+
+    An optional on-disk tier (``disk_dir``) stores entries as ``.npz`` files so
+    several worker processes can share rendered sections. Files are written to a
+    temporary name and renamed into place, so readers never see partial entries.
+    The directory is bounded to ``disk_max_bytes`` by LRU eviction; disk hits
+    bump the file's modification time so recency is shared across processes.
+    """
+
+    def __init__(
+        self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 2 << 30
+    ) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries: "OrderedDict[str, CachedSection]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_bytes: Optional[int] = None
+        self.disk_evictions = 0
+
+    @staticmethod
+    def _size(entry: CachedSection) -> int:
+        return int(sum(stem.nbytes for stem in entry.stems.values()) + entry.notes.notes.nbytes)
+
+    def get(self, key: str) -> Optional[CachedSection]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, notes: NoteTable, stems: Dict[str, np.ndarray]) -> CachedSection:
+        frozen = {}
+        for name, stem in stems.items():
+            stem = np.ascontiguousarray(stem, dtype=np.float32)
+            stem.setflags(write=False)
+            frozen[name] = stem
+        entry = CachedSection(notes, frozen)
+        self._insert(key, entry)
+        self._store(key, entry)
+        return entry
+
+    def _insert(self, key: str, entry: CachedSection) -> None:
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or "", f"{key}.npz")
+
+    def _store(self, key: str, entry: CachedSection) -> None:
+        if not self.disk_dir:
+            return
+        notes = entry.notes
+        names = list(entry.stems)
+        meta = {
+            "tempo": notes.tempo,
+            "key_number": notes.key_number,
+            "tracks": notes.tracks,
+            "stems": names,
+        }
+        arrays = {f"stem_{i}": entry.stems[name] for i, name in enumerate(names)}
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        path = self._path(key)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.savez(handle, notes=notes.notes, meta=np.array(json.dumps(meta)), **arrays)
+            size = os.path.getsize(tmp_path)
+            if size > self.disk_max_bytes:
+                os.remove(tmp_path)
+                return
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as exc:  # pragma: no cover - disk full / permissions
+            LOGGER.warning("Failed to persist section cache entry: %s", exc)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - replaced
+            over = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Delete the least recently used ``.npz`` entries until the directory fits."""
+
+        entries = []
+        with os.scandir(self.disk_dir) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".npz"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # already evicted by another process, or open on Windows
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += evicted
+
+    def _load(self, key: str) -> Optional[CachedSection]:
+        if not self.disk_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                meta = json.loads(str(data["meta"]))
+                notes = NoteTable(tempo=meta["tempo"], key_number=meta["key_number"])
+                for name, program, is_drum in meta["tracks"]:
+                    notes.add_track(name, program, is_drum)
+                notes.add(data["notes"].astype(NOTE_DTYPE))
+                stems = {name: data[f"stem_{i}"] for i, name in enumerate(meta["stems"])}
+        except (OSError, ValueError, KeyError) as exc:
+            LOGGER.warning("Ignoring unreadable section cache entry %s: %s", key, exc)
+            return None
+        try:
+            os.utime(self._path(key))
+        except OSError:  # evicted meanwhile; the loaded entry is still valid
+            pass
+        for stem in stems.values():
+            stem.setflags(write=False)
+        return CachedSection(notes, stems)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
@@ -1,17 +1,25 @@
 """SoundFont based MIDI renderer."""
 from __future__ import annotations
 
-import copy
 import logging
 import os
+import threading
 import time
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import numpy as np
 import pretty_midi
 
+from midi_backend.note_table import NoteTable
+from render.render_cache import get_render_cache, render_key
+from render.synth_pool import EventSchedule, get_synth_pool, schedule_midi, schedule_notes
+
 LOGGER = logging.getLogger(__name__)
 
+_STEM_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_STEM_LOCK = threading.Lock()
+
 _DEFAULT_PATCHES: Dict[str, int] = {
     "drums": 0,  # channel 10 drums handled via is_drum flag
     "bass": 33,  # Fingered Bass
@@ -21,17 +29,7 @@ _DEFAULT_PATCHES: Dict[str, int] = {
 }
 
 
-def _apply_presets(midi: pretty_midi.PrettyMIDI) -> None:
-    for instrument in midi.instruments:
-        name = (instrument.name or "").lower()
-        if name in _DEFAULT_PATCHES:
-            instrument.program = _DEFAULT_PATCHES[name]
-            instrument.is_drum = name == "drums"
-
-
-def render(midi: pretty_midi.PrettyMIDI, sr: int = 32000) -> np.ndarray:
-    """Render a MIDI object to audio using the configured SoundFont."""
-
+def _sf2_path() -> str:
     sf2_path = os.getenv("SF2_PATH")
     if not sf2_path:
         raise RuntimeError(
@@ -39,18 +37,93 @@ def render(midi: pretty_midi.PrettyMIDI, sr: int = 32000) -> np.ndarray:
         )
     if not os.path.exists(sf2_path):
         raise FileNotFoundError(f"SoundFont file not found at '{sf2_path}'")
+    return sf2_path
+
 
-    midi_copy = copy.deepcopy(midi)
-    _apply_presets(midi_copy)
+def render_schedule(
+    schedule: EventSchedule, sr: int = 32000, normalize: bool = True
+) -> np.ndarray:
+    """Render an event schedule, peak-normalised to [-1, 1] like ``PrettyMIDI.fluidsynth``.
+
+    ``normalize=False`` keeps the synth's own level so that separately rendered
+    stems still balance when summed. With ``RENDER_CACHE_DIR`` set, results are
+    looked up by content hash first and returned as read-only memory maps on a hit.
+    """
+
+    sf2_path = _sf2_path()
+    cache = get_render_cache()
+    key = render_key(schedule, sf2_path, sr, normalize) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            LOGGER.info("Render served from cache")
+            return cached
 
     start = time.perf_counter()
-    audio = midi_copy.fluidsynth(fs=sr, sf2_path=sf2_path)
-    duration = time.perf_counter() - start
-    LOGGER.info("Rendered MIDI to audio in %.2f ms", duration * 1000.0)
+    with get_synth_pool(sf2_path, sr).acquire() as synth:
+        audio = synth.render(schedule)
+    LOGGER.info("Rendered MIDI to audio in %.2f ms", (time.perf_counter() - start) * 1000.0)
+
+    peak = float(np.max(np.abs(audio))) if audio.size else 0.0
+    if normalize and peak > 0:
+        audio *= 1.0 / peak
+    if cache is not None:
+        cache.put(key, audio)
+    return audio
+
+
+def render(midi: pretty_midi.PrettyMIDI, sr: int = 32000) -> np.ndarray:
+    """Render a MIDI object to audio using the configured SoundFont.
+
+    ``_DEFAULT_PATCHES`` is applied while scheduling events, so ``midi`` is left
+    untouched without having to copy it.
+    """
+
+    return render_schedule(schedule_midi(midi, _DEFAULT_PATCHES), sr)
+
+
+def render_notes(notes: NoteTable, sr: int = 32000) -> np.ndarray:
+    """Render a :class:`NoteTable` directly, skipping the ``PrettyMIDI`` conversion."""
+
+    return render_schedule(schedule_notes(notes.notes, notes.tracks, _DEFAULT_PATCHES), sr)
+
+
+def _stem_executor(workers: int) -> ThreadPoolExecutor:
+    global _STEM_EXECUTOR
+    with _STEM_LOCK:
+        if _STEM_EXECUTOR is None:
+            _STEM_EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stem")
+        return _STEM_EXECUTOR
+
+
+def stem_names(notes: NoteTable) -> List[str]:
+    """One unique, stable name per track (duplicates get their track index appended)."""
+
+    names: List[str] = []
+    for index, (name, _, _) in enumerate(notes.tracks):
+        name = name or f"track{index}"
+        names.append(name if name not in names else f"{name}_{index}")
+    return names
+
+
+def render_stems(notes: NoteTable, sr: int = 32000) -> Dict[str, np.ndarray]:
+    """Render every track of ``notes`` to its own un-normalised mono stem.
 
-    audio = np.asarray(audio, dtype=np.float32)
-    if audio.ndim == 1:
-        return audio
-    # pretty_midi returns shape (n, ) or (n, channels). ensure float32
-    return audio.astype(np.float32)
+    Stems render concurrently on the process's synth pool (pyfluidsynth releases
+    the GIL inside FluidSynth calls) and each one is cached on its own content
+    hash, so changing one track leaves the others' cache entries valid. Use
+    :func:`mixer.stems.mix_stems` to combine them.
+    """
 
+    table = notes.notes
+    schedules = []
+    for index, track in enumerate(notes.tracks):
+        rows = table[table["track"] == index].copy()
+        rows["track"] = 0
+        schedules.append(schedule_notes(rows, [track], _DEFAULT_PATCHES))
+    workers = get_synth_pool(_sf2_path(), sr).size
+    futures = [
+        _stem_executor(workers).submit(render_schedule, schedule, sr, False)
+        for schedule in schedules
+    ]
+    return {name: future.result() for name, future in zip(stem_names(notes), futures)}
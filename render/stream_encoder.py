@@ -0,0 +1,191 @@
+"""Incremental WAV / FLAC / Ogg-Opus encoding for streamed HTTP responses."""
+from __future__ import annotations
+
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+MEDIA_TYPES: Dict[str, str] = {
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "opus": "audio/ogg; codecs=opus",
+}
+
+_ACCEPT_ALIASES: Dict[str, str] = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+}
+
+# libsndfile only encodes Opus at these rates; callers render at 48 kHz instead.
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def negotiate(accept: Optional[str], default: str = "wav") -> Optional[str]:
+    """Pick the best format for an ``Accept`` header, or ``None`` if nothing matches.
+
+    A missing header, ``*/*`` or ``audio/*`` selects ``default``. Ties on the
+    q-value keep the client's order.
+    """
+
+    if not accept:
+        return default
+    candidates: List[Tuple[float, int, str]] = []
+    for order, item in enumerate(accept.split(",")):
+        media, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media = media.lower()
+        fmt = default if media in ("*/*", "audio/*") else _ACCEPT_ALIASES.get(media)
+        if fmt is not None and quality > 0:
+            candidates.append((-quality, order, fmt))
+    return min(candidates)[2] if candidates else None
+
+
+def wav_header(sample_rate: int, channels: int, frames: Optional[int]) -> bytes:
+    """44-byte PCM16 header; unknown lengths use the streaming ``0xFFFFFFFF`` marker."""
+
+    block_align = channels * 2
+    data_size = frames * block_align if frames is not None else 0xFFFFFFFF - 36
+    return b"".join(
+        [
+            b"RIFF",
+            struct.pack("<I", min(0xFFFFFFFF, 36 + data_size)),
+            b"WAVEfmt ",
+            struct.pack(
+                "<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16
+            ),
+            b"data",
+            struct.pack("<I", min(0xFFFFFFFF, data_size)),
+        ]
+    )
+
+
+class _ChunkSink:
+    """Write-only file object that hands out bytes as soon as they are final.
+
+    libsndfile seeks back on close to patch headers (e.g. FLAC STREAMINFO);
+    writes that land before what has already been sent are dropped, which only
+    loses optional fields such as the MD5 signature.
+    """
+
+    def __init__(self) -> None:
+        self._sent = 0
+        self._pending = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        start = self._pos - self._sent
+        self._pos += len(data)
+        if start < 0:
+            data = data[-start:]
+            start = 0
+        if start > len(self._pending):
+            self._pending.extend(b"\0" * (start - len(self._pending)))
+        self._pending[start : start + len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._sent + len(self._pending)
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        return b""
+
+    def take(self) -> bytes:
+        data = bytes(self._pending)
+        self._sent += len(data)
+        self._pending.clear()
+        return data
+
+
+class StreamEncoder:
+    """Encode float audio block by block; each call returns the bytes to send next.
+
+    ``frames`` is the total length when known, which lets the WAV header carry
+    exact sizes so ordinary players handle the stream.
+    """
+
+    def __init__(
+        self, fmt: str, sample_rate: int, channels: int, frames: Optional[int] = None
+    ) -> None:
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"unsupported format '{fmt}'")
+        if fmt == "opus" and sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus cannot encode at {sample_rate} Hz")
+        self.fmt = fmt
+        self.media_type = MEDIA_TYPES[fmt]
+        self.channels = channels
+        self.frames = frames
+        self._started = False
+        self._header: Optional[bytes] = None
+        self._sink: Optional[_ChunkSink] = None
+        self._file: Optional[sf.SoundFile] = None
+        if fmt == "wav":
+            self._header = wav_header(sample_rate, channels, frames)
+        else:
+            self._sink = _ChunkSink()
+            self._file = sf.SoundFile(
+                self._sink,
+                mode="w",
+                samplerate=sample_rate,
+                channels=channels,
+                format="FLAC" if fmt == "flac" else "OGG",
+                subtype="PCM_16" if fmt == "flac" else "OPUS",
+            )
+
+    def write(self, audio: np.ndarray) -> bytes:
+        audio = np.asarray(audio, dtype=np.float32)
+        if self._file is None:
+            head, self._header = self._header or b"", None
+            pcm = np.clip(audio, -1.0, 1.0) * 32767.0
+            return head + pcm.astype("<i2").tobytes()
+        self._file.write(audio)
+        return self._take()
+
+    def close(self) -> bytes:
+        if self._file is None:
+            head, self._header = self._header or b"", None
+            return head
+        self._file.close()
+        return self._take()
+
+    def _take(self) -> bytes:
+        data = self._sink.take()
+        if not self._started and data:
+            self._started = True
+            if self.fmt == "flac" and self.frames is not None:
+                data = _flac_set_total_samples(data, self.frames)
+        return data
+
+
+def _flac_set_total_samples(data: bytes, frames: int) -> bytes:
+    """Fill STREAMINFO's 36-bit total-samples field, which libsndfile leaves at 0
+    (unknown) until its seek-back on close, after that header has been sent."""
+
+    if len(data) < 26 or data[:4] != b"fLaC":
+        return data
+    (word,) = struct.unpack(">Q", data[18:26])
+    word = (word & ~((1 << 36) - 1)) | (frames & ((1 << 36) - 1))
+    return data[:18] + struct.pack(">Q", word) + data[26:]
@@ -0,0 +1,293 @@
+"""Warm FluidSynth synthesisers with the SoundFont loaded once per process."""
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pretty_midi
+
+try:
+    import fluidsynth
+except ImportError:  # pragma: no cover - optional dependency (needs libfluidsynth)
+    fluidsynth = None
+
+from midi_backend.note_table import make_notes
+
+LOGGER = logging.getLogger(__name__)
+
+# Event kinds, ordered so that at equal times note-offs are applied first and
+# note-ons last, like ``pretty_midi.Instrument.fluidsynth``.
+NOTE_OFF, CONTROL_CHANGE, PITCH_BEND, NOTE_ON = range(4)
+
+DRUM_CHANNEL = 9
+TAIL_SECONDS = 1.0
+
+Track = Tuple[str, int, bool]
+
+
+class EventSchedule(NamedTuple):
+    """MIDI events for one render as parallel arrays, sorted by time."""
+
+    time: np.ndarray
+    kind: np.ndarray
+    channel: np.ndarray
+    data1: np.ndarray
+    data2: np.ndarray
+    programs: List[Tuple[int, int, int]]  # (channel, bank, program)
+
+
+def _channels(
+    tracks: Sequence[Track], patches: Optional[Mapping[str, int]] = None
+) -> Tuple[np.ndarray, List[Tuple[int, int, int]]]:
+    """Give each track its own channel, drums on channel 9 of a 16-channel group.
+
+    ``patches`` maps lower-case track names to programs; a patched ``drums`` track
+    is always percussion. The source tracks are never modified.
+    """
+
+    channels = np.empty(max(1, len(tracks)), dtype=np.int16)
+    programs: List[Tuple[int, int, int]] = []
+    melodic = (c for c in range(1 << 15) if c % 16 != DRUM_CHANNEL)
+    drums = 0
+    for index, (name, program, is_drum) in enumerate(tracks):
+        lowered = (name or "").lower()
+        if patches and lowered in patches:
+            program = patches[lowered]
+            is_drum = lowered == "drums"
+        if is_drum:
+            channel = DRUM_CHANNEL + 16 * drums
+            drums += 1
+        else:
+            channel = next(melodic)
+        channels[index] = channel
+        programs.append((channel, 128 if is_drum else 0, program))
+    return channels, programs
+
+
+def schedule_notes(
+    notes: np.ndarray,
+    tracks: Sequence[Track],
+    patches: Optional[Mapping[str, int]] = None,
+    extra: Optional[Sequence[np.ndarray]] = None,
+) -> EventSchedule:
+    """Build a schedule from ``NOTE_DTYPE`` rows (see :mod:`midi_backend.note_table`).
+
+    ``extra`` optionally holds ``(time, kind, track, data1, data2)`` arrays for
+    pitch bends and control changes.
+    """
+
+    channels, programs = _channels(tracks, patches)
+    count = notes.size
+    time_ = np.concatenate([notes["end"], notes["start"]])
+    kind = np.repeat(np.array([NOTE_OFF, NOTE_ON], dtype=np.int8), count)
+    track = np.tile(notes["track"], 2)
+    data1 = np.tile(notes["pitch"].astype(np.int16), 2)
+    data2 = np.concatenate([np.zeros(count, dtype=np.int16), notes["velocity"].astype(np.int16)])
+    if extra is not None and len(extra[0]):
+        time_ = np.concatenate([time_, extra[0]])
+        kind = np.concatenate([kind, extra[1].astype(np.int8)])
+        track = np.concatenate([track, extra[2]])
+        data1 = np.concatenate([data1, extra[3].astype(np.int16)])
+        data2 = np.concatenate([data2, extra[4].astype(np.int16)])
+    order = np.lexsort((kind, time_))
+    return EventSchedule(
+        time=time_[order],
+        kind=kind[order],
+        channel=channels[track[order]],
+        data1=data1[order],
+        data2=data2[order],
+        programs=programs,
+    )
+
+
+def schedule_midi(
+    midi: pretty_midi.PrettyMIDI, patches: Optional[Mapping[str, int]] = None
+) -> EventSchedule:
+    """Build a schedule straight from a ``PrettyMIDI`` object without copying it."""
+
+    fields: Dict[str, List[object]] = {k: [] for k in ("pitch", "velocity", "start", "end", "track")}
+    extra: List[List[object]] = [[], [], [], [], []]
+    for index, instrument in enumerate(midi.instruments):
+        for note in instrument.notes:
+            fields["pitch"].append(note.pitch)
+            fields["velocity"].append(note.velocity)
+            fields["start"].append(note.start)
+            fields["end"].append(note.end)
+        fields["track"].extend([index] * len(instrument.notes))
+        for bend in instrument.pitch_bends:
+            for column, value in zip(extra, (bend.time, PITCH_BEND, index, bend.pitch, 0)):
+                column.append(value)
+        for change in instrument.control_changes:
+            values = (change.time, CONTROL_CHANGE, index, change.number, change.value)
+            for column, value in zip(extra, values):
+                column.append(value)
+    notes = make_notes(
+        np.asarray(fields["pitch"], dtype=np.uint8),
+        np.asarray(fields["velocity"], dtype=np.uint8),
+        np.asarray(fields["start"], dtype=np.float64),
+        np.asarray(fields["end"], dtype=np.float64),
+        np.asarray(fields["track"], dtype=np.uint8),
+    )
+    tracks = [(i.name, i.program, i.is_drum) for i in midi.instruments]
+    extra_arrays = [
+        np.asarray(extra[0], dtype=np.float64),
+        np.asarray(extra[1], dtype=np.int8),
+        np.asarray(extra[2], dtype=np.int64),
+        np.asarray(extra[3], dtype=np.int16),
+        np.asarray(extra[4], dtype=np.int16),
+    ]
+    return schedule_notes(notes, tracks, patches, extra_arrays)
+
+
+class WarmSynth:
+    """One ``fluidsynth.Synth`` with the SoundFont already loaded."""
+
+    def __init__(self, sf2_path: str, sample_rate: int) -> None:
+        if fluidsynth is None:
+            raise RuntimeError("pyfluidsynth (and libfluidsynth) is required for rendering")
+        start = time.perf_counter()
+        self.sample_rate = int(sample_rate)
+        self.synth = fluidsynth.Synth(samplerate=float(sample_rate))
+        self.sfid = self.synth.sfload(sf2_path)
+        if self.sfid == -1:
+            self.synth.delete()
+            raise RuntimeError(f"FluidSynth could not load SoundFont '{sf2_path}'")
+        LOGGER.info(
+            "Loaded SoundFont into synth at %d Hz in %.2f ms",
+            sample_rate,
+            (time.perf_counter() - start) * 1000.0,
+        )
+
+    def render(self, schedule: EventSchedule, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Render ``schedule`` plus a one second tail into a float32 mono buffer.
+
+        ``out`` may be a preallocated buffer of at least the required length; the
+        returned array is a view of it. Samples are in ``[-1, 1]`` full scale.
+        """
+
+        synth = self.synth
+        fs = self.sample_rate
+        if schedule.time.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        total = int(np.ceil(fs * (float(schedule.time[-1]) + TAIL_SECONDS)))
+        if out is None or out.shape[0] < total:
+            out = np.empty(total, dtype=np.float32)
+        out = out[:total]
+
+        synth.system_reset()
+        for channel, bank, program in schedule.programs:
+            if synth.program_select(channel, self.sfid, bank, program) == -1 and bank == 128:
+                synth.program_select(channel, self.sfid, 128, 0)
+
+        positions = (schedule.time * fs).astype(np.int64)
+        cursor = int(positions[0])
+        out[:cursor] = 0.0  # nothing sounds before the first event
+        for position, kind, channel, data1, data2 in zip(
+            positions.tolist(),
+            schedule.kind.tolist(),
+            schedule.channel.tolist(),
+            schedule.data1.tolist(),
+            schedule.data2.tolist(),
+        ):
+            if position > cursor:
+                # get_samples returns interleaved int16 stereo; keep the left channel.
+                np.copyto(out[cursor:position], synth.get_samples(position - cursor)[::2], casting="unsafe")
+                cursor = position
+            if kind == NOTE_ON:
+                synth.noteon(channel, data1, data2)
+            elif kind == NOTE_OFF:
+                synth.noteoff(channel, data1)
+            elif kind == PITCH_BEND:
+                synth.pitch_bend(channel, data1)
+            else:
+                synth.cc(channel, data1, data2)
+        if total > cursor:
+            np.copyto(out[cursor:total], synth.get_samples(total - cursor)[::2], casting="unsafe")
+        synth.system_reset()
+
+        out *= 1.0 / 32768.0
+        return out
+
+    def close(self) -> None:
+        self.synth.delete()
+
+
+class SynthPool:
+    """Up to ``size`` warm synths for one SoundFont and sample rate.
+
+    Synths are created on first use and then reused, so the ``.sf2`` file is
+    parsed once per synth instead of once per render.
+    """
+
+    def __init__(self, sf2_path: str, sample_rate: int, size: int) -> None:
+        self.sf2_path = sf2_path
+        self.sample_rate = int(sample_rate)
+        self.size = max(1, int(size))
+        self._idle: "queue.LifoQueue[WarmSynth]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[WarmSynth]:
+        synth = self._take()
+        try:
+            yield synth
+        except BaseException:
+            # The synth may be mid-render; do not hand it to the next caller.
+            synth.close()
+            with self._lock:
+                self._created -= 1
+            raise
+        self._idle.put(synth)
+
+    def _take(self) -> WarmSynth:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return WarmSynth(self.sf2_path, self.sample_rate)
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "sample_rate": self.sample_rate,
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+        }
+
+
+_POOLS: Dict[Tuple[str, int], SynthPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_synth_pool(sf2_path: str, sample_rate: int) -> SynthPool:
+    """Return this process's pool for ``sf2_path`` at ``sample_rate``.
+
+    The pool size comes from ``SYNTH_POOL_SIZE`` (default 2).
+    """
+
+    key = (os.path.abspath(sf2_path), int(sample_rate))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = SynthPool(
+                key[0], key[1], int(os.getenv("SYNTH_POOL_SIZE", "2"))
+            )
+        return pool
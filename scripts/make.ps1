@@ -1,4 +1,4 @@
-param([ValidateSet('setup','prepare','train','export','serve','demo')][string]$Task='setup')
+param([ValidateSet('setup','prepare','train','export','quantize','serve','bench','demo')][string]$Task='setup')
 . $PSScriptRoot\_env.ps1
 
 switch ($Task) {
@@ -17,6 +17,12 @@ switch ($Task) {
   'export' {
     & $PY src\export\export_ov.py --ckpt checkpoints\epoch2 --out exports\gpt_ov; break
   }
+  'quantize' {
+    & $PY -m src.export.export_ov --ckpt checkpoints\epoch2 --out exports\gpt_ov_int4 --weight-format int4; break
+  }
+  'bench' {
+    & $PY -m src.inference.bench decode --xml exports\gpt_ov\openvino_model.xml --vocab data\processed\vocab.json; break
+  }
   'serve' {
     & $PY -m uvicorn src.api.server:app --host 127.0.0.1 --port 9009; break
   }
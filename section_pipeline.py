@@ -0,0 +1,181 @@
+"""Per-section generation and stem rendering, optionally fanned out to worker processes."""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from midi_backend.note_table import NoteTable
+from midi_backend.skytnt_runner import run_section_notes
+from render.sf2_renderer import render_stems
+from vocals.melody_from_lyrics import melody_from_lyrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+INSTRUMENTS = "instruments"
+VOCAL = "vocal"
+
+
+class SectionJob(NamedTuple):
+    """Everything needed to build one part of a section; picklable so it can cross processes.
+
+    ``part`` is :data:`INSTRUMENTS` (drums, bass, chords and lead from the runner)
+    or :data:`VOCAL` (the lead vocal melody for ``lines``). Building the parts
+    separately lets a cached instrumental be reused when vocals are toggled.
+    """
+
+    part: str
+    style: str
+    key: str
+    bpm: int
+    tag: str
+    seed: Optional[int]
+    duration: float
+    lines: Tuple[str, ...]
+    sample_rate: int
+
+
+class SectionResult(NamedTuple):
+    notes: NoteTable
+    stems: Dict[str, np.ndarray]
+    timings: Dict[str, float]
+
+
+def build_section(job: SectionJob) -> SectionResult:
+    """Generate one section part and render each of its tracks to a stem.
+
+    The function only depends on ``job``: the runner draws from its own
+    ``random.Random(job.seed)`` and pooled synths are reset before every render,
+    so a part renders to the same samples in any process and in any order.
+    """
+
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    if job.part == INSTRUMENTS:
+        try:
+            notes = run_section_notes(
+                style=job.style,
+                key=job.key,
+                bpm=job.bpm,
+                tag=job.tag,
+                seed=job.seed,
+                duration=job.duration,
+            )
+        except Exception:  # pragma: no cover - failure path
+            LOGGER.exception("MIDI generation failed for section '%s'", job.tag)
+            raise
+        timings["midi_ms"] = (time.perf_counter() - start) * 1000.0
+    else:
+        try:
+            vocal_midi = melody_from_lyrics(
+                lines=list(job.lines),
+                key=job.key,
+                bpm=job.bpm,
+                duration_seconds=job.duration,
+            )
+            notes = NoteTable(tempo=job.bpm)
+            notes.add_instruments(vocal_midi.instruments)
+        except Exception:  # pragma: no cover - melody failure
+            LOGGER.exception("Vocal melody generation failed")
+            raise
+        timings["vocal_ms"] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    try:
+        stems = render_stems(notes, sr=job.sample_rate)
+    except Exception:
+        LOGGER.exception("Rendering failed for section '%s'", job.tag)
+        raise
+    timings["render_ms"] = (time.perf_counter() - start) * 1000.0
+
+    return SectionResult(notes, stems, timings)
+
+
+class SectionExecutor:
+    """Run :func:`build_section` jobs concurrently, one future per section.
+
+    With ``workers > 1`` sections are built in a shared, lazily started process
+    pool. Rendering alone would scale on threads (pyfluidsynth releases the GIL
+    inside FluidSynth calls, see :func:`render.sf2_renderer.render_stems`), but
+    note generation and vocal melody building are Python-bound, and a crashing
+    synthesiser only takes down a worker that is replaced on the next job.
+    Workers are spawned rather than forked so the server's threads and any
+    loaded synthesiser state are never duplicated into a child. ``workers <= 1``
+    builds sections inline, which produces the same audio.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, int(workers))
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def start(self) -> None:
+        """Spawn the worker processes now instead of on the first request."""
+
+        if self.workers <= 1:
+            return
+        pool = self._get_pool()
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, job: SectionJob) -> "Future[SectionResult]":
+        """Start one job; with ``workers <= 1`` it is built before this returns."""
+
+        if self.workers <= 1:
+            future: "Future[SectionResult]" = Future()
+            try:
+                future.set_result(build_section(job))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+        pool = self._get_pool()
+        future = pool.submit(build_section, job)
+        future.add_done_callback(lambda done: self._check_broken(pool, done))
+        return future
+
+    def _check_broken(self, pool: Executor, future: Future) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._reset(pool)
+
+    def _reset(self, pool: Executor) -> None:
+        # A worker died (e.g. FluidSynth crashed); start a fresh pool next time.
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def status(self) -> Dict[str, object]:
+        return {"workers": self.workers, "started": self._pool is not None}
+
+
+def default_workers() -> int:
+    """``COMPOSE_SECTION_WORKERS`` or up to four worker processes."""
+
+    configured = os.getenv("COMPOSE_SECTION_WORKERS")
+    if configured:
+        return int(configured)
+    return min(4, os.cpu_count() or 1)
@@ -1,7 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-import os, io, base64, time, soundfile as sf, pretty_midi as pm
-from src.inference.ov_sampler import ov_generate, tokens_to_midi
+import os, io, json, base64, time, numpy as np, soundfile as sf, pretty_midi as pm
+from src.inference.ov_sampler import section_prompt, tokens_to_midi, events_to_midi, MidiEventDecoder
+from src.inference import model_pool
+from src.inference.scheduler import get_scheduler, Overloaded, DeadlineExceeded, TooLong
+from src.inference import scheduler
+from starlette.concurrency import run_in_threadpool
+from render.stream_encoder import MEDIA_TYPES, StreamEncoder, negotiate
+from mixer.master import MasteringChain
+from mixer.timeline import Timeline
+
+XML=os.environ.get('OV_XML','exports/gpt_ov/openvino_model.xml'); VOCAB='data/processed/vocab.json'  # 정적 버킷 export 는 OV_XML=.../buckets.json
+RELEASE_TAIL_S=1.0  # compose_audio: 섹션 끝에서 다음 섹션 아래로 울리게 둘 릴리스 꼬리(초)
+MAX_TOKENS=int(os.environ.get('COMPOSE_MAX_TOKENS',2048))  # 요청당 상한. 실제 한도는 모델 용량(n_positions/최대 버킷)으로 스케줄러가 다시 확인
 
 app=FastAPI(title='midi-npu (one-pipeline)',version='0.3.0')
 
@@ -9,38 +21,137 @@ class Section(BaseModel):
     name:str; duration:float=Field(...,gt=0)
 class ComposeReq(BaseModel):
     base_style:str='rock'; bpm:int=120; key:str='C'
-    sections:list[Section]; seed:int|None=42; with_vocal:bool=False; max_tokens:int=512
+    sections:list[Section]; seed:int|None=42; with_vocal:bool=False; max_tokens:int=Field(512,ge=1,le=MAX_TOKENS); constrained:bool=True
+    timeout_s:float|None=float(os.environ.get('COMPOSE_TIMEOUT_S',120)) or None
+    temperature:float=1.0; top_p:float=0.92; top_k:int=0; min_p:float=0.0; repetition_penalty:float=1.0
+    def sampling(s): return dict(temperature=s.temperature,top_p=s.top_p,top_k=s.top_k,min_p=s.min_p,repetition_penalty=s.repetition_penalty)
 class MGReq(BaseModel):
     prompt:str; duration:int=8
 
+@app.on_event('startup')
+def warmup():
+    # 기동 시 1회 컴파일(OV_CACHE_DIR 캐시) + 더미 추론으로 첫 요청 지연 제거. OV_WARMUP=0 이면 생략
+    if os.environ.get('OV_WARMUP','1')!='1' or not (os.path.exists(XML) and os.path.exists(VOCAB)): return
+    try: model_pool.warmup(XML,VOCAB)
+    except Exception: pass  # /health 에 error 로 노출
+
 @app.get('/health')
 def health():
     try:
-        import openvino as ov; return {'status':'ok','devices':ov.Core().available_devices}
+        return {'status':'ok','devices':model_pool.core().available_devices,**model_pool.status(),'scheduler':scheduler.status()}
     except Exception as e:
         return {'status':'degraded','error':str(e)}
 
-@app.post('/v1/midi/compose_full')
-def compose(req:ComposeReq):
-    if not os.path.exists('exports/gpt_ov/openvino_model.xml'): return {'error':'run scripts/make.ps1 export'}
-    if not os.path.exists('data/processed/vocab.json'): return {'error':'run scripts/make.ps1 prepare'}
-    t0=time.time()
-    toks,vocab=ov_generate('exports/gpt_ov/openvino_model.xml','data/processed/vocab.json',max_tokens=req.max_tokens)
-    midi=tokens_to_midi(toks,vocab)
+def _check():
+    if not os.path.exists(XML): return {'error':'run scripts/make.ps1 export'}
+    if not os.path.exists(VOCAB): return {'error':'run scripts/make.ps1 prepare'}
+
+def _gen_args(req,m):
+    # 섹션마다 자기 조건 프리픽스/seed 로 한 배치에서 동시에 디코드
+    prompts=[section_prompt(m.vocab,s.name,req.bpm,req.key) for s in req.sections]
+    seeds=[req.seed+i for i in range(len(prompts))] if req.seed is not None else None
+    return dict(prompts=prompts,max_tokens=req.max_tokens,seeds=seeds,constrained=req.constrained,**req.sampling())
+
+def _assemble(sections,midis):
     # 섹션 길이에 맞춰 간단히 타임스케일/오프셋
-    total=sum(s.duration for s in req.sections); cur=0.0; out=pm.PrettyMIDI(); offsets=[]
-    dur=max(1e-3,midi.get_end_time())
-    for s in req.sections:
-        scale=s.duration/dur
-        for inst in midi.instruments:
-            ni=pm.Instrument(program=inst.program,is_drum=inst.is_drum,name=inst.name)
-            for n in inst.notes:
-                ni.notes.append(pm.Note(velocity=n.velocity,pitch=n.pitch,start=n.start*scale+cur,end=n.end*scale+cur))
-            out.instruments.append(ni)
-        offsets.append({'name':s.name,'start':cur,'end':cur+s.duration}); cur+=s.duration
+    cur=0.0; out=pm.PrettyMIDI(); offsets=[]
+    for s,midi in zip(sections,midis):
+        scale=s.duration/max(1e-3,midi.get_end_time())
+        _place(midi,scale,cur,out)
+        offsets.append({'name':s.name,'start':cur,'end':cur+s.duration,'scale':scale}); cur+=s.duration
+    return out,offsets
+
+def _place(midi,scale,cur,out=None):
+    # midi 의 노트를 scale 배 늘려 cur 초 위치로 out 에 추가 (out 없으면 새 PrettyMIDI)
+    out=out if out is not None else pm.PrettyMIDI()
+    for inst in midi.instruments:
+        ni=pm.Instrument(program=inst.program,is_drum=inst.is_drum,name=inst.name)
+        for n in inst.notes:
+            ni.notes.append(pm.Note(velocity=n.velocity,pitch=n.pitch,start=n.start*scale+cur,end=n.end*scale+cur))
+        out.instruments.append(ni)
+    return out
+
+def _wav_b64(midi):
     import src.render.sf2_renderer as R
-    audio=R.render(out, sr=32000); buf=io.BytesIO(); sf.write(buf,audio,32000,format='WAV')
-    return {'format':'wav','sample_rate':32000,'b64':base64.b64encode(buf.getvalue()).decode(),'offsets':offsets,'elapsed_ms':int((time.time()-t0)*1000)}
+    audio=R.render(midi, sr=32000); buf=io.BytesIO(); sf.write(buf,audio,32000,format='WAV')
+    return base64.b64encode(buf.getvalue()).decode()
+
+@app.post('/v1/midi/compose_full')
+async def compose(req:ComposeReq):
+    # 디코드는 스케줄러가 다른 요청들과 한 배치로 묶어 처리, 렌더는 스레드풀에서
+    err=_check()
+    if err: return err
+    t0=time.time(); m=model_pool.get_model(XML,VOCAB); a=_gen_args(req,m)
+    try: seqs,stats=await get_scheduler(XML,VOCAB).generate(a.pop('prompts'),timeout=req.timeout_s,**a)
+    except Overloaded as e: return JSONResponse({'error':str(e)},status_code=429,headers={'Retry-After':str(e.retry_after)})
+    except TooLong as e: return JSONResponse({'error':str(e)},status_code=422)
+    except DeadlineExceeded as e: return JSONResponse({'error':str(e)},status_code=504)
+    out,offsets=_assemble(req.sections,[tokens_to_midi(toks,m.vocab,m.inv) for toks in seqs])
+    for o,n,sv in zip(offsets,stats['tokens'],stats['saved']): o.update(tokens=n,tokens_saved=sv)
+    b64=await run_in_threadpool(_wav_b64,out)
+    return {'format':'wav','sample_rate':32000,'b64':b64,'offsets':offsets,'elapsed_ms':int((time.time()-t0)*1000)}
+
+@app.post('/v1/midi/compose_audio')
+async def compose_audio(req:ComposeReq,accept:str|None=Header(None)):
+    """compose_full 과 같은 디코드지만 base64/JSON 대신 오디오 바이너리를 청크로 스트리밍.
+    형식은 Accept 로 협상(audio/wav|audio/flac|audio/ogg=Opus 48kHz), 오프셋은 X-Offsets 헤더(JSON)."""
+    err=_check()
+    if err: return JSONResponse(err,status_code=503)
+    fmt=negotiate(accept)
+    if fmt is None: return JSONResponse({'error':'supported: '+', '.join(MEDIA_TYPES.values())},status_code=406)
+    t0=time.time(); m=model_pool.get_model(XML,VOCAB); a=_gen_args(req,m)
+    try: seqs,stats=await get_scheduler(XML,VOCAB).generate(a.pop('prompts'),timeout=req.timeout_s,**a)
+    except Overloaded as e: return JSONResponse({'error':str(e)},status_code=429,headers={'Retry-After':str(e.retry_after)})
+    except TooLong as e: return JSONResponse({'error':str(e)},status_code=422)
+    except DeadlineExceeded as e: return JSONResponse({'error':str(e)},status_code=504)
+    midis=[tokens_to_midi(toks,m.vocab,m.inv) for toks in seqs]; _,offsets=_assemble(req.sections,midis)
+    for o,n,sv in zip(offsets,stats['tokens'],stats['saved']): o.update(tokens=n,tokens_saved=sv)
+    sr=48000 if fmt=='opus' else 32000
+    def body():
+        # 섹션 단위로 렌더 -> Timeline 에 배치(앞 섹션 릴리스 꼬리 포함) -> 스트리밍 마스터링 -> 인코딩.
+        # 첫 바이트까지의 시간이 곡 길이가 아니라 첫 섹션 렌더 시간에 비례
+        import src.render.sf2_renderer as R
+        tl=Timeline([int(round(sr*s.duration)) for s in req.sections],tail=int(sr*RELEASE_TAIL_S))
+        enc=StreamEncoder(fmt,sr,1,frames=tl.total); chain=MasteringChain(sr)
+        for i,(midi,o) in enumerate(zip(midis,offsets)):
+            tl.place(i,R.render(_place(midi,o['scale'],0.0),sr=sr,normalize=False))
+            yield enc.write(chain.process(tl.slot(i)))
+        yield enc.write(chain.process(tl.tail_region()))
+        yield enc.write(chain.flush())
+        yield enc.close()
+    hdr={'X-Offsets':json.dumps(offsets,separators=(',',':')),'X-Sample-Rate':str(sr),'X-Decode-Ms':str(int((time.time()-t0)*1000))}
+    return StreamingResponse(body(),media_type=MEDIA_TYPES[fmt],headers=hdr)
+
+class StreamReq(ComposeReq):
+    audio:bool=False
+
+@app.post('/v1/midi/compose_stream')
+async def compose_stream(req:StreamReq):
+    """NDJSON 스트림: start -> note(샘플링되는 즉시, 섹션 기준 시각) ... -> done(섹션 오프셋/스케일) -> [audio].
+    note 의 start/end 는 섹션 내 원시 시각이고, 최종 배치 위치는 done 의 start + 시각*scale.
+    디코드는 compose_full 과 같은 스케줄러 큐를 거친다: 큐가 가득 차면 429, timeout_s 초과는 스트림 안의 error 줄."""
+    err=_check()
+    if err: return JSONResponse(err,status_code=503)
+    t0=time.time(); m=model_pool.get_model(XML,VOCAB); a=_gen_args(req,m); stats={}
+    try: steps=get_scheduler(XML,VOCAB).stream(a.pop('prompts'),timeout=req.timeout_s,stats=stats,**a)
+    except Overloaded as e: return JSONResponse({'error':str(e)},status_code=429,headers={'Retry-After':str(e.retry_after)})
+    except TooLong as e: return JSONResponse({'error':str(e)},status_code=422)
+    async def gen():
+        decs=[MidiEventDecoder(m.inv) for _ in req.sections]; evs=[[] for _ in req.sections]
+        yield json.dumps({'type':'start','sections':[s.name for s in req.sections]})+'\n'
+        try:
+            async for step in steps:
+                for r,t in step:
+                    for e in decs[r].feed(t):
+                        evs[r].append(e); yield json.dumps({'type':'note','section':req.sections[r].name,**e,'ms':int((time.time()-t0)*1000)})+'\n'
+        except DeadlineExceeded as e:
+            yield json.dumps({'type':'error','error':str(e),'status':504})+'\n'; return
+        finally: await steps.aclose()
+        out,offsets=_assemble(req.sections,[events_to_midi(e) for e in evs])
+        for o,n,sv in zip(offsets,stats['tokens'],stats['saved']): o.update(tokens=n,tokens_saved=sv)
+        yield json.dumps({'type':'done','offsets':offsets,'elapsed_ms':int((time.time()-t0)*1000)})+'\n'
+        if req.audio: yield json.dumps({'type':'audio','format':'wav','sample_rate':32000,'b64':await run_in_threadpool(_wav_b64,out)})+'\n'
+    return StreamingResponse(gen(),media_type='application/x-ndjson')
 
 @app.post('/v1/audio/musicgen')
 def musicgen(req:MGReq):
@@ -1,10 +1,77 @@
-import argparse,os,sys,subprocess
+import argparse,os,sys,shutil,subprocess
 
-def main(ckpt,out):
+# 사용: python -m src.export.export_ov --ckpt checkpoints/final --out exports/gpt_ov_int4 --weight-format int4
+# fp16 이외는 fp16 기준 export(<out>_fp16)를 만든 뒤 NNCF 로 압축/양자화하고 <out>/quant_report.json 에 비교 결과 기록
+# --buckets 128,256,512,1024 --batches 1,4: 캐시 없는 export 를 (배치, 길이) 정적 shape 로 reshape 해 <out>/static/ 와 <out>/buckets.json 에 기록
+#   (NPU 류 장치용. 서빙/벤치에는 buckets.json 경로를 xml 대신 넘김)
+
+def export_fp16(ckpt,out,task):
     os.makedirs(out,exist_ok=True)
-    cmd=[sys.executable,'-m','optimum.exporters.openvino',f'--model={ckpt}','--task=text-generation','--weight-format=fp16','--ov_config=PERFORMANCE_HINT=LATENCY',out]
+    cmd=[sys.executable,'-m','optimum.exporters.openvino',f'--model={ckpt}',f'--task={task}','--weight-format=fp16','--ov_config=PERFORMANCE_HINT=LATENCY',out]
     print('Running:',' '.join(cmd)); subprocess.run(cmd,check=True); print('Exported:',out)
 
+def _nncf():
+    try: import nncf
+    except ImportError: raise SystemExit('weight compression / quantization needs nncf: pip install nncf')
+    return nncf
+
+def compress(model,nncf,weight_format,quant_mode,calib,group_size=128,ratio=1.0,sym=False):
+    # weight_format: int8 | int4 (가중치만 압축, 활성값은 fp) / quant_mode=int8: 가중치+활성값 정적 INT8 (calibration 필수)
+    ds=nncf.Dataset(calib) if calib else None
+    if quant_mode=='int8':
+        if not calib: raise SystemExit('--quant-mode int8 needs calibration samples (--calib)')
+        # stateful 모델: 각 샘플이 beam_idx 로 시작하는 독립 prefill 이라 state 누적 없이 활성값 범위만 수집
+        return nncf.quantize(model,ds,model_type=nncf.ModelType.TRANSFORMER,subset_size=len(calib))
+    M=nncf.CompressWeightsMode
+    if weight_format=='int8': return nncf.compress_weights(model,mode=M.INT8_SYM if sym else M.INT8_ASYM)
+    # int4: ratio<1 이면 나머지 층은 int8 로 남김 — calibration 이 있으면 층 민감도로 선택 (data-aware)
+    return nncf.compress_weights(model,mode=M.INT4_SYM if sym else M.INT4_ASYM,group_size=group_size,ratio=ratio,dataset=ds)
+
+def write_buckets(out,seqs=(128,256,512,1024),batches=(1,)):
+    # 버킷마다 별도 IR (가중치도 버킷 수만큼 복제됨). 컴파일 결과는 런타임에서 OV_CACHE_DIR 로 캐시
+    import json,openvino as ov
+    src=ov.Core().read_model(f'{out}/openvino_model.xml'); names=[p.get_any_name() for p in src.inputs]
+    if any(n.startswith('past_key_values') or n=='beam_idx' for n in names): raise SystemExit('static buckets need a cache-less export (--task text-generation)')
+    os.makedirs(f'{out}/static',exist_ok=True); spec=[]
+    for B in sorted(set(batches)):
+        for L in sorted(set(seqs)):
+            m=src.clone(); m.reshape({n:ov.PartialShape([B,L]) for n in names}); x=f'static/b{B}_s{L}.xml'
+            ov.save_model(m,f'{out}/{x}',compress_to_fp16=False); spec.append({'batch':B,'seq':L,'xml':x})
+    json.dump({'source':'openvino_model.xml','buckets':spec},open(f'{out}/buckets.json','w',encoding='utf-8'),indent=2)
+    print('Static buckets:',f'{out}/buckets.json',' '.join(f"{b['batch']}x{b['seq']}" for b in spec))
+
+def main(ckpt,out,task='text-generation-with-past',weight_format='fp16',quant_mode=None,calib='data/processed/jsonl/train.jsonl',
+         calib_samples=128,val_samples=32,calib_len=256,group_size=128,ratio=1.0,sym=False,vocab='data/processed/vocab.json',report_tokens=128,
+         buckets=None,batches=(1,)):
+    if buckets and task!='text-generation': print('static buckets: exporting without KV cache (--task text-generation)'); task='text-generation'
+    if weight_format=='fp16' and not quant_mode:
+        export_fp16(ckpt,out,task)
+        if buckets: write_buckets(out,buckets,batches)
+        return
+    import json,openvino as ov
+    from src.inference.decode import cacheless_feed
+    from src.export.quant_report import sample_corpus,compare
+    nncf=_nncf(); ref=out.rstrip('/\\')+'_fp16'; export_fp16(ckpt,ref,task)
+    model=ov.Core().read_model(f'{ref}/openvino_model.xml'); bos=json.load(open(vocab,'r',encoding='utf-8')).get('<bos>',1) if os.path.exists(vocab) else 1
+    cal,val=sample_corpus(calib,calib_samples,val_samples,calib_len,bos) if calib and os.path.exists(calib) else ([],[])
+    needs=quant_mode=='int8' or (weight_format=='int4' and ratio<1)
+    items=[cacheless_feed(model,[s]) for s in cal] if needs else None
+    print(f'compress: weights={weight_format} quant={quant_mode or "-"} calib={len(items or [])} val={len(val)}')
+    q=compress(model,nncf,weight_format,quant_mode,items,group_size,ratio,sym)
+    os.makedirs(out,exist_ok=True)
+    for f in os.listdir(ref):  # tokenizer/config 등 보조 파일은 기준 export 와 동일
+        if not f.startswith('openvino_model.') and os.path.isfile(f'{ref}/{f}'): shutil.copy2(f'{ref}/{f}',f'{out}/{f}')
+    ov.save_model(q,f'{out}/openvino_model.xml',compress_to_fp16=False); print('Exported:',out)
+    if os.path.exists(vocab): compare(f'{ref}/openvino_model.xml',f'{out}/openvino_model.xml',vocab,val,report_tokens,out=f'{out}/quant_report.json')
+    if buckets: write_buckets(out,buckets,batches)
+
 if __name__=='__main__':
     ap=argparse.ArgumentParser(); ap.add_argument('--ckpt',required=True); ap.add_argument('--out',required=True)
-    a=ap.parse_args(); main(a.ckpt,a.out)
+    ap.add_argument('--task',default='text-generation-with-past',choices=['text-generation-with-past','text-generation'])  # with-past = KV 캐시(stateful) 증분 디코드
+    ap.add_argument('--weight-format',default='fp16',choices=['fp16','int8','int4']); ap.add_argument('--quant-mode',default=None,choices=['int8'],help='가중치+활성값 INT8 (calibration)')
+    ap.add_argument('--calib',default='data/processed/jsonl/train.jsonl'); ap.add_argument('--calib-samples',type=int,default=128); ap.add_argument('--val-samples',type=int,default=32)
+    ap.add_argument('--calib-len',type=int,default=256); ap.add_argument('--group-size',type=int,default=128); ap.add_argument('--ratio',type=float,default=1.0)
+    ap.add_argument('--sym',action='store_true'); ap.add_argument('--vocab',default='data/processed/vocab.json'); ap.add_argument('--report-tokens',type=int,default=128)
+    ints=lambda v:[int(x) for x in v.split(',') if x]
+    ap.add_argument('--buckets',type=ints,default=None,help='정적 시퀀스 길이 버킷, 예: 128,256,512,1024'); ap.add_argument('--batches',type=ints,default=[1],help='정적 배치 크기, 예: 1,4')
+    a=ap.parse_args(); main(a.ckpt,a.out,a.task,a.weight_format,a.quant_mode,a.calib,a.calib_samples,a.val_samples,a.calib_len,a.group_size,a.ratio,a.sym,a.vocab,a.report_tokens,a.buckets,a.batches)
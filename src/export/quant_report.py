@@ -0,0 +1,46 @@
+import os,json,random,numpy as np
+from src.inference.model_pool import get_model
+from src.inference.decode import cacheless_feed
+from src.inference.bench import bench_decode
+
+# fp16 기준 export 와 압축/양자화 export 비교: 크기, 첫 토큰 지연, 디코드 tok/s, 검증 perplexity 차이
+
+def sample_corpus(jsonl,n_calib,n_val,max_len=256,bos=1,seed=0):
+    # train.jsonl 을 한 번 훑으며 reservoir 샘플링 (파일 전체를 메모리에 올리지 않음), calibration/검증은 서로 겹치지 않게 분할
+    rng=random.Random(seed); k=n_calib+n_val; pool=[]
+    with open(jsonl,'r',encoding='utf-8') as f:
+        for i,line in enumerate(f):
+            if i<k: pool.append(line)
+            else:
+                j=rng.randint(0,i)
+                if j<k: pool[j]=line
+    seqs=[[bos]+json.loads(l)['tokens'][:max_len-1] for l in pool]; seqs=[s for s in seqs if len(s)>2]
+    return seqs[:n_calib],seqs[n_calib:]
+
+def perplexity(xml,vocab_path,seqs):
+    m=get_model(xml,vocab_path); nll=0.0; n=0
+    with m.request() as req:
+        for s in seqs:
+            if m.kind=='stateful': req.reset_state()
+            lg=np.asarray(req.infer(cacheless_feed(m.compiled,[s]))[m.logits][0,:-1],dtype=np.float64)
+            lg-=lg.max(-1,keepdims=True); lp=lg-np.log(np.exp(lg).sum(-1,keepdims=True))
+            nll-=lp[np.arange(len(s)-1),s[1:]].sum(); n+=len(s)-1
+    return float(np.exp(nll/max(n,1)))
+
+def model_mb(xml):
+    d=os.path.dirname(os.path.abspath(xml)); return sum(os.path.getsize(os.path.join(d,f)) for f in os.listdir(d) if f.endswith('.bin'))/2**20
+
+def compare(ref_xml,q_xml,vocab_path,val_seqs,n_tokens=128,out=None):
+    rows=[]; ms=[get_model(x,vocab_path) for x in (ref_xml,q_xml)]
+    for m in ms: m.warmup()  # 첫 추론 비용이 먼저 측정되는 쪽에만 실리지 않도록
+    for name,xml,m in zip(('fp16','quantized'),(ref_xml,q_xml),ms):
+        b=bench_decode(xml,vocab_path,n_tokens,modes=('kv',) if m.kind in ('past','stateful') else ('full',))[0]
+        rows.append({'model':name,'xml':xml,'size_mb':round(model_mb(xml),2),'first_ms':b['first_ms'],'tok_s':b['tok_s'],
+                     'ppl':round(perplexity(xml,vocab_path,val_seqs),4) if val_seqs else None})
+    ref,q=rows; rep={'rows':rows,'size_ratio':round(q['size_mb']/max(ref['size_mb'],1e-9),3),'speedup':round(q['tok_s']/max(ref['tok_s'],1e-9),3),
+                     'first_token_ratio':round(q['first_ms']/max(ref['first_ms'],1e-9),3),
+                     'ppl_gap_pct':round((q['ppl']/ref['ppl']-1)*100,3) if ref['ppl'] else None,'val_samples':len(val_seqs)}
+    for r in rows: print(f"{r['model']:>9}  size={r['size_mb']:>9.2f} MB  first={r['first_ms']:>8.2f} ms  {r['tok_s']:>8.1f} tok/s  ppl={r['ppl']}")
+    print(f"size x{rep['size_ratio']}  tok/s x{rep['speedup']}  ppl gap {rep['ppl_gap_pct']}%")
+    if out: json.dump(rep,open(out,'w',encoding='utf-8'),indent=2)
+    return rep
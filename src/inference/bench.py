@@ -0,0 +1,46 @@
+import argparse,time,numpy as np
+from src.inference.model_pool import get_model
+from src.inference.decode import make_stepper
+from src.inference.sampling import Sampler
+
+# 사용: python -m src.inference.bench decode --xml exports/gpt_ov/openvino_model.xml --vocab data/processed/vocab.json
+
+def bench_decode(xml,vocab_path,n_tokens=256,modes=('full','kv'),batch=1):
+    m=get_model(xml,vocab_path); rows=[]
+    for mode in modes:
+        if mode=='kv' and m.kind in ('full','static'): print(f'skip kv: {xml} has no cache inputs'); continue
+        with m.request() as req:
+            st=make_stepper(m,req,mode); t0=time.perf_counter(); lg=st.prefill(np.full((batch,1),m.bos,dtype=np.int64)); ttft=time.perf_counter()-t0
+            for _ in range(n_tokens-1): lg=st.step(lg.argmax(-1))  # EOS 무시: 두 경로가 같은 토큰 수를 디코드
+            dt=time.perf_counter()-t0
+        rows.append({'mode':mode,'kind':st.kind,'tokens':n_tokens*batch,'first_ms':round(ttft*1000,2),'tok_s':round(n_tokens*batch/dt,1)})
+    for r in rows: print(f"{r['mode']:>5} ({r['kind']:>8})  tokens={r['tokens']:<6} first={r['first_ms']:>8.2f} ms  {r['tok_s']:>9.1f} tok/s")
+    return rows
+
+def _legacy_top_p(logits,top_p=0.92):
+    # Sampler 도입 전 ov_generate 의 샘플링(전체 argsort + 전역 RNG) — 비교 기준
+    probs=np.exp(logits-logits.max()); probs/=probs.sum(); idxs=np.argsort(probs)[::-1]; c=np.cumsum(probs[idxs]); k=idxs[c<=top_p]; pool=k if len(k)>0 else idxs[:50]
+    return int(np.random.choice(pool,p=probs[pool]/probs[pool].sum()))
+
+def bench_sampling(vocab_sizes=(512,2048,8192,32000,128000),iters=200,top_p=0.92,batch=1,scale=8.0,seed=0):
+    # scale: logit 표준편차. 학습된 LM 은 분포가 뾰족(큰 scale)해 nucleus 가 작고, 작은 scale 은 평탄한 최악 경우
+    rng=np.random.default_rng(seed); sp=Sampler(top_p=top_p); rows=[]
+    for V in vocab_sizes:
+        lg=(rng.standard_normal((batch,V))*scale).astype(np.float32); rngs=[np.random.default_rng(i) for i in range(batch)]
+        t0=time.perf_counter()
+        for _ in range(iters): [_legacy_top_p(l,top_p) for l in lg]
+        t1=time.perf_counter()
+        for _ in range(iters): sp(lg,rngs)
+        t2=time.perf_counter(); a=(t1-t0)/iters*1e6; b=(t2-t1)/iters*1e6
+        rows.append({'vocab':V,'batch':batch,'scale':scale,'legacy_us':round(a,1),'sampler_us':round(b,1),'speedup':round(a/b,2)})
+    for r in rows: print(f"V={r['vocab']:<7} B={r['batch']:<3} scale={r['scale']:<4} legacy={r['legacy_us']:>9.1f} us  sampler={r['sampler_us']:>9.1f} us  x{r['speedup']}")
+    return rows
+
+if __name__=='__main__':
+    ap=argparse.ArgumentParser(); sp=ap.add_subparsers(dest='cmd',required=True)
+    d=sp.add_parser('decode'); d.add_argument('--xml',default='exports/gpt_ov/openvino_model.xml'); d.add_argument('--vocab',default='data/processed/vocab.json')
+    d.add_argument('--tokens',type=int,default=256); d.add_argument('--batch',type=int,default=1)
+    sm=sp.add_parser('sampling'); sm.add_argument('--iters',type=int,default=200); sm.add_argument('--batch',type=int,default=1); sm.add_argument('--top-p',type=float,default=0.92); sm.add_argument('--scale',type=float,default=8.0)
+    a=ap.parse_args()
+    if a.cmd=='decode': bench_decode(a.xml,a.vocab,a.tokens,batch=a.batch)
+    elif a.cmd=='sampling': bench_sampling(iters=a.iters,top_p=a.top_p,batch=a.batch,scale=a.scale)
@@ -0,0 +1,125 @@
+import numpy as np
+
+# 디코드 스텝 구현: 'full' = 매 스텝 전체 시퀀스 재입력(O(n²)), 'past' = past_key_values.* 명시 입력,
+# 'stateful' = optimum stateful export(beam_idx + 내부 state), 'static' = 정적 shape 버킷 모델(model_pool.BucketSet) 전체 재계산.
+# 모두 [B,n] 좌측 패딩 + attention mask 배치 지원
+
+def io_kind(compiled):
+    ins={n for p in compiled.inputs for n in p.get_names()}
+    if any(n.startswith('past_key_values') for n in ins): return 'past'
+    if 'beam_idx' in ins: return 'stateful'
+    return 'full'
+
+def past_specs(compiled):
+    # (입력명, 출력명, 빈 캐시 shape, seq 축, dtype) — optimum 규칙: past_key_values.N.key -> present.N.key
+    out=[]
+    for p in compiled.inputs:
+        n=next((x for x in p.get_names() if x.startswith('past_key_values')),None)
+        if n is None: continue
+        ps=p.get_partial_shape(); dyn=[i for i in range(1,len(ps)) if ps[i].is_dynamic]
+        out.append((n,n.replace('past_key_values','present'),[0 if d.is_dynamic else d.get_length() for d in ps],dyn[-1] if dyn else 2,p.get_element_type().to_dtype()))
+    return out
+
+def lpad(a,L,axis=1):
+    # 좌측 zero 패딩(마스크 0 과 짝을 이룸)으로 길이 L 에 맞춤
+    n=L-a.shape[axis]
+    if n<=0: return a
+    w=[(0,0)]*a.ndim; w[axis]=(n,0); return np.pad(a,w)
+
+def positions(mask): return np.maximum(np.cumsum(mask,1)-1,0).astype(np.int64)
+
+def cacheless_feed(model,ids):
+    # 캐시 없는 전체 시퀀스 1회 forward 입력 (calibration/perplexity 용). compiled/ov.Model 모두 가능, stateful 은 호출 전 reset_state()
+    ins={n for p in model.inputs for n in p.get_names()}; ids=np.asarray(ids,np.int64); mask=np.ones_like(ids); kind=io_kind(model)
+    f={'input_ids':ids} if 'input_ids' in ins else {0:ids}
+    if 'attention_mask' in ins: f['attention_mask']=mask
+    if 'position_ids' in ins: f['position_ids']=positions(mask)
+    if kind=='stateful': f['beam_idx']=np.arange(len(ids),dtype=np.int32)
+    if kind=='past': f.update({n:np.zeros([len(ids)]+shape[1:],dtype=dt) for n,_,shape,_,dt in past_specs(model)})
+    return f
+
+class FullSeq:
+    kind='full'
+    def __init__(s,m,req): s.m=m; s.req=req; s.ids=None; s.mask=None; s.specs=past_specs(m.compiled) if m.kind=='past' else []
+    def _feed(s,ids,mask,pos):
+        f={'input_ids':ids} if 'input_ids' in s.m.inputs else {0:ids}
+        if 'attention_mask' in s.m.inputs: f['attention_mask']=mask
+        if 'position_ids' in s.m.inputs: f['position_ids']=pos
+        return f
+    def _empty(s,b): return {n:np.zeros([b]+shape[1:],dtype=dt) for n,_,shape,_,dt in s.specs}
+    def _run(s,f):
+        # KV 입력이 있는 모델도 캐시 없이(빈 past / state 초기화) 전체 재계산 가능 — 비교·폴백용
+        if s.m.kind=='past': f.update(s._empty(len(s.ids)))
+        elif s.m.kind=='stateful': s.req.reset_state(); f['beam_idx']=np.arange(len(s.ids),dtype=np.int32)
+        return s.req.infer(f)
+    def _logits(s,out): return np.asarray(out[s.m.logits][:,-1],dtype=np.float32)
+    def prefill(s,ids,mask=None):
+        s.ids=np.asarray(ids,np.int64); s.mask=np.ones_like(s.ids) if mask is None else np.asarray(mask,np.int64)
+        return s._logits(s._run(s._feed(s.ids,s.mask,positions(s.mask))))
+    def step(s,toks):
+        t=np.asarray(toks,np.int64).reshape(-1,1); s.ids=np.concatenate([s.ids,t],1); s.mask=np.concatenate([s.mask,np.ones_like(t)],1)
+        return s._logits(s._run(s._feed(s.ids,s.mask,positions(s.mask))))
+    def keep(s,rows): s.ids=s.ids[rows]; s.mask=s.mask[rows]
+    # 디코드 도중 새 행 합류(continuous batching): 새 행만 따로 prefill 한 뒤 좌측 패딩으로 길이를 맞춰 병합
+    can_admit=True
+    def admit(s,ids,mask=None):
+        t=type(s)(s.m,s.req); lg=t.prefill(ids,mask); s._merge(t); return lg
+    def _merge(s,t):
+        L=max(s.mask.shape[1],t.mask.shape[1]); s.ids=np.concatenate([lpad(s.ids,L),lpad(t.ids,L)]); s.mask=np.concatenate([lpad(s.mask,L),lpad(t.mask,L)])
+
+class Stateful(FullSeq):
+    kind='stateful'
+    def prefill(s,ids,mask=None):
+        s.req.reset_state(); ids=np.asarray(ids,np.int64); s.mask=np.ones_like(ids) if mask is None else np.asarray(mask,np.int64)
+        s.beam=np.arange(len(ids),dtype=np.int32)
+        return s._logits(s.req.infer(s._feed(ids,s.mask,positions(s.mask))))
+    def _feed(s,ids,mask,pos):
+        f=FullSeq._feed(s,ids,mask,pos); f['beam_idx']=s.beam; return f
+    def step(s,toks):
+        t=np.asarray(toks,np.int64).reshape(-1,1); s.mask=np.concatenate([s.mask,np.ones_like(t)],1)
+        out=s.req.infer(s._feed(t,s.mask,positions(s.mask)[:,-1:])); s.beam=np.arange(len(t),dtype=np.int32)
+        return s._logits(out)
+    # 내부 state 는 다음 infer 때 beam_idx 로 gather 되므로 살아남은 행 인덱스만 기억
+    def keep(s,rows): s.mask=s.mask[rows]; s.beam=s.beam[rows]
+    can_admit=False  # 장치 내부 state 는 행 단위로 합칠 수 없음 -> 배치가 비었을 때만 새 prefill
+
+class ExplicitPast(FullSeq):
+    kind='past'
+    def _go(s,ids,pos):
+        f=s._feed(ids,s.mask,pos); f.update(s.past); out=s.req.infer(f)
+        s.past={n:np.array(out[o]) for n,o,_,_,_ in s.specs}  # 출력 텐서는 다음 infer 에서 재사용되므로 복사
+        return s._logits(out)
+    def prefill(s,ids,mask=None):
+        ids=np.asarray(ids,np.int64); s.mask=np.ones_like(ids) if mask is None else np.asarray(mask,np.int64)
+        s.past=s._empty(len(ids)); return s._go(ids,positions(s.mask))
+    def step(s,toks):
+        t=np.asarray(toks,np.int64).reshape(-1,1); s.mask=np.concatenate([s.mask,np.ones_like(t)],1)
+        return s._go(t,positions(s.mask)[:,-1:])
+    def keep(s,rows): s.mask=s.mask[rows]; s.past={k:v[rows] for k,v in s.past.items()}
+    def _merge(s,t):
+        L=max(s.mask.shape[1],t.mask.shape[1]); s.mask=np.concatenate([lpad(s.mask,L),lpad(t.mask,L)])
+        s.past={n:np.concatenate([lpad(s.past[n],L,ax),lpad(t.past[n],L,ax)]) for n,_,_,ax,_ in s.specs}
+
+class StaticSeq(FullSeq):
+    kind='static'
+    # 매 스텝 (행 수, 길이) 를 담는 가장 작은 버킷으로 좌측 패딩(mask 0)해 재계산 -> 장치는 고정 shape 만 보므로 재컴파일/동적 경로 없음.
+    # req 는 BucketSet.request() 가 준 버킷별 request 묶음, 최대 버킷 배치보다 많은 행은 나눠서 추론
+    def _run(s,f):
+        b,n=s.ids.shape; B,L,bm=s.m.pick(b,n); out=[]
+        for i in range(0,b,B):
+            ids=lpad(s.ids[i:i+B],L); mask=lpad(s.mask[i:i+B],L); k=len(ids)
+            if k<B: ids=np.concatenate([ids,np.repeat(ids[:1],B-k,0)]); mask=np.concatenate([mask,np.repeat(mask[:1],B-k,0)])  # 빈 배치 슬롯은 첫 행 복제(전부 마스크된 행 회피), 결과는 버림
+            out.append(np.asarray(s.req.get(bm).infer(s._feed(ids,mask,positions(mask)))[bm.logits][:k,-1],dtype=np.float32))
+        return np.concatenate(out)
+    def _logits(s,lg): return lg
+
+STEPPERS={'full':FullSeq,'stateful':Stateful,'past':ExplicitPast,'static':StaticSeq}
+
+def make_stepper(m,req,mode='auto'):
+    # mode: 'auto'(모델이 지원하면 KV 캐시), 'kv'(KV 필수), 'full'(전체 재계산)
+    if m.kind=='static':
+        if mode=='kv': raise ValueError(f'{m.xml} is a static-shape bucket set without cache inputs')
+        return StaticSeq(m,req)
+    if mode=='full': return FullSeq(m,req)
+    if mode=='kv' and m.kind=='full': raise ValueError(f'{m.xml} was exported without cache inputs (use --task text-generation-with-past)')
+    return STEPPERS[m.kind](m,req)
@@ -0,0 +1,37 @@
+import numpy as np
+
+# midi_to_events 이벤트 문법: ... INST_p CH_c (NOTE_x DUR_d VEL_v)* INST_END ...
+# 상태별 허용 토큰 마스크를 vocab 에서 한 번 만들어 두고, 샘플링 전에 logits 에 적용한다.
+FREE,AFTER_INST,AFTER_NOTE,AFTER_DUR=range(4)
+OTHER,NOTE,DUR,VEL,INST,CH,SPECIAL=range(7)
+
+def token_class(tok):
+    if tok in ('<pad>','<bos>','<unk>'): return SPECIAL
+    if tok.startswith('NOTE_'): return NOTE
+    if tok.startswith('DUR_'): return DUR
+    if tok.startswith('VEL_'): return VEL
+    if tok.startswith('CH_'): return CH
+    if tok.startswith('INST_') and tok!='INST_END': return INST
+    return OTHER
+
+class EventGrammar:
+    def __init__(s,vocab,size=None):
+        V=size or max(vocab.values())+1; s.cls=np.full(V,SPECIAL,dtype=np.int8)  # vocab 밖 id(모델 패딩)는 금지
+        for t,i in vocab.items():
+            if i<V: s.cls[i]=token_class(t)
+        s.next=np.array([FREE,AFTER_NOTE,AFTER_DUR,FREE,AFTER_INST,FREE,FREE],dtype=np.int8)  # 토큰 class -> 다음 상태
+        free=~np.isin(s.cls,(DUR,VEL,CH,SPECIAL)); has_ch=(s.cls==CH).any()
+        s.masks=np.stack([free,(s.cls==CH) if has_ch else free,s.cls==DUR,s.cls==VEL])
+    def state_after(s,seq):
+        st=FREE
+        for t in seq: st=s.next[s.cls[t]] if t<len(s.cls) else FREE
+        return int(st)
+    def mask(s,states): return s.masks[np.asarray(states)]
+    def advance(s,states,toks): return s.next[s.cls[np.asarray(toks)]]
+
+_CACHE={}
+def grammar_for(m,V):
+    # 모델(vocab)·logits 폭 당 1회 생성
+    k=(id(m),V); g=_CACHE.get(k)
+    if g is None: g=_CACHE[k]=EventGrammar(m.vocab,V)
+    return g
@@ -0,0 +1,120 @@
+import os,json,time,queue,threading,contextlib,numpy as np,openvino as ov
+from src.inference.decode import io_kind,make_stepper
+
+# 프로세스 전역 컴파일 모델 레지스트리: (xml, device, config) 당 1회 컴파일 + infer request 풀
+_CORE=None; _LOCK=threading.Lock(); _MODELS={}; _STATE={'warming':False,'error':None}
+
+def core():
+    global _CORE
+    if _CORE is None:
+        c=ov.Core(); cd=os.environ.get('OV_CACHE_DIR')
+        if cd: os.makedirs(cd,exist_ok=True); c.set_property({'CACHE_DIR':cd})
+        _CORE=c
+    return _CORE
+
+def load_vocab(p):
+    with open(p,'r',encoding='utf-8') as f: return json.load(f)
+
+class PooledModel:
+    def __init__(s,xml,vocab_path,device,config,n_req=None):
+        t0=time.perf_counter(); s.xml=xml; s.device=device; s.config=dict(config)
+        s.compiled=core().compile_model(xml,device_name=device,config=s.config)
+        s.compile_ms=int((time.perf_counter()-t0)*1000)
+        s.inputs={n for p in s.compiled.inputs for n in p.get_names()}; s.kind=io_kind(s.compiled)
+        s.logits='logits' if any('logits' in o.get_names() for o in s.compiled.outputs) else 0
+        s.vocab=load_vocab(vocab_path); s.inv={v:k for k,v in s.vocab.items()}
+        s.bos=s.vocab.get('<bos>',1); s.eos=s.vocab.get('<eos>',2); s.pad=s.vocab.get('<pad>',0)
+        s.n_req=n_req or _n_requests(s.compiled); s.pool=queue.Queue(); s.warm=False; s.capacity=_capacity(xml,s.compiled)
+        for _ in range(s.n_req): s.pool.put(s.compiled.create_infer_request())
+    @contextlib.contextmanager
+    def request(s,timeout=None):
+        r=s.pool.get(timeout=timeout)
+        try: yield r
+        finally: s.pool.put(r)
+    def warmup(s):
+        # 첫 추론에서 발생하는 지연(커널 선택/메모리 할당)을 기동 시점으로 당김
+        with s.request() as r: make_stepper(s,r).prefill(np.array([[s.bos]],dtype=np.int64))
+        s.warm=True
+    def status(s): return {'xml':s.xml,'device':s.device,'kind':s.kind,'requests':s.n_req,'idle':s.pool.qsize(),'compile_ms':s.compile_ms,'warm':s.warm,'capacity':s.capacity}
+
+class _BucketRequests:
+    # 버킷별 infer request 를 처음 쓸 때 빌려 두었다가 묶음째 반납
+    def __init__(s,timeout): s.timeout=timeout; s.stack=contextlib.ExitStack(); s.reqs={}
+    def get(s,bm):
+        r=s.reqs.get(bm.xml)
+        if r is None: r=s.reqs[bm.xml]=s.stack.enter_context(bm.request(s.timeout))
+        return r
+
+class BucketSet:
+    """export_ov --buckets 가 쓴 buckets.json: (배치, 길이) 정적 shape 모델 묶음. 버킷마다 PooledModel 1개를 전부 컴파일
+    (OV_CACHE_DIR 이 있으면 두 번째 기동부터 캐시에서 로드). PooledModel 과 같은 인터페이스, 디코드는 decode.StaticSeq."""
+    kind='static'
+    def __init__(s,manifest,vocab_path,device,config):
+        t0=time.perf_counter(); s.xml=manifest; s.device=device; s.config=dict(config); root=os.path.dirname(os.path.abspath(manifest))
+        with open(manifest,'r',encoding='utf-8') as f: spec=json.load(f)
+        s.buckets=[(b['seq'],b['batch'],PooledModel(os.path.join(root,b['xml']),vocab_path,device,config)) for b in sorted(spec['buckets'],key=lambda b:(b['seq'],b['batch']))]
+        m=s.buckets[0][2]; s.compile_ms=int((time.perf_counter()-t0)*1000)
+        s.inputs=m.inputs; s.logits=m.logits; s.vocab=m.vocab; s.inv=m.inv; s.bos=m.bos; s.eos=m.eos; s.pad=m.pad
+        s.n_req=min(bm.n_req for _,_,bm in s.buckets); s.max_seq=s.buckets[-1][0]; s.warm=False; s.capacity=s.max_seq
+    def pick(s,b,n):
+        # n 이상인 가장 짧은 길이 중 b 행을 담는 가장 작은 배치 (없으면 그 길이의 최대 배치로 나눠 추론)
+        fit=[x for x in s.buckets if x[0]>=n]
+        if not fit: raise ValueError(f'sequence length {n} exceeds the largest static bucket ({s.max_seq})')
+        same=[x for x in fit if x[0]==fit[0][0]]
+        L,B,bm=next((x for x in same if x[1]>=b),same[-1]); return B,L,bm
+    @contextlib.contextmanager
+    def request(s,timeout=None):
+        rq=_BucketRequests(timeout)
+        with rq.stack: yield rq
+    def warmup(s):
+        with s.request() as r:
+            st=make_stepper(s,r)
+            for L,B,_ in s.buckets: st.prefill(np.full((B,L),s.bos,dtype=np.int64))
+        s.warm=True
+    def status(s):
+        return {'xml':s.xml,'device':s.device,'kind':s.kind,'requests':s.n_req,'idle':min(bm.pool.qsize() for _,_,bm in s.buckets),
+                'compile_ms':s.compile_ms,'warm':s.warm,'capacity':s.capacity,'buckets':[f'{B}x{L}' for L,B,_ in s.buckets]}
+
+def _capacity(xml,compiled):
+    # 한 행이 가질 수 있는 최대 시퀀스 길이: 정적 seq 축 또는 export 옆 config.json 의 n_positions (모르면 None)
+    ps=next((p.get_partial_shape() for p in compiled.inputs if 'input_ids' in p.get_names()),None)
+    if ps is not None and len(ps)>1 and ps[1].is_static: return ps[1].get_length()
+    for d in (os.path.dirname(os.path.abspath(xml)),os.path.dirname(os.path.dirname(os.path.abspath(xml)))):
+        try:
+            with open(os.path.join(d,'config.json'),'r',encoding='utf-8') as f: cfg=json.load(f)
+        except (OSError,ValueError): continue
+        n=cfg.get('n_positions') or cfg.get('max_position_embeddings')
+        if n: return int(n)
+    return None
+
+def _n_requests(compiled):
+    n=os.environ.get('OV_NUM_REQUESTS')
+    if n: return max(1,int(n))
+    try: return max(1,min(int(compiled.get_property('OPTIMAL_NUMBER_OF_INFER_REQUESTS')),8))
+    except Exception: return 1
+
+def _config():
+    return {'PERFORMANCE_HINT':os.environ.get('OV_PERF_HINT','LATENCY')}
+
+def get_model(xml,vocab_path,device=None,config=None):
+    dev=device or os.environ.get('OV_DEVICE','AUTO'); cfg=_config() if config is None else config
+    k=(os.path.abspath(xml),os.path.abspath(vocab_path),dev,tuple(sorted(cfg.items())))
+    m=_MODELS.get(k)
+    if m is None:
+        with _LOCK:
+            m=_MODELS.get(k)
+            if m is None: m=_MODELS[k]=(BucketSet if xml.endswith('.json') else PooledModel)(xml,vocab_path,dev,cfg)
+    return m
+
+def warmup(xml,vocab_path,device=None,config=None):
+    _STATE['warming']=True; _STATE['error']=None
+    try: m=get_model(xml,vocab_path,device,config); m.warmup(); return m
+    except Exception as e: _STATE['error']=str(e); raise
+    finally: _STATE['warming']=False
+
+def status():
+    ms=[m.status() for m in list(_MODELS.values())]
+    return {'ready':bool(ms) and all(m['warm'] for m in ms) and not _STATE['warming'],'warming':_STATE['warming'],'error':_STATE['error'],'models':ms}
+
+def clear():
+    with _LOCK: _MODELS.clear()
@@ -1,36 +1,81 @@
-import os,json,numpy as np,pretty_midi as pm,openvino as ov
+import os,numpy as np,pretty_midi as pm
 from src.render.instrument_map import GM_PROGRAM
+from src.tokenizers.skytnt import section_prefix
+from src.inference.model_pool import get_model
+from src.inference.decode import make_stepper
+from src.inference.sampling import Sampler
+from src.inference.grammar import grammar_for
 
-def tokens_to_midi(tokens,vocab):
-    inv={v:k for k,v in vocab.items()}; m=pm.PrettyMIDI()
-    tracks={'lead': pm.Instrument(program=GM_PROGRAM['gtr_dist'], name='lead'),
-            'bass': pm.Instrument(program=GM_PROGRAM['bass_finger'], name='bass'),
-            'koto': pm.Instrument(program=GM_PROGRAM['koto'], name='koto')}
-    i=0; t=0.0; cur=tracks['lead']
-    while i<len(tokens):
-        tok=inv.get(tokens[i],'')
-        if tok.startswith('INST_'):
-            pid=int(tok.split('_')[1])
-            cur = tracks['bass'] if pid in (GM_PROGRAM['bass_finger'],GM_PROGRAM['bass_pick']) else (tracks['koto'] if pid==GM_PROGRAM['koto'] else tracks['lead'])
-            i+=1; continue
-        if tok.startswith('NOTE_') and i+2<len(tokens):
-            p=int(tok.split('_')[1]); dur=inv.get(tokens[i+1],''); vel=inv.get(tokens[i+2],'')
-            if dur.startswith('DUR_') and vel.startswith('VEL_'):
-                d=int(dur.split('_')[1])/960.0; v=int(vel.split('_')[1])
-                cur.notes.append(pm.Note(velocity=v,pitch=p,start=t,end=t+d)); t+=d; i+=3; continue
-        i+=1
+TRACKS={'lead':GM_PROGRAM['gtr_dist'],'bass':GM_PROGRAM['bass_finger'],'koto':GM_PROGRAM['koto']}
+
+def _track_for(pid):
+    return 'bass' if pid in (GM_PROGRAM['bass_finger'],GM_PROGRAM['bass_pick']) else ('koto' if pid==GM_PROGRAM['koto'] else 'lead')
+
+class MidiEventDecoder:
+    """tokens_to_midi 의 증분 버전. feed(토큰 id) 마다 완성된 노트 이벤트 리스트를 돌려준다.
+    NOTE_ DUR_ VEL_ 3토큰이 연속으로 모일 때만 노트가 되고, 깨진 조각은 버린 뒤 현재 토큰부터 다시 해석."""
+    def __init__(s,inv): s.inv=inv; s.t=0.0; s.track='lead'; s.pend=[]
+    def feed(s,tid):
+        tok=s.inv.get(tid,'')
+        if s.pend:
+            if len(s.pend)==1 and tok.startswith('DUR_'): s.pend.append(tok); return []
+            if len(s.pend)==2 and tok.startswith('VEL_'):
+                p=int(s.pend[0].split('_')[1]); d=int(s.pend[1].split('_')[1])/960.0; v=int(tok.split('_')[1])
+                ev={'track':s.track,'pitch':p,'velocity':v,'start':s.t,'end':s.t+d}; s.t+=d; s.pend=[]; return [ev]
+            s.pend=[]
+        if tok.startswith('INST_') and tok!='INST_END': s.track=_track_for(int(tok.split('_')[1]))
+        elif tok.startswith('NOTE_'): s.pend=[tok]
+        return []
+
+def events_to_midi(events):
+    m=pm.PrettyMIDI(); tracks={k:pm.Instrument(program=p,name=k) for k,p in TRACKS.items()}
+    for e in events: tracks[e['track']].notes.append(pm.Note(velocity=e['velocity'],pitch=e['pitch'],start=e['start'],end=e['end']))
     for tr in tracks.values():
         if tr.notes: m.instruments.append(tr)
     return m
 
-def ov_generate(xml,vocab_path,max_tokens=512,top_p=0.92):
-    core=ov.Core(); dev=os.environ.get('OV_DEVICE','AUTO'); model=core.compile_model(xml,device_name=dev)
-    vocab=json.load(open(vocab_path,'r')); bos=vocab.get('<bos>',1); eos=vocab.get('<eos>',2)
-    seq=[bos]; req=model.create_infer_request()
-    for _ in range(max_tokens):
-        out=req.infer({0:np.array([seq],dtype=np.int64)}); logits=list(out.values())[0][0,-1]
-        probs=np.exp(logits-logits.max()); probs/=probs.sum(); idxs=np.argsort(probs)[::-1]; c=np.cumsum(probs[idxs]); k=idxs[c<=top_p]; pool=k if len(k)>0 else idxs[:50]
-        nxt=int(np.random.choice(pool,p=probs[pool]/probs[pool].sum()))
-        if nxt==eos: break
-        seq.append(nxt)
-    return seq, json.load(open(vocab_path,'r'))
+def tokens_to_midi(tokens,vocab,inv=None):
+    d=MidiEventDecoder(inv or {v:k for k,v in vocab.items()})
+    return events_to_midi([e for t in tokens for e in d.feed(t)])
+
+def section_prompt(vocab,name,bpm,key):
+    # 학습 샘플 앞머리(section_prefix)와 같은 조건 토큰. vocab 에 없는 토큰은 <unk> 대신 생략
+    return [vocab.get('<bos>',1)]+[vocab[t] for t in section_prefix(name,bpm,key) if t in vocab]
+
+def ov_generate(xml,vocab_path,max_tokens=512,top_p=0.92,mode=None,seed=None,constrained=False,stats=None,**sampling):
+    seqs,vocab=ov_generate_batch(xml,vocab_path,[[]],max_tokens,top_p,None if seed is None else [seed],mode,constrained,stats,**sampling)
+    return seqs[0], vocab
+
+def ov_generate_batch(xml,vocab_path,prompts,max_tokens=512,top_p=0.92,seeds=None,mode=None,constrained=False,stats=None,**sampling):
+    """prompts(섹션/곡별 토큰 id 리스트)를 좌측 패딩 + attention mask 배치로 한 번에 디코드.
+    행마다 자기 seed 의 RNG 를 쓰고, EOS 를 뽑은 행은 배치에서 빠져 남은 행만 계속 진행.
+    constrained=True 면 이벤트 문법 마스크로 tokens_to_midi 가 버릴 토큰을 애초에 뽑지 않는다.
+    stats(dict)를 주면 행별 'tokens'(생성 토큰 수)와 'saved'(무제약 샘플링 대비 기대 절약 토큰 수)를 채운다."""
+    m=get_model(xml,vocab_path); seqs=[list(p) or [m.bos] for p in prompts]
+    for step in ov_stream_batch(xml,vocab_path,prompts,max_tokens,top_p,seeds,mode,constrained,stats,**sampling):
+        for r,t in step: seqs[r].append(t)
+    return seqs, m.vocab
+
+def ov_stream_batch(xml,vocab_path,prompts,max_tokens=512,top_p=0.92,seeds=None,mode=None,constrained=False,stats=None,**sampling):
+    """ov_generate_batch 의 제너레이터 버전: 스텝마다 새로 뽑힌 [(행, 토큰 id), ...] 를 yield (EOS 제외).
+    끝까지 소비하거나 close() 해야 infer request 가 풀로 돌아간다."""
+    m=get_model(xml,vocab_path); n=len(prompts); seeds=seeds if seeds is not None else [None]*n
+    rngs=[np.random.default_rng(sd) for sd in seeds]; sp=Sampler(top_p=top_p,**sampling); seqs=[list(p) or [m.bos] for p in prompts]
+    L=max(len(q) for q in seqs); ids=np.full((n,L),m.pad,dtype=np.int64); mask=np.zeros((n,L),dtype=np.int64)
+    for r,q in enumerate(seqs): ids[r,L-len(q):]=q; mask[r,L-len(q):]=1
+    alive=list(range(n)); g=None; saved=np.zeros(n); plen=[len(q) for q in seqs]
+    with m.request() as req:
+        st=make_stepper(m,req,mode or os.environ.get('OV_DECODE','auto')); logits=st.prefill(ids,mask)
+        if constrained: g=grammar_for(m,logits.shape[1]); gs=np.array([g.state_after(q) for q in seqs],dtype=np.int8)
+        for i in range(max_tokens):
+            nxt=sp(logits,[rngs[r] for r in alive],[seqs[r] for r in alive],g.mask(gs) if g else None).tolist()
+            if g: saved[alive]+=sp.invalid; gs=g.advance(gs,nxt)
+            keep=[j for j,t in enumerate(nxt) if t!=m.eos]
+            for j in keep: seqs[alive[j]].append(nxt[j])
+            yield [(alive[j],nxt[j]) for j in keep]
+            if not keep or i==max_tokens-1: break
+            if len(keep)<len(alive):
+                st.keep(keep); alive=[alive[j] for j in keep]; nxt=[nxt[j] for j in keep]
+                if g: gs=gs[keep]
+            logits=st.step(nxt)
+    if stats is not None: stats.update(tokens=[len(q)-l for q,l in zip(seqs,plen)],saved=[round(float(x),2) for x in saved])
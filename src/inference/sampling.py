@@ -0,0 +1,48 @@
+import numpy as np
+
+class Sampler:
+    """배치 logits [B,V] -> 다음 토큰 [B]. temperature / top-k / top-p(nucleus) / min-p / repetition penalty.
+    전체 정렬 대신 argpartition 으로 상위 k0 후보만 정렬하고(누적확률이 top_p 에 못 미치는 행이 있으면 전체 정렬로 폴백,
+    분포가 평탄한 동안은 다음 스텝도 바로 전체 정렬),
+    작업 버퍼는 (B,V) 크기로 한 번 잡아 재사용한다. rng 는 행별 np.random.Generator (요청 간 결정성 보장).
+    mask([B,V] bool, 문법 제약)를 주면 허용 토큰만 뽑고, 제약이 없었다면 금지 토큰에 갔을 확률을 s.invalid 에 남긴다."""
+    def __init__(s,temperature=1.0,top_k=0,top_p=1.0,min_p=0.0,repetition_penalty=1.0,rep_window=64,k0=64):
+        s.t=float(temperature); s.top_k=int(top_k); s.top_p=float(top_p); s.min_p=float(min_p)
+        s.rp=float(repetition_penalty); s.rep_window=rep_window; s.k0=k0; s.k_hint=k0; s.x=s.e=None; s.invalid=None
+    def _bufs(s,B,V):
+        if s.x is None or s.x.shape[0]<B or s.x.shape[1]!=V: s.x=np.empty((B,V),np.float32); s.e=np.empty((B,V),np.float32)
+        return s.x[:B],s.e[:B]
+    def _penalize(s,x,history):
+        # CTRL 방식: 최근 rep_window 토큰의 양수 logit 은 나누고 음수 logit 은 곱한다
+        for r,h in enumerate(history):
+            if not len(h): continue
+            h=np.asarray(h[-s.rep_window:] if s.rep_window else h,dtype=np.int64); v=x[r,h]
+            x[r,h]=np.where(v>0,v/s.rp,v*s.rp)
+    def __call__(s,logits,rngs,history=None,mask=None):
+        logits=np.asarray(logits); B,V=logits.shape; x,e=s._bufs(B,V); np.copyto(x,logits,casting='unsafe')
+        if s.rp!=1.0 and history is not None: s._penalize(x,history)
+        if s.t<=0:
+            if mask is not None: s.invalid=(~mask[np.arange(B),x.argmax(1)]).astype(np.float64); x[~mask]=-np.inf
+            return x.argmax(1)
+        if s.t!=1.0: x*=1.0/s.t
+        if mask is not None:
+            ma=x.max(1,keepdims=True); np.subtract(x,ma,out=e); np.exp(e,out=e); za=np.log(e.sum(1,keepdims=True))+ma; x[~mask]=-np.inf
+        mx=x.max(1,keepdims=True); np.subtract(x,mx,out=e); np.exp(e,out=e); Z=e.sum(1,keepdims=True)
+        if mask is not None: s.invalid=(1.0-np.exp(np.log(Z)+mx-za))[:,0]
+        rows=np.arange(B)[:,None]; k=V if (s.top_k<=0 and s.top_p>=1.0) else min(V,s.top_k if s.top_k>0 else s.k_hint)
+        while True:
+            if k<V: idx=np.argpartition(e,V-k,axis=1)[:,V-k:]; p=e[rows,idx]; o=np.argsort(-p,axis=1); idx=idx[rows,o]; p=p[rows,o]
+            else: idx=np.argsort(-e,axis=1); p=np.take_along_axis(e,idx,1)
+            p/=Z; c=np.cumsum(p,1)
+            if s.top_k>0 or k>=V or s.top_p>=1.0 or (c[:,-1]>=s.top_p).all(): break
+            k=s.k_hint=V
+        keep=np.ones_like(p,dtype=bool)
+        if s.top_p<1.0:
+            keep&=(c-p)<s.top_p  # 임계값을 넘기는 토큰까지 포함 -> 항상 최소 1개
+            if s.k_hint>s.k0 and keep.sum(1).max()<=s.k0: s.k_hint=s.k0
+        if s.min_p>0.0: keep&=p>=s.min_p*p[:,:1]
+        w=np.where(keep,p,0.0); c=np.cumsum(w,1)
+        if not isinstance(rngs,(list,tuple)): rngs=[rngs]*B
+        u=np.array([g.random() for g in rngs])*c[:,-1]
+        j=np.minimum((c<u[:,None]).sum(1),k-1)
+        return idx[np.arange(B),j].astype(np.int64)
@@ -0,0 +1,164 @@
+import os,math,time,asyncio,threading,collections,numpy as np
+from src.inference.model_pool import get_model
+from src.inference.decode import make_stepper
+from src.inference.sampling import Sampler
+from src.inference.grammar import grammar_for
+
+# continuous batching: 요청들의 행(섹션)을 하나의 디코드 배치에 합치고, 스텝 사이마다 새 행을 합류시킨다.
+# 장치 하나를 여러 요청이 각자 루프로 다투지 않도록 디코드는 전용 스레드 하나가 전담한다.
+
+class Overloaded(Exception):
+    def __init__(s,retry_after): super().__init__(f'queue full, retry after {retry_after}s'); s.retry_after=retry_after
+
+class DeadlineExceeded(Exception): pass
+
+class TooLong(ValueError):
+    # 프롬프트+max_tokens 가 모델 위치 수(정적 버킷이면 최대 버킷)를 넘음: 배치 전체를 깨뜨리지 않도록 큐에 넣기 전에 거절
+    def __init__(s,need,capacity): super().__init__(f'prompt + max_tokens = {need} exceeds the model capacity of {capacity} tokens'); s.need=need; s.capacity=capacity
+
+class _Row:
+    __slots__=('prompt','seq','max_tokens','deadline','rng','sp','constrained','gs','saved','done','loop','fut','t0','idx','q')
+    def __init__(s,prompt,max_tokens,deadline,seed,constrained,sampling,loop,fut,idx=0,q=None):
+        s.prompt=prompt; s.seq=list(prompt); s.max_tokens=max_tokens; s.deadline=deadline; s.rng=np.random.default_rng(seed)
+        s.sp=Sampler(**sampling); s.constrained=constrained; s.gs=0; s.saved=0.0; s.done=False; s.loop=loop; s.fut=fut; s.t0=None
+        s.idx=idx; s.q=q  # q: 스트리밍 요청이면 (행 번호, 토큰) 을 흘려보낼 요청 쪽 asyncio.Queue, 끝나면 (행 번호, None)
+
+class Scheduler:
+    def __init__(s,xml,vocab_path,max_batch=None,max_queue=None,mode=None):
+        s.xml=xml; s.vocab_path=vocab_path; s.mode=mode or os.environ.get('OV_DECODE','auto')
+        s.max_batch=max_batch or int(os.environ.get('SCHED_MAX_BATCH',8)); s.max_queue=max_queue or int(os.environ.get('SCHED_MAX_QUEUE',64))
+        s.pending=collections.deque(); s.cv=threading.Condition(); s.row_s=1.0; s.rows=[]; s.thread=None
+    def start(s):
+        if s.thread is None: s.thread=threading.Thread(target=s._loop,name='ov-scheduler',daemon=True); s.thread.start()
+        return s
+    def status(s): return {'active':len(s.rows),'queued':len(s.pending),'max_batch':s.max_batch,'max_queue':s.max_queue}
+    def retry_after(s):
+        # 대기 행들이 현재 평균 행 처리 시간으로 빠지는 데 걸릴 대략의 시간
+        return max(1,math.ceil(s.row_s*(len(s.pending)+len(s.rows))/s.max_batch))
+
+    async def generate(s,prompts,max_tokens=512,seeds=None,timeout=None,constrained=False,**sampling):
+        """prompts 를 행 단위로 큐에 넣고 모두 끝나면 (seqs, stats) 반환. 큐가 가득 차면 Overloaded,
+        모델 용량을 넘는 요청은 TooLong, timeout(초) 안에 끝나지 않은 행이 있으면 DeadlineExceeded."""
+        rows=s._enqueue(prompts,max_tokens,seeds,timeout,constrained,sampling)
+        try: await asyncio.gather(*[r.fut for r in rows])
+        except BaseException:
+            for r in rows: r.deadline=time.monotonic()  # 같은 요청의 나머지 행은 다음 스텝에서 정리
+            raise
+        return [r.seq for r in rows],s._stats(rows)
+
+    def stream(s,prompts,max_tokens=512,seeds=None,timeout=None,constrained=False,stats=None,**sampling):
+        """generate 의 스트리밍 버전. 큐 적재(및 Overloaded)는 호출 즉시, 반환된 async 제너레이터는 스텝마다
+        [(행, 토큰 id), ...] 를 yield (EOS 제외). 행이 DeadlineExceeded 로 끝나면 제너레이터에서 raise.
+        stats(dict)는 끝까지 소비했을 때 generate 와 같은 'tokens'/'saved' 로 채운다."""
+        q=asyncio.Queue(); rows=s._enqueue(prompts,max_tokens,seeds,timeout,constrained,sampling,q)
+        return s._drain(rows,q,stats)
+
+    async def _drain(s,rows,q,stats):
+        left=len(rows)
+        try:
+            while left:
+                step=[await q.get()]
+                while not q.empty(): step.append(q.get_nowait())  # 같은 디코드 스텝에서 쌓인 토큰은 한 번에
+                for r,t in step:
+                    if t is None:
+                        left-=1; exc=rows[r].fut.exception()
+                        if exc is not None: raise exc
+                toks=[(r,t) for r,t in step if t is not None]
+                if toks: yield toks
+        finally:
+            for r in rows:
+                if not r.done: r.deadline=time.monotonic()  # 소비자가 끊었거나 실패: 남은 행은 다음 스텝에서 정리
+                r.fut.add_done_callback(lambda f: f.cancelled() or f.exception())  # 나머지 행의 DeadlineExceeded 는 여기서 소비
+        if stats is not None: stats.update(s._stats(rows))
+
+    def _enqueue(s,prompts,max_tokens,seeds,timeout,constrained,sampling,q=None):
+        cap=get_model(s.xml,s.vocab_path).capacity; need=max((max(len(p),1) for p in prompts),default=0)+max_tokens
+        if cap and need>cap: raise TooLong(need,cap)
+        s.start(); loop=asyncio.get_running_loop(); seeds=seeds if seeds is not None else [None]*len(prompts)
+        deadline=time.monotonic()+timeout if timeout else None
+        rows=[_Row(list(p),max_tokens,deadline,sd,constrained,sampling,loop,loop.create_future(),i,q) for i,(p,sd) in enumerate(zip(prompts,seeds))]
+        with s.cv:
+            if len(s.pending)+len(rows)>s.max_queue: raise Overloaded(s.retry_after())
+            s.pending.extend(rows); s.cv.notify()
+        return rows
+
+    @staticmethod
+    def _stats(rows): return {'tokens':[len(r.seq)-len(r.prompt) for r in rows],'saved':[round(r.saved,2) for r in rows]}
+
+    def _finish(s,r,exc=None):
+        r.done=True
+        if r.t0 is not None: s.row_s=0.9*s.row_s+0.1*(time.monotonic()-r.t0)  # 행 평균 처리 시간(Retry-After 추정용)
+        try:
+            if exc is None: r.loop.call_soon_threadsafe(lambda: r.fut.done() or r.fut.set_result(None))
+            else: r.loop.call_soon_threadsafe(lambda: r.fut.done() or r.fut.set_exception(exc))
+        except RuntimeError: pass  # 요청 쪽 이벤트 루프가 이미 닫힘
+        if r.q is not None: s._emit(r,None)  # fut 설정 뒤에 도착하는 행 종료 표시
+
+    def _emit(s,r,t):
+        try: r.loop.call_soon_threadsafe(r.q.put_nowait,(r.idx,t))
+        except RuntimeError: pass
+
+    def _take(s,n):
+        out=[]; now=time.monotonic()
+        with s.cv:
+            while s.pending and len(out)<n:
+                r=s.pending.popleft()
+                if r.deadline and now>r.deadline: s._finish(r,DeadlineExceeded('expired in queue'))
+                else: out.append(r)
+        return out
+
+    def _loop(s):
+        while True:
+            with s.cv:
+                while not s.pending: s.cv.wait()
+            try:
+                m=get_model(s.xml,s.vocab_path)
+                with m.request() as req: s._busy(m,req)  # 배치가 빌 때까지 infer request 점유, 유휴 시 풀에 반납
+            except Exception as e:
+                for r in s.rows or s._take(len(s.pending)): s._finish(r,e)
+            s.rows=[]
+
+    def _admit(s,m,st,rows,new):
+        L=max(len(r.seq) for r in new); ids=np.full((len(new),L),m.pad,dtype=np.int64); mask=np.zeros_like(ids)
+        for i,r in enumerate(new): ids[i,L-len(r.seq):]=r.seq; mask[i,L-len(r.seq):]=1
+        lg=st.prefill(ids,mask) if not rows else st.admit(ids,mask)
+        for r in new:
+            r.t0=time.monotonic()
+            if r.constrained: r.gs=grammar_for(m,lg.shape[1]).state_after(r.seq)
+        return lg
+
+    def _busy(s,m,req):
+        st=make_stepper(m,req,s.mode); rows=s.rows=[]; logits=None
+        while True:
+            room=s.max_batch-len(rows)
+            if room>0 and (not rows or st.can_admit):
+                new=s._take(room)
+                if new:
+                    lg=s._admit(m,st,rows,new); logits=lg if not rows else np.concatenate([logits,lg]); rows=s.rows=rows+new
+            if not rows: return
+            nxt=[]; now=time.monotonic()
+            for j,r in enumerate(rows):
+                g=grammar_for(m,logits.shape[1]) if r.constrained else None
+                t=int(r.sp(logits[j:j+1],r.rng,[r.seq],g.mask([r.gs]) if g else None)[0])
+                if g: r.saved+=float(r.sp.invalid[0]); r.gs=int(g.advance([r.gs],[t])[0])
+                if t==m.eos: s._finish(r)
+                else:
+                    r.seq.append(t)
+                    if r.q is not None: s._emit(r,t)
+                    if len(r.seq)-len(r.prompt)>=r.max_tokens: s._finish(r)
+                    elif r.deadline and now>r.deadline: s._finish(r,DeadlineExceeded('deadline exceeded while decoding'))
+                nxt.append(t)
+            keep=[j for j,r in enumerate(rows) if not r.done]
+            if len(keep)<len(rows):
+                rows=s.rows=[rows[j] for j in keep]
+                if not rows: return
+                st.keep(keep); nxt=[nxt[j] for j in keep]
+            logits=st.step(nxt)
+
+_SCHED={}
+def get_scheduler(xml,vocab_path):
+    k=(xml,vocab_path)
+    if k not in _SCHED: _SCHED[k]=Scheduler(xml,vocab_path).start()
+    return _SCHED[k]
+
+def status(): return [x.status() for x in _SCHED.values()]
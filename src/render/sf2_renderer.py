@@ -1,4 +1,6 @@
 import os, numpy as np, pretty_midi as pm
+from render.synth_pool import schedule_midi
+from render.sf2_renderer import render_schedule
 
 
 def _sf2():
@@ -8,12 +10,14 @@ def _sf2():
     return p
 
 
-def render(midi: pm.PrettyMIDI, sr=32000) -> np.ndarray:
+def render(midi: pm.PrettyMIDI, sr=32000, normalize=True) -> np.ndarray:
     # CI에서는 실제 렌더 생략(무음) -> fluidsynth 비의존
     if os.environ.get("SKIP_AUDIO") == "1":
         return np.zeros(sr * 2, dtype="float32")
-    audio = midi.fluidsynth(fs=sr, sf2_path=_sf2())
-    peak = max(1e-9, np.abs(audio).max())
-    audio = audio / (peak * 1.2)
-    audio = np.tanh(audio * 1.8)
-    return audio.astype("float32")
+    _sf2()
+    # 프로세스당 SF2 를 한 번만 올린 synth 풀 + RENDER_CACHE_DIR 렌더 캐시(히트 시 읽기 전용 memmap)
+    # normalize=False: 섹션별로 따로 렌더해 이어 붙일 때 synth 원 레벨 유지(레벨은 뒤의 MasteringChain 이 맞춤)
+    audio = render_schedule(schedule_midi(midi), sr, normalize=normalize)
+    if not normalize:
+        return np.asarray(audio, dtype="float32")
+    return np.tanh(audio * (1.8 / 1.2)).astype("float32")
@@ -1,6 +1,10 @@
-import os, json, glob, pretty_midi as pm
-from src.tokenizers.skytnt import section_prefix, midi_to_events, build_vocab, events_to_ids
+import os, json, glob, hashlib, argparse, multiprocessing as mp, numpy as np, pretty_midi as pm
+from collections import Counter
+from src.tokenizers.skytnt import section_prefix, midi_to_events, events_to_ids
 RAW='data/raw'; OUT='data/processed'; JSONL=f'{OUT}/jsonl/train.jsonl'; VOCAB=f'{OUT}/vocab.json'
+MANIFEST=f'{OUT}/manifest.json'; SONGS=f'{OUT}/songs'; BIN=f'{OUT}/tokens/train.bin'
+PREP_VERSION=1  # 토크나이저/슬라이싱이 바뀌면 올려서 전체 재토큰화
+SPECIALS=['<pad>','<bos>','<eos>','<unk>']
 
 def slice_midi(m,s,e):
     out=pm.PrettyMIDI(resolution=m.resolution)
@@ -13,31 +17,91 @@ def slice_midi(m,s,e):
         if ni.notes: out.instruments.append(ni)
     return out
 
-def main():
-    os.makedirs(os.path.dirname(JSONL),exist_ok=True)
-    samples=[]; metas=[]
-    for song in glob.glob(f'{RAW}/*'):
-        if not os.path.isdir(song): continue
-        mids=glob.glob(f'{song}/*.mid'); 
-        if not mids: continue
-        sections_path=f'{song}/sections.json'
-        sections=json.load(open(sections_path,'r',encoding='utf-8')) if os.path.exists(sections_path) else None
-        bpm=120; key='C'
-        for mp in mids:
-            m=pm.PrettyMIDI(mp)
-            if sections:
-                for sec in sections:
-                    sm=slice_midi(m, float(sec['start']), float(sec['end']))
-                    ev=section_prefix(sec['name'],bpm,key)+midi_to_events(sm)
-                    samples.append(ev); metas.append({'song':os.path.basename(song),'section':sec['name']})
-            else:
-                ev=section_prefix('full',bpm,key)+midi_to_events(m)
-                samples.append(ev); metas.append({'song':os.path.basename(song),'section':'full'})
-    vocab=build_vocab(samples); os.makedirs(OUT,exist_ok=True)
-    json.dump(vocab, open(VOCAB,'w',encoding='utf-8'), ensure_ascii=False, indent=2)
-    with open(JSONL,'w',encoding='utf-8') as f:
-        for ev,meta in zip(samples,metas):
-            f.write(json.dumps({'tokens':events_to_ids(ev,vocab),'meta':meta},ensure_ascii=False)+'\n')
-    print('wrote', JSONL, 'vocab', len(vocab), 'samples', len(samples))
-
-if __name__=='__main__': main()
+def song_files(song): return sorted(glob.glob(f'{song}/*.mid'))+([f'{song}/sections.json'] if os.path.exists(f'{song}/sections.json') else [])
+
+def song_hash(song):
+    # 내용 해시: 파일 이름 + 바이트 (mtime 무관, 복사/체크아웃해도 재토큰화 안 함)
+    h=hashlib.sha256(f'v{PREP_VERSION}'.encode())
+    for p in song_files(song):
+        h.update(os.path.basename(p).encode()+b'\0')
+        with open(p,'rb') as f:
+            for blk in iter(lambda: f.read(1<<20), b''): h.update(blk)
+    return h.hexdigest()
+
+def tokenize_song(args):
+    # 워커: 곡 하나를 이벤트로 만들어 곡별 파일에 바로 기록, 토큰 빈도만 반환 (메인 프로세스는 이벤트를 들고 있지 않음)
+    song,digest=args; name=os.path.basename(song); mids=sorted(glob.glob(f'{song}/*.mid'))
+    sections_path=f'{song}/sections.json'
+    sections=json.load(open(sections_path,'r',encoding='utf-8')) if os.path.exists(sections_path) else None
+    bpm=120; key='C'; counts=Counter(); n=0; tmp=f'{SONGS}/{name}.jsonl.tmp'
+    with open(tmp,'w',encoding='utf-8') as f:
+        for mp_ in mids:
+            m=pm.PrettyMIDI(mp_)
+            parts=[(sec['name'],slice_midi(m,float(sec['start']),float(sec['end']))) for sec in sections] if sections else [('full',m)]
+            for sec,sm in parts:
+                ev=section_prefix(sec,bpm,key)+midi_to_events(sm); counts.update(ev); n+=1
+                f.write(json.dumps({'events':ev,'meta':{'song':name,'section':sec}},ensure_ascii=False)+'\n')
+    os.replace(tmp,f'{SONGS}/{name}.jsonl')
+    return name,digest,n,dict(counts)
+
+def load_manifest():
+    if not os.path.exists(MANIFEST): return {'version':PREP_VERSION,'songs':{},'counts':{}}
+    man=json.load(open(MANIFEST,'r',encoding='utf-8'))
+    return man if man.get('version')==PREP_VERSION else {'version':PREP_VERSION,'songs':{},'counts':{}}
+
+def merge_vocab(vocab,counts):
+    # 기존 id 는 고정, 새 토큰만 뒤에 추가 (기존 체크포인트/내보낸 모델과 호환 유지)
+    vocab=dict(vocab) if vocab else {t:i for i,t in enumerate(SPECIALS)}
+    for t in sorted(t for t,c in counts.items() if c>0 and t not in vocab): vocab[t]=len(vocab)
+    return vocab
+
+def token_dtype(vocab_size): return np.uint16 if vocab_size<=1<<16 else np.uint32
+
+def bin_paths(bin_path):
+    # train.bin: 모든 샘플 토큰을 이어 붙인 평탄 배열, train.idx.npy: int64 오프셋 (n+1), train.meta.json: dtype/개수
+    base=bin_path[:-4] if bin_path.endswith('.bin') else bin_path
+    return bin_path, base+'.idx.npy', base+'.meta.json'
+
+def _dump(obj,path,**kw):
+    tmp=path+'.tmp'; json.dump(obj,open(tmp,'w',encoding='utf-8'),ensure_ascii=False,**kw); os.replace(tmp,path)
+
+def main(workers=None,full=False):
+    os.makedirs(os.path.dirname(JSONL),exist_ok=True); os.makedirs(SONGS,exist_ok=True)
+    man=load_manifest() if not full else {'version':PREP_VERSION,'songs':{},'counts':{}}
+    songs={os.path.basename(s):s for s in sorted(glob.glob(f'{RAW}/*')) if os.path.isdir(s) and glob.glob(f'{s}/*.mid')}
+    counts=Counter(man['counts']); old=man['songs']; todo=[]
+    for name in list(old):
+        if name not in songs:  # 삭제된 곡: 빈도 차감 후 곡 파일 제거
+            counts.subtract(old.pop(name)['counts'])
+            if os.path.exists(f'{SONGS}/{name}.jsonl'): os.remove(f'{SONGS}/{name}.jsonl')
+    for name,song in songs.items():
+        digest=song_hash(song)
+        if name in old and old[name]['hash']==digest and os.path.exists(f'{SONGS}/{name}.jsonl'): continue
+        todo.append((song,digest))
+    workers=workers or os.cpu_count() or 1
+    print(f'songs {len(songs)}  changed {len(todo)}  workers {min(workers,max(1,len(todo)))}')
+    if todo:
+        with mp.get_context('spawn').Pool(min(workers,len(todo))) as pool:
+            for name,digest,n,c in pool.imap_unordered(tokenize_song,todo):
+                if name in old: counts.subtract(old[name]['counts'])
+                counts.update(c); old[name]={'hash':digest,'samples':n,'counts':c}
+    counts={t:c for t,c in counts.items() if c>0}; man={'version':PREP_VERSION,'songs':old,'counts':counts}
+    vocab=merge_vocab(None if full or not os.path.exists(VOCAB) else json.load(open(VOCAB,'r',encoding='utf-8')),counts)
+    _dump(vocab,VOCAB,indent=2)
+    binp,idxp,metap=bin_paths(BIN); os.makedirs(os.path.dirname(binp),exist_ok=True)
+    dt=token_dtype(len(vocab)); offsets=[0]; tmp=JSONL+'.tmp'
+    with open(tmp,'w',encoding='utf-8') as f, open(binp+'.tmp','wb') as fb:  # 곡별 파일을 스트리밍으로 이어 붙임 (전체 코퍼스를 메모리에 올리지 않음)
+        for name in sorted(old):
+            for line in open(f'{SONGS}/{name}.jsonl','r',encoding='utf-8'):
+                r=json.loads(line); ids=events_to_ids(r['events'],vocab)
+                f.write(json.dumps({'tokens':ids,'meta':r['meta']},ensure_ascii=False)+'\n')
+                fb.write(np.asarray(ids,dtype=dt).tobytes()); offsets.append(offsets[-1]+len(ids))
+    os.replace(tmp,JSONL); os.replace(binp+'.tmp',binp)
+    with open(idxp+'.tmp','wb') as fi: np.save(fi,np.asarray(offsets,dtype=np.int64))
+    os.replace(idxp+'.tmp',idxp); _dump({'dtype':np.dtype(dt).name,'samples':len(offsets)-1,'tokens':offsets[-1],'vocab_size':len(vocab)},metap)
+    _dump(man,MANIFEST)  # 매니페스트는 마지막에: 중단되면 다음 실행이 다시 처리
+    print('wrote', JSONL, binp, 'vocab', len(vocab), 'samples', len(offsets)-1, 'tokens', offsets[-1])
+
+if __name__=='__main__':
+    ap=argparse.ArgumentParser(); ap.add_argument('--workers',type=int,default=None); ap.add_argument('--full',action='store_true',help='manifest/vocab 무시하고 전체 재생성')
+    a=ap.parse_args(); main(a.workers,a.full)
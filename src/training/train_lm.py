@@ -1,33 +1,193 @@
-import os,json,torch,math,argparse,yaml
+import os,json,time,random,shutil,threading,torch,math,argparse,yaml,numpy as np
 from torch.utils.data import Dataset,DataLoader
 from transformers import GPT2Config,GPT2LMHeadModel,AdamW,get_cosine_schedule_with_warmup
 
+IGNORE=-100  # cross_entropy ignore_index: pad/문서 경계/윈도 중복 라벨
+
 class DS(Dataset):
     def __init__(s,p,seq=2048): s.items=[json.loads(l)['tokens'] for l in open(p,'r',encoding='utf-8')]; s.seq=seq
     def __len__(s): return len(s.items)
+    def lengths(s): return np.fromiter((len(x) for x in s.items),dtype=np.int64,count=len(s.items))
+    def tokens(s,i,a=0,b=None): return np.asarray(s.items[i][a:b],dtype=np.int64)
     def __getitem__(s,i):
         x=s.items[i][:s.seq]; x=x if len(x)>2 else x+[0,0]
         import torch; return torch.tensor(x[:-1]),torch.tensor(x[1:])
 
+class MemmapDS(Dataset):
+    # prepare_dataset 의 train.bin/idx 를 np.memmap 으로 읽음: RAM 이 아니라 디스크가 코퍼스 크기 한도,
+    # DataLoader 워커들은 같은 page cache 를 공유 (memmap 은 워커 안에서 지연 오픈, pickle 로 복사되지 않음)
+    def __init__(s,p,seq=2048):
+        base=p[:-4] if p.endswith('.bin') else p; s.p=p; s.seq=seq
+        s.meta=json.load(open(base+'.meta.json','r',encoding='utf-8')); s.off=np.load(base+'.idx.npy',mmap_mode='r'); s.tok=None
+        # 같은 바이트를 부호 있는 정수로 보면 torch.from_numpy 가 복사 없이 받음 (uint16 id<32768, uint32 id<2^31)
+        s.view={'uint16':np.int16 if s.meta['vocab_size']<=1<<15 else None,'uint32':np.int32}[s.meta['dtype']]
+    def __len__(s): return s.meta['samples']
+    def lengths(s): return np.diff(s.off)
+    def tokens(s,i,a=0,b=None):
+        if s.tok is None: s.tok=np.memmap(s.p,dtype=s.meta['dtype'],mode='c')
+        o=int(s.off[i]); e=int(s.off[i+1]); return s.tok[o+a:e if b is None else min(e,o+b)].astype(np.int64)
+    def __getstate__(s): d=dict(s.__dict__); d['tok']=None; return d
+    def __getitem__(s,i):
+        if s.tok is None: s.tok=np.memmap(s.p,dtype=s.meta['dtype'],mode='c')  # 'c': 쓰기 가능 뷰 (from_numpy 경고 없음), 실제 쓰기 없으면 복사 없음
+        a=int(s.off[i]); b=min(int(s.off[i+1]),a+s.seq); x=s.tok[a:b]
+        x=x.view(s.view) if s.view is not None else x.astype(np.int32)
+        t=torch.from_numpy(x); t=t if len(t)>2 else torch.cat([t,t.new_zeros(2)])
+        return t[:-1],t[1:]
+
+class PackedDS(Dataset):
+    # 'pack': 문서+<eos> 를 seq_len 행에 이어 붙임 (pad 대신 실제 토큰), 긴 문서는 seq_len 단위로 자름
+    # 'window': 행당 문서 하나, seq_len 보다 긴 문서는 stride 로 겹치는 슬라이딩 윈도 (겹친 앞부분 라벨은 마스크 → 각 토큰 1회만 학습)
+    # 문서 경계: <eos> 다음 토큰(다음 문서 첫 토큰) 라벨 마스크 + position_ids 를 문서마다 0 부터 → 문서 단위 loss 마스킹
+    def __init__(s,src,seq,eos,mode='pack',stride=None):
+        s.src=src; s.seq=seq; s.eos=eos; s.rows=[]; n=seq+1; stride=max(1,min(stride or seq//2,seq)) if mode=='window' else seq
+        segs=[]  # (sample, a, b, keep_from, last)
+        for i,L in enumerate(src.lengths().tolist()):
+            if L<2: continue
+            a=0; prev=0
+            while True:
+                b=min(a+n,L); segs.append((i,a,b,max(0,prev-a-1),b==L)); prev=b
+                if b==L: break
+                a+=stride
+        if mode=='window': s.rows=[[g] for g in segs]
+        else:
+            row=[]; used=0
+            for g in segs:
+                need=g[2]-g[1]+(1 if g[4] else 0)
+                if row and used+min(need,n)>n: s.rows.append(row); row=[]; used=0
+                row.append(g); used+=min(need,n)
+            if row: s.rows.append(row)
+        eff=sum(g[2]-g[1]-1-g[3]+(1 if g[4] and g[2]-g[1]<n else 0) for g in segs)
+        s.ratio=eff/max(1,len(s.rows)*seq)  # 유효(학습되는) 라벨 / 전체 라벨 자리
+    def __len__(s): return len(s.rows)
+    def __getitem__(s,r):
+        toks=[]; keep=[]; pos=[]
+        for i,a,b,k,last in s.rows[r]:
+            t=s.src.tokens(i,a,b); m=np.ones(len(t),dtype=bool); m[:k+1]=False  # 첫 토큰은 예측 대상 아님
+            if last and (sum(len(x) for x in toks)+len(t)<s.seq+1): t=np.append(t,s.eos); m=np.append(m,True)
+            toks.append(t); keep.append(m); pos.append(np.arange(len(t)))
+        t=np.concatenate(toks)[:s.seq+1]; m=np.concatenate(keep)[:s.seq+1]; p=np.concatenate(pos)[:s.seq+1]
+        y=np.where(m[1:],t[1:],IGNORE)
+        return torch.from_numpy(t[:-1]),torch.from_numpy(y),torch.from_numpy(p[:-1])
+
 def coll(b):
     import torch; i=[t[0] for t in b]; o=[t[1] for t in b]
-    return (torch.nn.utils.rnn.pad_sequence(i,True,0),
-            torch.nn.utils.rnn.pad_sequence(o,True,0))
-
-def main(cfgp):
-    cfg=yaml.safe_load(open(cfgp)); vocab=json.load(open(cfg['model']['vocab_path']))
-    vs=max(vocab.values())+1
-    m=GPT2LMHeadModel(GPT2Config(vocab_size=vs,n_layer=cfg['model']['n_layer'],n_head=cfg['model']['n_head'],n_embd=cfg['model']['n_embd'],n_positions=cfg['train']['seq_len']))
-    ds=DS(cfg['data']['train_jsonl'],cfg['train']['seq_len']); dl=DataLoader(ds,batch_size=cfg['train']['batch_size'],shuffle=True,collate_fn=coll)
-    dev='cuda' if torch.cuda.is_available() else 'cpu'; m.to(dev); opt=AdamW(m.parameters(),lr=cfg['train']['lr'])
-    sch=get_cosine_schedule_with_warmup(opt,0,len(dl)*cfg['train']['epochs']); os.makedirs('checkpoints',exist_ok=True); m.train()
-    for e in range(cfg['train']['epochs']):
-        s=0;n=0
-        for x,y in dl:
-            x,y=x.to(dev),y.to(dev); out=m(input_ids=x,labels=y); loss=out.loss
-            opt.zero_grad(); loss.backward(); torch.nn.utils.clip_grad_norm_(m.parameters(),1.0); opt.step(); sch.step()
-            s+=loss.item(); n+=1
-        print(f'epoch {e+1} loss={s/max(n,1):.4f}'); m.save_pretrained(f'checkpoints/epoch{e+1}')
+    x=torch.nn.utils.rnn.pad_sequence(i,True,0).long(); y=torch.nn.utils.rnn.pad_sequence(o,True,IGNORE).long()  # pad 라벨은 loss 제외
+    am=torch.zeros_like(x)
+    for k,t in enumerate(i): am[k,:len(t)]=1
+    pos=torch.nn.utils.rnn.pad_sequence([t[2] for t in b],True,0).long() if len(b[0])>2 else None
+    return x,y,am,pos
+
+def make_ds(cfg,vocab=None):
+    p=cfg['data'].get('train_bin'); seq=cfg['train']['seq_len']; mode=cfg['train'].get('mode','trunc')
+    ds=MemmapDS(p,seq) if p and os.path.exists(p) else DS(cfg['data']['train_jsonl'],seq)
+    if mode=='trunc': return ds  # 기존 동작: 샘플당 한 행, seq_len 넘는 부분 버림
+    return PackedDS(ds,seq,(vocab or {}).get('<eos>',2),mode,cfg['train'].get('window_stride'))
+
+def lm_loss(logits,y):
+    # x,y 는 이미 한 칸 밀려 있음 (HF labels= 는 내부에서 한 번 더 민다)
+    return torch.nn.functional.cross_entropy(logits.float().view(-1,logits.size(-1)),y.view(-1),ignore_index=IGNORE)
+
+class EpochSampler(torch.utils.data.Sampler):
+    # 에폭별 시드로 섞기 → 재개 시 같은 순서를 다시 만들고 이미 본 샘플만 건너뜀 (데이터 로드 없이)
+    def __init__(s,n,seed,epoch,skip=0): s.n=n; s.seed=seed; s.epoch=epoch; s.skip=skip
+    def __iter__(s):
+        g=torch.Generator(); g.manual_seed(s.seed+s.epoch); return iter(torch.randperm(s.n,generator=g)[s.skip:].tolist())
+    def __len__(s): return max(0,s.n-s.skip)
+
+def _cpu(o):
+    # 스냅샷: 텐서는 CPU 로 복사 (optimizer 상태는 다음 step 에서 제자리 갱신되므로 참조 저장 불가)
+    if torch.is_tensor(o): return o.detach().to('cpu',copy=True)
+    if isinstance(o,dict): return {k:_cpu(v) for k,v in o.items()}
+    if isinstance(o,(list,tuple)): return type(o)(_cpu(v) for v in o)
+    return o
+
+class AsyncCheckpointer:
+    # 스냅샷은 학습 스레드에서 (짧음), 직렬화/디스크 쓰기는 백그라운드 스레드에서. 동시에 하나만 진행.
+    def __init__(s,root,keep=3): s.root=root; s.keep=keep; s.th=None; os.makedirs(root,exist_ok=True)
+    def wait(s):
+        if s.th is not None: s.th.join(); s.th=None
+    def save(s,step,m,opt,sch,meta,pretrained=None):
+        # pretrained: 같은 스냅샷으로 HF 형식(save_pretrained)도 기록 (export_ov 입력)
+        snap={'model':_cpu(m.state_dict()),'optimizer':_cpu(opt.state_dict()),'scheduler':sch.state_dict(),'meta':meta,
+              'rng':{'torch':torch.get_rng_state(),'python':random.getstate(),'numpy':np.random.get_state()}}
+        s.wait(); s.th=threading.Thread(target=s._write,args=(f'{s.root}/step{step}',snap,m,pretrained)); s.th.start()
+    def _write(s,d,snap,m,pretrained):
+        if pretrained: m.save_pretrained(pretrained,state_dict=snap['model'])
+        os.makedirs(d,exist_ok=True); torch.save(snap,f'{d}/state.pt.tmp'); os.replace(f'{d}/state.pt.tmp',f'{d}/state.pt')
+        with open(f'{s.root}/latest.tmp','w') as f: f.write(os.path.basename(d))
+        os.replace(f'{s.root}/latest.tmp',f'{s.root}/latest')
+        steps=sorted((int(n[4:]) for n in os.listdir(s.root) if n.startswith('step') and n[4:].isdigit()))
+        for st in steps[:-s.keep]: shutil.rmtree(f'{s.root}/step{st}',ignore_errors=True)
+
+def resume_path(p,root):
+    if p=='latest':
+        if not os.path.exists(f'{root}/latest'): return None
+        p=f'{root}/'+open(f'{root}/latest').read().strip()
+    return f'{p}/state.pt' if os.path.isdir(p) else p
+
+def peak_mem_mb(dev):
+    if dev=='cuda': return torch.cuda.max_memory_allocated()/2**20
+    try:
+        import resource; return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024  # Linux: KB
+    except ImportError:
+        try:
+            import psutil; return psutil.Process().memory_info().peak_wset/2**20  # Windows
+        except (ImportError,AttributeError): return None
+
+def main(cfgp,resume=None):
+    cfg=yaml.safe_load(open(cfgp)); vocab=json.load(open(cfg['model']['vocab_path'])); tc=cfg['train']
+    vs=max(vocab.values())+1; seed=tc.get('seed',0); torch.manual_seed(seed); random.seed(seed); np.random.seed(seed)
+    m=GPT2LMHeadModel(GPT2Config(vocab_size=vs,n_layer=cfg['model']['n_layer'],n_head=cfg['model']['n_head'],n_embd=cfg['model']['n_embd'],n_positions=tc['seq_len']))
+    ds=make_ds(cfg,vocab); bs=tc['batch_size']; accum=max(1,tc.get('grad_accum',1))
+    steps_per_epoch=math.ceil(math.ceil(len(ds)/bs)/accum)
+    dev='cuda' if torch.cuda.is_available() else 'cpu'; m.to(dev); opt=AdamW(m.parameters(),lr=tc['lr'])
+    sch=get_cosine_schedule_with_warmup(opt,0,steps_per_epoch*tc['epochs']); m.train()
+    root=tc.get('ckpt_dir','checkpoints'); ck=AsyncCheckpointer(root,tc.get('ckpt_keep',3)); every=tc.get('ckpt_every',0)
+    step=0; e0=0; skip=0; rp=resume_path(resume,root) if resume else None
+    if rp:
+        st=torch.load(rp,map_location='cpu',weights_only=False); m.load_state_dict(st['model']); opt.load_state_dict(st['optimizer']); sch.load_state_dict(st['scheduler'])
+        torch.set_rng_state(st['rng']['torch']); random.setstate(st['rng']['python']); np.random.set_state(st['rng']['numpy'])
+        step=st['meta']['step']; e0=st['meta']['epoch']; skip=st['meta']['samples_in_epoch']; print(f'resumed {rp}: step {step} epoch {e0+1} +{skip} samples')
+    if hasattr(ds,'ratio'): print(f'{tc.get("mode")}: {len(ds)} rows, planned effective/total tokens={ds.ratio:.3f}')
+    amp=torch.autocast(dev,dtype=torch.bfloat16,enabled=bool(tc.get('bf16',False)))  # CPU(AMX/AVX512-BF16) 에서도 동작
+    mf=open(tc.get('metrics',f'{root}/metrics.jsonl'),'a',encoding='utf-8'); log_every=max(1,tc.get('log_every',1))
+    pc=tc.get('profile')  # 예: {start: 10, steps: 5, dir: checkpoints/profile}
+    prof=torch.profiler.profile(schedule=torch.profiler.schedule(wait=max(0,pc.get('start',10)-1),warmup=1,active=pc.get('steps',5),repeat=1),
+                                on_trace_ready=torch.profiler.tensorboard_trace_handler(pc.get('dir',f'{root}/profile')),profile_memory=True,record_shapes=True) if pc else None
+    if prof: prof.start()
+    try:
+        for e in range(e0,tc['epochs']):
+            dl=DataLoader(ds,batch_size=bs,sampler=EpochSampler(len(ds),seed,e,skip),collate_fn=coll,num_workers=tc.get('workers',0))
+            seen=skip; skip=0; s=0;n=0;eff=0;tot=0; it=iter(dl); k=0
+            acc={'data':0.0,'compute':0.0,'tokens':0,'eff':0,'loss':0.0,'micro':0}; t=time.perf_counter()
+            while True:
+                try: x,y,am,pos=next(it)
+                except StopIteration: break
+                t1=time.perf_counter(); acc['data']+=t1-t
+                x,y,am=x.to(dev),y.to(dev),am.to(dev); pos=pos.to(dev) if pos is not None else None
+                with amp: out=m(input_ids=x,attention_mask=am,position_ids=pos); loss=lm_loss(out.logits,y)
+                (loss/accum).backward(); k+=1; seen+=x.size(0); ne=int((y!=IGNORE).sum())
+                acc['tokens']+=y.numel(); acc['eff']+=ne; acc['loss']+=loss.item(); acc['micro']+=1
+                last=seen>=len(ds)
+                if k%accum==0 or last:
+                    torch.nn.utils.clip_grad_norm_(m.parameters(),1.0); opt.step(); sch.step(); opt.zero_grad(set_to_none=True); step+=1
+                    if dev=='cuda': torch.cuda.synchronize()
+                    t=time.perf_counter(); acc['compute']+=t-t1; dt=acc['data']+acc['compute']
+                    s+=acc['loss']/acc['micro']; n+=1; eff+=acc['eff']; tot+=acc['tokens']
+                    if step%log_every==0:
+                        mf.write(json.dumps({'step':step,'epoch':e+1,'loss':round(acc['loss']/acc['micro'],5),'lr':sch.get_last_lr()[0],
+                            'tokens':acc['tokens'],'effective_tokens':acc['eff'],'tok_s':round(acc['tokens']/max(dt,1e-9),1),'eff_tok_s':round(acc['eff']/max(dt,1e-9),1),
+                            'data_ms':round(acc['data']*1000,2),'compute_ms':round(acc['compute']*1000,2),'peak_mem_mb':peak_mem_mb(dev)})+'\n'); mf.flush()
+                    acc={'data':0.0,'compute':0.0,'tokens':0,'eff':0,'loss':0.0,'micro':0}
+                    if prof: prof.step()
+                    if every and step%every==0: ck.save(step,m,opt,sch,{'step':step,'epoch':e,'samples_in_epoch':seen})
+                else: t=time.perf_counter(); acc['compute']+=t-t1
+            print(f'epoch {e+1} loss={s/max(n,1):.4f} effective/total tokens={eff/max(tot,1):.3f}')
+            ck.save(step,m,opt,sch,{'step':step,'epoch':e+1,'samples_in_epoch':0},pretrained=f'{root}/epoch{e+1}')
+    finally:
+        if prof: prof.stop()
+        ck.wait(); mf.close()
 
 if __name__=='__main__':
-    ap=argparse.ArgumentParser(); ap.add_argument('--config',default='src/training/configs/default.yaml'); a=ap.parse_args(); main(a.config)
+    ap=argparse.ArgumentParser(); ap.add_argument('--config',default='src/training/configs/default.yaml')
+    ap.add_argument('--resume',default=None,help="체크포인트 디렉터리/state.pt 또는 'latest'"); a=ap.parse_args(); main(a.config,a.resume)
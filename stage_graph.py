@@ -0,0 +1,191 @@
+"""Run a small dependency graph of pipeline stages concurrently and time it."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Executor, Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StageGraph:
+    """Stages with dependencies, each started as soon as everything it needs is done.
+
+    ``add(name, fn, deps)`` registers a stage; ``fn`` is called with the results
+    of ``deps`` in order. :meth:`run` submits the stages to an executor and
+    returns immediately; results are read back with :meth:`result`. A failed
+    stage fails every stage that depends on it, with the same exception.
+
+    Each stage's ready, start and end times are recorded, so after a run
+    :meth:`critical_path` reports the chain of stages that bounded the total
+    time, e.g. whether a song waited on the lyric service or on rendering.
+    """
+
+    def __init__(self) -> None:
+        self._stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._waiting: Dict[str, int] = {}
+        self._times: Dict[str, Dict[str, float]] = {}
+        self._details: Dict[str, Dict[str, float]] = {}
+        self._tracked: List[Future] = []
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._origin = 0.0
+        self._cancelled = False
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = ()) -> None:
+        if name in self._stages:
+            raise ValueError(f"duplicate stage '{name}'")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = (fn, tuple(deps))
+        self._dependents[name] = []
+        for dep in deps:
+            self._dependents[dep].append(name)
+        self._futures[name] = Future()
+
+    def run(self, executor: Executor) -> "StageGraph":
+        """Start every stage whose dependencies are met; the rest follow on completion."""
+
+        self._executor = executor
+        self._origin = time.perf_counter()
+        ready = []
+        with self._lock:
+            for name, (_, deps) in self._stages.items():
+                self._waiting[name] = len(deps)
+                if not deps:
+                    ready.append(name)
+        for name in ready:
+            self._submit(name)
+        return self
+
+    def _now(self) -> float:
+        return (time.perf_counter() - self._origin) * 1000.0
+
+    def _submit(self, name: str) -> None:
+        self._times[name] = {"ready_ms": self._now()}
+        with self._lock:
+            cancelled = self._cancelled
+        if cancelled:
+            self._finish(name, error=CancelledError())
+            return
+        try:
+            self._executor.submit(self._execute, name)
+        except RuntimeError as exc:  # executor shut down
+            self._finish(name, error=exc)
+
+    def _execute(self, name: str) -> None:
+        fn, deps = self._stages[name]
+        self._times[name]["start_ms"] = self._now()
+        try:
+            value = fn(*(self._futures[dep].result() for dep in deps))
+        except BaseException as exc:  # noqa: BLE001 - handed to the stage's future
+            self._finish(name, error=exc)
+        else:
+            self._finish(name, value=value)
+
+    def _finish(self, name: str, value: Any = None, error: Optional[BaseException] = None) -> None:
+        times = self._times[name]
+        times.setdefault("start_ms", times["ready_ms"])
+        times["end_ms"] = self._now()
+        future = self._futures[name]
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+        ready = []
+        with self._lock:
+            for dependent in self._dependents[name]:
+                self._waiting[dependent] -= 1
+                if self._waiting[dependent] == 0:
+                    ready.append(dependent)
+        for dependent in ready:
+            failed = next(
+                (
+                    self._futures[dep].exception()
+                    for dep in self._stages[dependent][1]
+                    if self._futures[dep].exception() is not None
+                ),
+                None,
+            )
+            if failed is not None:
+                self._times[dependent] = {"ready_ms": self._now()}
+                self._finish(dependent, error=failed)
+            else:
+                self._submit(dependent)
+
+    def track(self, future: Future) -> Future:
+        """Cancel ``future`` (e.g. a job a stage submitted elsewhere) with the graph."""
+
+        with self._lock:
+            cancelled = self._cancelled
+            if not cancelled:
+                self._tracked.append(future)
+        if cancelled:
+            future.cancel()
+        return future
+
+    def detail(self, name: str, **timings: float) -> None:
+        """Attach sub-stage timings (in ms) to ``name`` for the report."""
+
+        self._details.setdefault(name, {}).update(timings)
+
+    def future(self, name: str) -> Future:
+        return self._futures[name]
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        return self._futures[name].result(timeout)
+
+    def cancel(self) -> None:
+        """Skip stages that have not started and cancel tracked jobs."""
+
+        with self._lock:
+            self._cancelled = True
+            tracked, self._tracked = self._tracked, []
+        for future in tracked:
+            future.cancel()
+
+    def critical_path(self, sink: Optional[str] = None) -> List[Dict[str, object]]:
+        """The finished stages that bounded ``sink`` (default: the last to finish).
+
+        Walking back from ``sink``, each step takes the dependency that finished
+        last. ``wait_ms`` is time spent ready but queued for a thread.
+        """
+
+        finished = {name: t for name, t in self._times.items() if "end_ms" in t}
+        if not finished:
+            return []
+        if sink is None:
+            sink = max(finished, key=lambda name: finished[name]["end_ms"])
+        path = []
+        name: Optional[str] = sink
+        while name is not None and name in finished:
+            times = finished[name]
+            path.append(
+                {
+                    "stage": name,
+                    "start_ms": round(times["start_ms"], 2),
+                    "ms": round(times["end_ms"] - times["start_ms"], 2),
+                    "wait_ms": round(times["start_ms"] - times["ready_ms"], 2),
+                    **{key: round(value, 2) for key, value in self._details.get(name, {}).items()},
+                }
+            )
+            deps = [dep for dep in self._stages[name][1] if dep in finished]
+            name = max(deps, key=lambda dep: finished[dep]["end_ms"]) if deps else None
+        path.reverse()
+        return path
+
+    def log_critical_path(self, sink: Optional[str] = None) -> List[Dict[str, object]]:
+        path = self.critical_path(sink)
+        if path:
+            LOGGER.info(
+                "Critical path (%.2f ms): %s",
+                path[-1]["start_ms"] + path[-1]["ms"],
+                " -> ".join(f"{step['stage']} {step['ms']:.2f}" for step in path),
+            )
+        return path
@@ -0,0 +1,72 @@
+"""The binary streaming endpoint must emit complete, decodable files."""
+from __future__ import annotations
+
+import io
+import os
+from typing import Iterator
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+fastapi_testclient = pytest.importorskip("fastapi.testclient")
+pytest.importorskip("fluidsynth")
+pretty_midi = pytest.importorskip("pretty_midi")
+
+import compose_full_server as server  # noqa: E402
+from section_pipeline import SectionExecutor  # noqa: E402
+
+SECTIONS = [("intro", 1.5), ("verse", 2.0), ("chorus", 1.5)]
+
+# pretty_midi ships a small General MIDI SoundFont, enough to render every part.
+SOUNDFONT = os.getenv("SF2_PATH") or os.path.join(
+    os.path.dirname(pretty_midi.__file__), "TimGM6mb.sf2"
+)
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> Iterator:
+    monkeypatch.delenv("LYRIC_LLM_ENDPOINT", raising=False)
+    monkeypatch.delenv("NPU_LLM_ENDPOINT", raising=False)
+    monkeypatch.delenv("RENDER_CACHE_DIR", raising=False)
+    monkeypatch.delenv("SECTION_CACHE_DIR", raising=False)
+    if not os.path.exists(SOUNDFONT):
+        pytest.skip("no SoundFont available")
+    monkeypatch.setenv("SF2_PATH", SOUNDFONT)
+    monkeypatch.setattr(server, "SECTIONS", SectionExecutor(1))
+    yield fastapi_testclient.TestClient(server.app)
+
+
+def request_body(**extra: object) -> dict:
+    body = {
+        "base_style": "pop",
+        "bpm": 110,
+        "key": "C",
+        "seed": 7,
+        "with_vocal": False,
+        "sections": [{"name": name, "duration": duration} for name, duration in SECTIONS],
+    }
+    body.update(extra)
+    return body
+
+
+@pytest.mark.parametrize(
+    "accept, sample_rate",
+    [
+        ("audio/wav", server.APP_SAMPLE_RATE),
+        ("audio/flac", server.APP_SAMPLE_RATE),
+        ("audio/ogg", server.OPUS_SAMPLE_RATE),
+    ],
+)
+def test_stream_decodes_to_the_whole_song(client, accept: str, sample_rate: int) -> None:
+    response = client.post(
+        "/v1/audio/compose_full/stream", json=request_body(), headers={"Accept": accept}
+    )
+    assert response.status_code == 200
+
+    audio, rate = sf.read(io.BytesIO(response.content), dtype="float32")
+    song = sum(duration for _, duration in SECTIONS)
+    assert rate == sample_rate
+    # Every section arrives; Opus may pad or trim a few milliseconds at the edges.
+    assert abs(audio.shape[0] - int(round(song * sample_rate))) <= sample_rate // 20
+    assert np.isfinite(audio).all()
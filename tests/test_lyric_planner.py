@@ -0,0 +1,225 @@
+"""LyricPlanner and plan_lyrics against a local stub lyric service."""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Tuple
+
+import pytest
+
+from lyrics import lyric_planner
+from lyrics.lyric_planner import (
+    LyricCache,
+    LyricPlanner,
+    _fallback_lyrics,
+    _section_prompts,
+    plan_lyrics,
+)
+
+
+class StubService:
+    """Answers lyric prompts per section tag.
+
+    ``script[tag]`` is a list of ``(status, delay_s)`` replies used in order (the
+    last one repeats); unscripted tags answer 200 at once. Every request and the
+    peak number of requests in flight are recorded.
+    """
+
+    def __init__(self) -> None:
+        self.script: Dict[str, List[Tuple[int, float]]] = {}
+        self.calls: Dict[str, List[float]] = {}
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers["Content-Length"])
+                prompt = json.loads(self.rfile.read(length))["prompt"]
+                status, body = service.reply(prompt.split("tag is '")[1].split("'")[0])
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reply(self, tag: str) -> Tuple[int, bytes]:
+        with self._lock:
+            calls = self.calls.setdefault(tag, [])
+            calls.append(time.monotonic())
+            replies = self.script.get(tag, [(200, 0.0)])
+            status, delay = replies[min(len(calls), len(replies)) - 1]
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if status != 200:
+            return status, b"{}"
+        return 200, json.dumps({"text": f"{tag} line one\n{tag} line two"}).encode()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+SECTIONS = [{"name": name} for name in ("intro", "verse", "chorus", "outro")]
+
+
+@pytest.fixture
+def service() -> Iterator[StubService]:
+    stub = StubService()
+    yield stub
+    stub.close()
+
+
+def make_planner(**options: float) -> LyricPlanner:
+    settings = dict(concurrency=4, retries=2, backoff=0.05, timeout=5.0, deadline=5.0)
+    settings.update(options)
+    return LyricPlanner(**settings)
+
+
+def request(planner: LyricPlanner, endpoint: str, sections=SECTIONS) -> List:
+    prompts = _section_prompts("rock", "C", 120, sections, None)
+    return planner.lyrics(endpoint, [tag for tag, _ in prompts], [prompt for _, prompt in prompts])
+
+
+def test_sections_are_requested_concurrently(service: StubService) -> None:
+    service.script = {section["name"]: [(200, 0.3)] for section in SECTIONS}
+    planner = make_planner()
+    try:
+        started = time.monotonic()
+        results = request(planner, service.endpoint)
+        elapsed = time.monotonic() - started
+    finally:
+        planner.close()
+
+    assert all(results)
+    assert service.peak == len(SECTIONS)
+    assert elapsed < 0.3 * 2
+
+
+def test_concurrency_limit_is_respected(service: StubService) -> None:
+    service.script = {section["name"]: [(200, 0.2)] for section in SECTIONS}
+    planner = make_planner(concurrency=2)
+    try:
+        assert all(request(planner, service.endpoint))
+    finally:
+        planner.close()
+
+    assert service.peak == 2
+
+
+def test_5xx_and_429_are_retried_with_backoff(service: StubService) -> None:
+    service.script = {"verse": [(503, 0.0), (429, 0.0), (200, 0.0)]}
+    planner = make_planner(retries=2, backoff=0.1)
+    try:
+        results = request(planner, service.endpoint)
+    finally:
+        planner.close()
+
+    assert results[1] == ["verse line one", "verse line two"]
+    calls = service.calls["verse"]
+    assert len(calls) == 3
+    # Exponential backoff: at least 0.1 s, then at least 0.2 s between attempts.
+    assert calls[1] - calls[0] >= 0.1
+    assert calls[2] - calls[1] >= 0.2
+
+
+def test_retries_stop_after_the_limit(service: StubService) -> None:
+    service.script = {"verse": [(500, 0.0)]}
+    planner = make_planner(retries=1)
+    try:
+        results = request(planner, service.endpoint)
+    finally:
+        planner.close()
+
+    assert results[1] is None
+    assert len(service.calls["verse"]) == 2
+    assert results[0] and results[2] and results[3]
+
+
+def test_client_errors_are_not_retried(service: StubService) -> None:
+    service.script = {"verse": [(400, 0.0)]}
+    planner = make_planner()
+    try:
+        results = request(planner, service.endpoint)
+    finally:
+        planner.close()
+
+    assert results[1] is None
+    assert len(service.calls["verse"]) == 1
+
+
+def test_deadline_bounds_the_whole_song(service: StubService) -> None:
+    service.script = {"chorus": [(200, 3.0)]}
+    planner = make_planner(deadline=0.5)
+    try:
+        started = time.monotonic()
+        results = request(planner, service.endpoint)
+        elapsed = time.monotonic() - started
+    finally:
+        planner.close()
+
+    assert elapsed < 1.5
+    assert results[2] is None
+    assert results[0] and results[1] and results[3]
+
+
+def test_only_failed_sections_fall_back(service: StubService, monkeypatch: pytest.MonkeyPatch) -> None:
+    service.script = {"verse": [(500, 0.0)], "outro": [(200, 3.0)]}
+    planner = make_planner(retries=1, deadline=0.5)
+    monkeypatch.setenv("LYRIC_LLM_ENDPOINT", service.endpoint)
+    monkeypatch.setattr(lyric_planner, "_PLANNER", planner)
+    try:
+        lyrics = plan_lyrics("rock", "C", 120, SECTIONS, seed=7, batch=False)
+    finally:
+        planner.close()
+
+    fallback = _fallback_lyrics("rock", "C", 120, SECTIONS, 7)
+    assert lyrics["intro"] == ["intro line one", "intro line two"]
+    assert lyrics["chorus"] == ["chorus line one", "chorus line two"]
+    assert lyrics["verse"] == fallback["verse"]
+    assert lyrics["outro"] == fallback["outro"]
+
+
+def test_no_endpoint_uses_fallback_for_every_section(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("LYRIC_LLM_ENDPOINT", raising=False)
+    monkeypatch.delenv("NPU_LLM_ENDPOINT", raising=False)
+
+    assert plan_lyrics("rock", "C", 120, SECTIONS, seed=3) == _fallback_lyrics(
+        "rock", "C", 120, SECTIONS, 3
+    )
+
+
+def test_cache_writes_are_batched_off_the_caller(tmp_path) -> None:
+    path = str(tmp_path / "lyrics.json")
+    cache = LyricCache(ttl=60.0, path=path, save_delay=0.2)
+    for index in range(20):
+        cache.put("http://llm/", f"prompt {index}", [f"line {index}"])
+
+    # Nothing is written on the caller's thread; one timed save covers every put.
+    assert not (tmp_path / "lyrics.json").exists()
+    deadline = time.monotonic() + 5.0
+    while not (tmp_path / "lyrics.json").exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert LyricCache(ttl=60.0, path=path).get("http://llm/", "prompt 19") == ["line 19"]
+
+    cache.put("http://llm/", "late", ["late line"])
+    cache.flush()
+    assert LyricCache(ttl=60.0, path=path).get("http://llm/", "late") == ["late line"]